@@ -0,0 +1,70 @@
+"""time particle versus tile collision (EdgeGrid.collide) for different particle and tile counts.
+cost should grow with the amount of particles, not the amount of tiles.
+
+run from the repository root: python -m benchmarks.particle_collision"""
+from time import perf_counter
+import numpy as np
+from game.grid import EdgeGrid
+from game.particle import ParticleArrays
+
+tile_size = 40
+repeats = 50
+
+
+def make_grid(tiles, random):
+    """tiles square 40px tiles at random grid positions, spread over an area that grows with the amount of tiles"""
+    side = int(np.ceil(np.sqrt(tiles * 4)))
+    cells = random.choice(side * side, size=tiles, replace=False)
+    half = tile_size / 2
+    edges = []
+
+    for cell in cells.tolist():
+        x = (cell % side) * tile_size * 1.5
+        y = (cell // side) * tile_size * 1.5
+        corners = [(x - half, y - half), (x - half, y + half), (x + half, y + half), (x + half, y - half)]
+
+        for i in range(4):
+            edges.append(corners[i - 1] + corners[i])
+
+    return EdgeGrid(edges, [None] * len(edges), [None] * len(edges)), side * tile_size * 1.5
+
+
+def make_particles(count, area, random):
+    arrays = ParticleArrays(count)
+    angle = random.uniform(0, 2 * np.pi, count)
+    arrays.spawn(random.uniform(0, area, count), random.uniform(0, area, count), np.cos(angle) * 300,
+                 np.sin(angle) * 300, 0, 1, 10)
+
+    return arrays
+
+
+def time_collide(particles, tiles, seed = 0):
+    """return average seconds for one collide call"""
+    random = np.random.default_rng(seed)
+    grid, area = make_grid(tiles, random)
+    arrays = make_particles(particles, area, random)
+    total = 0
+
+    for _ in range(repeats):
+        old_x = arrays.x[:arrays.count].copy()
+        old_y = arrays.y[:arrays.count].copy()
+        arrays.step(1 / 60, 1)
+
+        start = perf_counter()
+        grid.collide(arrays, old_x, old_y)
+        total += perf_counter() - start
+
+    return total / repeats
+
+
+def main():
+    print("{:>10} {:>8} {:>14} {:>16}".format("particles", "tiles", "us / collide", "ns / particle"))
+
+    for particles in (100, 1000, 10000):
+        for tiles in (100, 1000, 10000):
+            seconds = time_collide(particles, tiles)
+            print("{:>10} {:>8} {:>14.1f} {:>16.1f}".format(particles, tiles, seconds * 1e6, seconds * 1e9 / particles))
+
+
+if __name__ == '__main__':
+    main()
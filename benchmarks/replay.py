@@ -0,0 +1,104 @@
+"""the standard replay workload: scripted input recorded on a small course of tiles (floor, walls, a ramp and a
+ceiling), kept in tests/replays as a regression check of the player's movement (tests/test_replay.py) and played back
+by the benchmark suite.
+
+run from the repository root to make the course and record it again, after a change meant to alter how the player
+moves: python -m benchmarks.replay"""
+import pyglet as pgl
+
+# no display is needed, pyglet mustn't make its hidden shadow window
+pgl.options['shadow_window'] = False
+
+import os
+import numpy as np
+from pyglet.window import key
+from game import level_format, replay
+from game.headless import make_level
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests", "replays")
+level_name = "course"
+recording_file = os.path.join(directory, level_name + ".rpl")
+
+dt = 1 / 60
+# (seconds, keys held), about 10 seconds of flying against the ceiling, tumbling on the floor and over the ramp
+script = [(0.5, ()),
+          (1.0, (key.W,)),
+          (0.4, (key.W, key.D)),
+          (1.0, (key.W,)),
+          (0.8, ()),
+          (0.6, (key.A,)),
+          (1.2, (key.W,)),
+          (0.5, (key.S,)),
+          (1.0, (key.W, key.A)),
+          (1.0, ()),
+          (0.7, (key.D,)),
+          (1.3, (key.W,))]
+
+
+def make_course():
+    """return (tiles, emitters) arrays of the course, square tiles (shape 1) 40px apart"""
+    positions = [(x, 100, 0) for x in range(0, 1601, 40)]
+    positions += [(x, 700, 0) for x in range(0, 1601, 40)]
+    positions += [(x, y, 0) for x in (-40, 1640) for y in range(140, 700, 40)]
+    positions += [(700 + i * 34, 130 + i * 20, 30) for i in range(6)]
+
+    tiles = np.zeros(len(positions), dtype=level_format.tile_dtype)
+    tiles["x"], tiles["y"], tiles["rot"] = zip(*positions)
+    tiles["shape"] = 1
+    tiles["style"] = 1
+
+    return tiles, np.zeros(0, dtype=level_format.emitter_dtype)
+
+
+def make_replay_level():
+    """headless level loading from tests/replays, without the level cache"""
+    level = make_level()
+    level.use_cache = False
+    level.directory = directory
+
+    return level
+
+
+def load():
+    """return the recording and a level with its course loaded, ready for game.replay.run"""
+    recording = replay.Recording.load(recording_file)
+    level = make_replay_level()
+    level.load(recording.level_name)
+
+    return recording, level
+
+
+def record():
+    """write the course to tests/replays and record the script on it there, return the Recording"""
+    tiles, emitters = make_course()
+
+    with open(os.path.join(directory, level_name + ".dat"), "wb") as file:
+        file.write(level_format.encode_v2(level_format.LevelHeader(2, 200, 200, 20), tiles, emitters))
+
+    level = make_replay_level()
+    level.load(level_name)
+    recorder = replay.InputRecorder(level)
+    handler = level.player.key_handler
+
+    for seconds, keys in script:
+        for _ in range(round(seconds / dt)):
+            for symbol in replay.record_keys:
+                handler[symbol] = symbol in keys
+
+            recorder.record(dt)
+            level.update(dt)
+
+    recording = recorder.finish()
+    recording.save(recording_file)
+
+    return recording
+
+
+def main():
+    recording = record()
+    print("{} saved to {}".format(recording, os.path.normpath(recording_file)))
+    print("player state at the end: {}".format(", ".join("{:.2f}".format(value) for value in recording.end_state)))
+
+
+if __name__ == '__main__':
+    main()
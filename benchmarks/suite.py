@@ -0,0 +1,295 @@
+"""benchmarks of the simulation and level file hot paths on synthetic inputs with fixed seeds and on a recorded replay
+(see replay.py), run headless.
+reports time per operation, memory blocks allocated (and not freed) per operation and the peak memory an operation
+allocates on the way (temporaries included), and saves results as json so runs before and after a change can be
+compared.
+
+run from the repository root: python -m benchmarks.suite [--out results.json] [--compare old.json] [--only name]"""
+import pyglet as pgl
+
+# no display is needed, pyglet mustn't make its hidden shadow window
+pgl.options['shadow_window'] = False
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from time import perf_counter
+import numpy as np
+from game import render, replay as game_replay
+from game.grid import SpatialHash
+from game.headless import make_level
+from game.particle import PointEmitter
+from game.player import Player
+from game.rect import Rect
+from game.tile import Tile
+from . import particle_collision, replay
+
+seed = 0
+tile_counts = (100, 1000, 10000)
+particle_counts = (10, 100, 1000)
+
+# level files and the level cache of the level benchmarks go in a temporary directory made by run, deleted after it,
+# so they never show up in the game's levels
+work_directory = None
+
+# tiles are placed on a grid of this spacing, in a square area that grows with the amount of tiles
+tile_spacing = 60
+player_points = [[-5, -15], [-5, 15], [5, 15], [5, -15]]
+tile_points = [[-20, -20], [-20, 20], [20, 20], [20, -20]]
+
+
+def make_tiles(count, random):
+    """count tiles of random shape and rotation on distinct grid cells, all default colour so they can be saved"""
+    side = int(np.ceil(np.sqrt(count * 2)))
+    cells = random.choice(side * side, size=count, replace=False).tolist()
+    shapes = random.integers(1, 4, count).tolist()
+    rotations = random.integers(0, 360, count).tolist()
+
+    return [Tile((100 + (cell % side) * tile_spacing, 100 + (cell // side) * tile_spacing), rot, 1, shape)
+            for cell, shape, rot in zip(cells, shapes, rotations)], side * tile_spacing
+
+
+def random_poses(count, area, random):
+    return list(zip(random.uniform(100, 100 + area, count).tolist(), random.uniform(100, 100 + area, count).tolist(),
+                    random.uniform(0, 360, count).tolist()))
+
+
+def cycle(items):
+    """op that calls each item of items in turn"""
+    state = {"index": 0}
+
+    def op():
+        items[state["index"] % len(items)]()
+        state["index"] += 1
+
+    return op
+
+
+def bench_rect_contacts(size, random):
+    """one Rect.contacts call between a moving rect and a tile, random poses that touch about half the time"""
+    rects = []
+
+    for x, y, rot in random_poses(256, 40, random):
+        rect = Rect((0, 0), player_points)
+        rect.update(x, y, rot)
+        tile = Rect((120, 120), tile_points)
+        rects.append((rect, tile))
+
+    return cycle([lambda pair=pair: pair[0].contacts(pair[1]) for pair in rects])
+
+
+def bench_rect_update(size, random):
+    """one Rect.update to a random pose"""
+    rect = Rect((0, 0), player_points)
+
+    return cycle([lambda pose=pose: rect.update(*pose) for pose in random_poses(256, 500, random)])
+
+
+def bench_player_update(size, random):
+    """one Player.update (with gravity) from a random state among size tiles, using the spatial hash broadphase"""
+    tiles, area = make_tiles(size, random)
+    spatial_hash = SpatialHash()
+
+    for tile in tiles:
+        spatial_hash.add(tile.hitbox)
+
+    player = Player((0, 0))
+    player.set_broadphase(spatial_hash)
+    states = [(x, y, rot, vel_x, vel_y, 0) for (x, y, rot), vel_x, vel_y in
+              zip(random_poses(256, area, random), random.uniform(-300, 300, 256).tolist(),
+                  random.uniform(-300, 300, 256).tolist())]
+
+    def update(state):
+        player.set_state(state)
+        player.accelerate(0, -20)
+        player.update(1 / 60)
+
+    return cycle([lambda state=state: update(state) for state in states])
+
+
+def bench_emitter_update(size, random):
+    """one PointEmitter.update (array backend, quads) with about size particles alive"""
+    emitter = PointEmitter((500, 500), max_particles=size, emit_speed=size * 2, vel=100, vel_rand=50, rot_vel_rand=100,
+                           size_rand=50, lifetime=1, render_mode="quads", seed=seed, batch=render.NullBatch())
+
+    # fill up to the steady amount of particles first
+    for _ in range(120):
+        emitter.update(1 / 60)
+
+    return lambda: emitter.update(1 / 60)
+
+
+def make_work_level():
+    """headless level saving to and loading from the work directory"""
+    level = make_level()
+    level.directory = work_directory
+    level.get_cache().directory = os.path.join(work_directory, "cache")
+
+    return level
+
+
+def bench_level_save(size, random):
+    """one Level.save of a level with size tiles"""
+    level = make_work_level()
+    tiles, _ = make_tiles(size, random)
+    level.set_data({"tiles": tiles, "particles": [], "titles": [], "start_pos": None, "gravity": 20})
+    name = "_benchmark_{}".format(size)
+
+    return lambda: level.save(name, override=True)
+
+
+def bench_level_load(size, random, use_cache = False):
+    """one Level.load (and unload) of a level with size tiles, decoded from the file"""
+    bench_level_save(size, random)()
+    level = make_work_level()
+    level.use_cache = use_cache
+    name = "_benchmark_{}".format(size)
+
+    def load():
+        level.load(name)
+        level.unload()
+
+    return load
+
+
+def bench_level_load_cached(size, random):
+    """one Level.load (and unload) of a level with size tiles, from the level cache"""
+    return bench_level_load(size, random, use_cache=True)
+
+
+def bench_particle_collision(size, random):
+    """one EdgeGrid.collide of 1000 particles against size tiles, see particle_collision.py"""
+    grid, area = particle_collision.make_grid(size, random)
+    arrays = particle_collision.make_particles(1000, area, random)
+
+    def collide():
+        old_x = arrays.x[:arrays.count].copy()
+        old_y = arrays.y[:arrays.count].copy()
+        arrays.step(1 / 60, 1)
+        grid.collide(arrays, old_x, old_y)
+
+    return collide
+
+
+def bench_replay(size, random):
+    """one playback of the recorded replay on its course (600 ticks with the level's particles), see replay.py"""
+    recording, level = replay.load()
+
+    return lambda: game_replay.run(recording, level)
+
+
+# name, benchmark, sizes
+benchmarks = [("rect_contacts", bench_rect_contacts, (1,)),
+              ("rect_update", bench_rect_update, (1,)),
+              ("player_update", bench_player_update, tile_counts),
+              ("emitter_update", bench_emitter_update, particle_counts),
+              ("level_save", bench_level_save, tile_counts),
+              ("level_load", bench_level_load, tile_counts),
+              ("level_load_cached", bench_level_load_cached, tile_counts),
+              ("particle_collision", bench_particle_collision, tile_counts),
+              ("replay", bench_replay, (1,))]
+
+
+def measure(op, min_time = 0.2, min_ops = 3, alloc_ops = 50):
+    """return (ns per op, allocated blocks per op, allocated bytes per op, peak bytes per op).
+    allocations are measured in a separate run, as tracing slows everything down. blocks and bytes only count memory
+    still held after the ops (what an op leaves behind or caches), peak bytes is the most memory an op had allocated
+    at once on top of what was held when it started (temporaries, freed again by the end), averaged over the ops"""
+    op()
+    ops = 0
+    start = perf_counter()
+
+    while True:
+        op()
+        ops += 1
+        elapsed = perf_counter() - start
+
+        if elapsed >= min_time and ops >= min_ops:
+            break
+
+    alloc_ops = min(alloc_ops, ops)
+    tracemalloc.start()
+    # objects an op replaces were made before tracing started, one traced op first so they aren't counted as new
+    op()
+    before = tracemalloc.take_snapshot()
+    peak = 0
+
+    for _ in range(alloc_ops):
+        tracemalloc.reset_peak()
+        held = tracemalloc.get_traced_memory()[0]
+        op()
+        peak += tracemalloc.get_traced_memory()[1] - held
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+
+    return elapsed * 1e9 / ops, blocks / alloc_ops, size / alloc_ops, peak / alloc_ops
+
+
+def run(only = None):
+    global work_directory
+    results = []
+    work_directory = tempfile.mkdtemp(prefix="benchmark_")
+
+    try:
+        for name, benchmark, sizes in benchmarks:
+            if only is not None and name not in only:
+                continue
+
+            for size in sizes:
+                op = benchmark(size, np.random.default_rng(seed))
+                ns, blocks, size_bytes, peak_bytes = measure(op)
+                results.append({"name": name, "size": size, "ns_per_op": ns, "allocs_per_op": blocks,
+                                "bytes_per_op": size_bytes, "peak_bytes_per_op": peak_bytes})
+                print_result(results[-1])
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+        work_directory = None
+
+    return results
+
+
+def print_result(result, old = None):
+    line = "{:<20} {:>6} {:>14.0f} ns/op {:>10.1f} allocs/op {:>12.0f} bytes/op {:>12.0f} peak bytes/op".format(
+        result["name"], result["size"], result["ns_per_op"], result["allocs_per_op"], result["bytes_per_op"],
+        result["peak_bytes_per_op"])
+
+    if old is not None:
+        line += " {:>7.2f}x".format(old["ns_per_op"] / result["ns_per_op"])
+
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark simulation and level file hot paths")
+    parser.add_argument("--out", default="benchmark_results.json", help="json file to save results in")
+    parser.add_argument("--compare", help="json file of an earlier run, prints the speedup of each benchmark")
+    parser.add_argument("--only", nargs="+", help="names of benchmarks to run")
+    args = parser.parse_args()
+
+    render.set_headless(True)
+    results = run(args.only)
+
+    with open(args.out, "w") as file:
+        json.dump({"seed": seed, "results": results}, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            old = {(result["name"], result["size"]): result for result in json.load(file)["results"]}
+
+        print("\ncompared to {}:".format(args.compare))
+
+        for result in results:
+            print_result(result, old.get((result["name"], result["size"])))
+
+
+if __name__ == '__main__':
+    main()
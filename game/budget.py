@@ -0,0 +1,51 @@
+from collections import deque
+
+
+class ParticleBudget:
+    def __init__(self, max_particles = 2000, frame_time = 1 / 60, tolerance = 0.1, samples = 30, min_scale = 0.1, scale_down = 0.9, scale_up = 1.02):
+        """level wide limit on particles. frame_time is the target time between updates in seconds,
+        if recent frames take longer than that (or too many particles are alive) emission is scaled down,
+        and scaled back up when there is headroom again"""
+        self.max_particles = max_particles
+        self.frame_time = frame_time
+        self.tolerance = tolerance
+        self.min_scale = min_scale
+        self.scale_down = scale_down
+        self.scale_up = scale_up
+
+        self.scale = 1
+        self.live_particles = 0
+
+        self._frame_times = deque(maxlen=samples)
+        self._emitters = []
+
+    def __str__(self):
+        return "ParticleBudget ({} / {} particles), scale = {:.2f}".format(self.live_particles, self.max_particles, self.scale)
+
+    def update(self, dt, emitters):
+        """record frame time, adjust scale and pass it on to every emitter"""
+        self._frame_times.append(dt)
+        self._emitters = emitters
+
+        self.live_particles = sum(emitter.get_particle_count() for emitter in emitters)
+        average = sum(self._frame_times) / len(self._frame_times)
+
+        if average > self.frame_time * (1 + self.tolerance) or self.live_particles > self.max_particles:
+            self.scale = max(self.min_scale, self.scale * self.scale_down)
+
+        elif average < self.frame_time * (1 + self.tolerance / 2) and self.live_particles < self.max_particles * 0.8:
+            self.scale = min(1, self.scale * self.scale_up)
+
+        for emitter in emitters:
+            emitter.set_quality(self.emitter_scale(emitter.priority))
+
+    def emitter_scale(self, priority):
+        """scale for an emitter of given priority, higher priority emitters are cut less"""
+        return self.scale ** (1 / priority)
+
+    def get_scale(self):
+        return "{:.2f}".format(self.scale)
+
+    def get_cut_counts(self):
+        """return amount of particles not emitted because of the budget, for each emitter"""
+        return ", ".join(str(emitter.get_cut_count()) for emitter in self._emitters)
@@ -0,0 +1,97 @@
+from math import pi
+
+
+class ContactCache:
+    def __init__(self, touching = 1):
+        """remembers separation results of one moving rect against static rects between updates, so pairs that can't
+        have changed since the last full test are answered without running it again. pairs closer than touching (or
+        overlapping) are counted apart, they are the surfaces the rect rests on or slides along"""
+        self.touching = touching
+        self._entries = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.touching_hits = 0
+        self.touching_misses = 0
+
+    def __str__(self):
+        return "ContactCache ({} pairs), hits = {}, misses = {}, touching hits = {}, touching misses = {}".format(
+            len(self._entries), self.hits, self.misses, self.touching_hits, self.touching_misses)
+
+    def separations(self, rect, others):
+        """same result as rect.separation on each of others, list of (other, (depth, normal x, normal y)) for every
+        other rect overlapping"""
+        results = []
+        entries = {}
+
+        for other in others:
+            entry = self._entries.get(id(other))
+
+            if entry is not None and self.__still_valid__(rect, entry):
+                self.__count__(entry[4], True)
+                entries[id(other)] = entry
+                continue
+
+            separation = rect.separation(other)
+
+            if separation is not None:
+                self.__count__(0, False)
+                results.append((other, separation))
+                continue
+
+            # apart, remember the axis they are apart along and how far
+            gap, normal_x, normal_y = rect.separating_axis(other)
+            self.__count__(gap, False)
+
+            if gap > 0:
+                entries[id(other)] = (other, rect.x, rect.y, rect.rot, gap, normal_x, normal_y)
+
+        # pairs that weren't asked about this time are forgotten
+        self._entries = entries
+
+        return results
+
+    def __count__(self, gap, hit):
+        if gap < self.touching:
+            if hit:
+                self.touching_hits += 1
+            else:
+                self.touching_misses += 1
+
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    @staticmethod
+    def __rate__(hits, misses):
+        total = hits + misses
+
+        if total == 0:
+            return "0 / 0"
+
+        return "{} / {} ({:.0f}%)".format(hits, total, 100 * hits / total)
+
+    def get_hit_rate(self):
+        return self.__rate__(self.hits, self.misses)
+
+    def get_touching_hit_rate(self):
+        """hit rate of pairs closer than touching"""
+        return self.__rate__(self.touching_hits, self.touching_misses)
+
+    def clear(self):
+        self._entries = {}
+
+    @staticmethod
+    def __still_valid__(rect, entry):
+        """the pair is still apart if no corner of rect has moved as far towards the other rect as the gap along the
+        axis they were apart along"""
+        _, x, y, rot, gap, normal_x, normal_y = entry
+
+        if rect.x == x and rect.y == y and rect.rot == rot:
+            return True
+
+        towards = -((rect.x - x) * normal_x + (rect.y - y) * normal_y)
+        turned = abs(rect.rot - rot) * pi / 180 * rect.get_radius()
+
+        return towards + turned < gap
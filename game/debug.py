@@ -1,4 +1,4 @@
-import pyglet as pgl
+from . import render
 
 
 class DebugItem:
@@ -27,7 +27,7 @@ class Debug:
         self._batch = batch
         self._group = group
 
-        pgl.gl.glLineWidth(3)
+        render.line_width(3)
 
     def update(self):
         """update dynamic variable values"""
@@ -168,15 +168,23 @@ class Debug:
 
     def delete_all(self):
         """delete all groups"""
-        for group_name in self._groups.keys():
+        for group_name in list(self._groups.keys()):
             self.delete_group(group_name)
 
     def dynamic_variable(self, name, getter_func, pos, size=30, anchor_x='center', anchor_y='center'):
         """create a text display for a changing variable, or list of variables to add together"""
         self._dynamic_variables[name] = getter_func
-        self._titles[name] = pgl.text.Label(text = "", x = pos[0], y = pos[1], font_size = size, font_name = 'Ubuntu',
-                                            batch = self._batch, group = self._group, anchor_x = anchor_x,
-                                            anchor_y = anchor_y)
+        self._titles[name] = render.label(text = "", x = pos[0], y = pos[1], font_size = size, font_name = 'Ubuntu',
+                                          batch = self._batch, group = self._group, anchor_x = anchor_x,
+                                          anchor_y = anchor_y)
+
+    def delete_dynamic_variables(self):
+        """remove every dynamic variable and its text display"""
+        for title in self._titles.values():
+            title.delete()
+
+        self._titles = {}
+        self._dynamic_variables = {}
 
     def enable_dynamic_variables(self):
         self._show_dynamic_variables = True
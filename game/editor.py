@@ -8,7 +8,8 @@ from .particle import PointEmitter
 class Editor:
     def __init__(self, current_version, supported_levels, window, batch, level=None):
         if level is None:
-            self._level = Level(current_version, supported_levels, window, batch)
+            # the editor always works on what is in the file
+            self._level = Level(current_version, supported_levels, window, batch, use_cache=False)
 
         self._data = self._level.get_data()
         self._batch = batch
@@ -94,7 +95,7 @@ class Editor:
             if self._current_object["params"]["outline_colour"] is not None:
                 tile.set_outline_colour(self._current_object["params"]["outline_colour"])
 
-            self._data["tiles"].append(tile)
+            self._level.add_tile(tile)
 
         elif self._current_object["type"] == "PointEmitter":
             particle = PointEmitter(x, y)
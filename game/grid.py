@@ -0,0 +1,476 @@
+import numpy as np
+from .rect import ray_hits
+
+
+def bounce(arrays, old_x, old_y, hits, restitution):
+    """stop particles (ParticleArrays) at the edges they crossed since old_x, old_y and bounce them off them,
+    hits is (time, normal x, normal y) of the first edge each crossed, see EdgeGrid.first_hits"""
+    time, normal_x, normal_y = hits
+    hit = np.flatnonzero(np.isfinite(time))
+
+    if len(hit) == 0:
+        return
+
+    t = time[hit]
+    normal_x = normal_x[hit]
+    normal_y = normal_y[hit]
+    x0 = old_x[hit]
+    y0 = old_y[hit]
+
+    # move to just in front of the edge
+    arrays.x[hit] = x0 + (arrays.x[hit] - x0) * t + normal_x * 0.01
+    arrays.y[hit] = y0 + (arrays.y[hit] - y0) * t + normal_y * 0.01
+
+    vel_x = arrays.vel_x[hit]
+    vel_y = arrays.vel_y[hit]
+    into = np.minimum(vel_x * normal_x + vel_y * normal_y, 0)
+    arrays.vel_x[hit] = vel_x - (1 + restitution) * into * normal_x
+    arrays.vel_y[hit] = vel_y - (1 + restitution) * into * normal_y
+
+
+class EdgeGrid:
+    def __init__(self, edges, owners, sides, cell_size = 64, cells = None):
+        """uniform grid of static line segments, for querying many points / moves at once.
+        edges is a list of (ax, ay, bx, by), owners the tile each edge belongs to and sides the index of each edge
+        among its tile's hitbox sides (see get_edge).
+        cells is get_cells of a grid of the same edges (e.g. from a level cache), it is used instead of building"""
+        self.cell_size = cell_size
+        self.edges = np.array(edges, dtype=np.float64).reshape(-1, 4)
+        self.owners = owners
+        self.sides = sides
+
+        self._origin_x = 0
+        self._origin_y = 0
+        self._columns = 0
+        self._rows = 0
+        # one row per cell, holding the edge indices in that cell, padded with -1
+        self._cells = np.full((0, 1), -1, dtype=np.int64)
+
+        if cells is not None:
+            self._origin_x, self._origin_y, self._columns, self._rows, self._cells = cells
+        elif len(self.edges) > 0:
+            self.__build__()
+
+    def __str__(self):
+        return "EdgeGrid ({} edges, {} x {} cells of {})".format(len(self.edges), self._columns, self._rows, self.cell_size)
+
+    @classmethod
+    def from_tiles(cls, tiles, cell_size = 64, cells = None):
+        """build grid from the baked hitboxes of tiles, see __init__ for cells"""
+        return cls(*cls.__tile_edges__(tiles), cell_size, cells)
+
+    @staticmethod
+    def __tile_edges__(tiles):
+        """return (edges, owners, sides) of the baked hitboxes of tiles, see __init__"""
+        if not tiles:
+            return np.zeros((0, 4)), [], np.zeros(0, dtype=np.int64)
+
+        counts = [len(tile.baked.corners) for tile in tiles]
+        edges = np.hstack((np.concatenate([tile.baked.side_starts for tile in tiles]),
+                           np.concatenate([tile.baked.corners for tile in tiles])))
+        owners = [tile for tile, count in zip(tiles, counts) for _ in range(count)]
+        sides = np.arange(len(edges)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        return edges, owners, sides
+
+    def add_tiles(self, tiles):
+        """add the edges of tiles' baked hitboxes to only the cells they are in, the grid grows if they are outside it"""
+        edges, owners, sides = self.__tile_edges__(tiles)
+
+        if len(edges) == 0:
+            return
+
+        first = len(self.edges)
+        self.edges = np.concatenate((self.edges, edges))
+        self.owners = list(self.owners) + owners
+        self.sides = np.concatenate((np.asarray(self.sides, dtype=np.int64), sides))
+
+        size = self.cell_size
+        min_x = np.minimum(edges[:, 0], edges[:, 2])
+        max_x = np.maximum(edges[:, 0], edges[:, 2])
+        min_y = np.minimum(edges[:, 1], edges[:, 3])
+        max_y = np.maximum(edges[:, 1], edges[:, 3])
+        self.__grow__(min_x.min(), min_y.min(), max_x.max(), max_y.max())
+
+        # cells from a level cache are read only views of the file
+        if not self._cells.flags.writeable:
+            self._cells = self._cells.copy()
+
+        first_column = ((min_x - self._origin_x) // size).astype(np.int64).tolist()
+        last_column = ((max_x - self._origin_x) // size).astype(np.int64).tolist()
+        first_row = ((min_y - self._origin_y) // size).astype(np.int64).tolist()
+        last_row = ((max_y - self._origin_y) // size).astype(np.int64).tolist()
+
+        for i in range(len(edges)):
+            for row in range(first_row[i], last_row[i] + 1):
+                for column in range(first_column[i], last_column[i] + 1):
+                    cell = row * self._columns + column
+                    free = np.flatnonzero(self._cells[cell] < 0)
+
+                    if len(free) == 0:
+                        # every cell gets twice the room
+                        width = self._cells.shape[1]
+                        self._cells = np.hstack((self._cells, np.full((len(self._cells), width), -1, dtype=np.int64)))
+                        free = [width]
+
+                    self._cells[cell, free[0]] = first + i
+
+    def __grow__(self, min_x, min_y, max_x, max_y):
+        """add columns and rows so the box (min x, min y, max x, max y) is inside the grid, cells keep their edges"""
+        size = self.cell_size
+
+        if self._columns == 0 or self._rows == 0:
+            self._origin_x = np.floor(min_x / size) * size
+            self._origin_y = np.floor(min_y / size) * size
+            self._columns = int((max_x - self._origin_x) // size) + 1
+            self._rows = int((max_y - self._origin_y) // size) + 1
+            self._cells = np.full((self._columns * self._rows, 1), -1, dtype=np.int64)
+            return
+
+        origin_x = min(self._origin_x, np.floor(min_x / size) * size)
+        origin_y = min(self._origin_y, np.floor(min_y / size) * size)
+        # columns / rows added before the old first one
+        column_shift = int(round((self._origin_x - origin_x) / size))
+        row_shift = int(round((self._origin_y - origin_y) / size))
+        columns = max(self._columns + column_shift, int((max_x - origin_x) // size) + 1)
+        rows = max(self._rows + row_shift, int((max_y - origin_y) // size) + 1)
+
+        if (columns, rows) == (self._columns, self._rows):
+            return
+
+        width = self._cells.shape[1]
+        cells = np.full((rows, columns, width), -1, dtype=np.int64)
+        cells[row_shift:row_shift + self._rows, column_shift:column_shift + self._columns] = \
+            self._cells.reshape(self._rows, self._columns, width)
+
+        self._origin_x = origin_x
+        self._origin_y = origin_y
+        self._columns = columns
+        self._rows = rows
+        self._cells = cells.reshape(-1, width)
+
+    def get_edge(self, edge):
+        """return (tile, side (Line)) of an edge index"""
+        owner = self.owners[edge]
+
+        return owner, owner.hitbox.get_sides()[self.sides[edge]]
+
+    def get_cells(self):
+        """return (origin x, origin y, columns, rows, cells), cells has one row of edge indices per cell padded with -1"""
+        return self._origin_x, self._origin_y, self._columns, self._rows, self._cells
+
+    def get_bounds(self):
+        """return (min x, min y, max x, max y) of the area covered by cells, every edge is inside it"""
+        return (self._origin_x, self._origin_y, self._origin_x + self._columns * self.cell_size,
+                self._origin_y + self._rows * self.cell_size)
+
+    def __build__(self):
+        """put every edge in each cell its bounding box overlaps"""
+        size = self.cell_size
+        min_x = np.minimum(self.edges[:, 0], self.edges[:, 2])
+        max_x = np.maximum(self.edges[:, 0], self.edges[:, 2])
+        min_y = np.minimum(self.edges[:, 1], self.edges[:, 3])
+        max_y = np.maximum(self.edges[:, 1], self.edges[:, 3])
+
+        self._origin_x = np.floor(min_x.min() / size) * size
+        self._origin_y = np.floor(min_y.min() / size) * size
+        self._columns = int((max_x.max() - self._origin_x) // size) + 1
+        self._rows = int((max_y.max() - self._origin_y) // size) + 1
+
+        first_column = ((min_x - self._origin_x) // size).astype(np.int64).tolist()
+        last_column = ((max_x - self._origin_x) // size).astype(np.int64).tolist()
+        first_row = ((min_y - self._origin_y) // size).astype(np.int64).tolist()
+        last_row = ((max_y - self._origin_y) // size).astype(np.int64).tolist()
+
+        cells = [[] for _ in range(self._columns * self._rows)]
+
+        for edge in range(len(self.edges)):
+            for row in range(first_row[edge], last_row[edge] + 1):
+                for column in range(first_column[edge], last_column[edge] + 1):
+                    cells[row * self._columns + column].append(edge)
+
+        width = max(len(cell) for cell in cells)
+        self._cells = np.full((len(cells), width), -1, dtype=np.int64)
+
+        for i, cell in enumerate(cells):
+            self._cells[i, :len(cell)] = cell
+
+    def cell_index(self, x, y):
+        """index of the cell each point (arrays x, y) is in, -1 if outside the grid"""
+        column = np.floor((np.asarray(x) - self._origin_x) / self.cell_size).astype(np.int64)
+        row = np.floor((np.asarray(y) - self._origin_y) / self.cell_size).astype(np.int64)
+        inside = (column >= 0) & (column < self._columns) & (row >= 0) & (row < self._rows)
+
+        return np.where(inside, row * self._columns + column, -1)
+
+    def candidates(self, x, y):
+        """edge indices in the cell of each point, one padded row per point (-1 = no edge)"""
+        cell = self.cell_index(x, y)
+        rows = self._cells[np.maximum(cell, 0)]
+        rows[cell < 0] = -1
+
+        return rows
+
+    def collide(self, arrays, old_x, old_y, restitution = 0.5):
+        """stop particles (ParticleArrays) that crossed an edge since old_x, old_y at the edge, and bounce them off it.
+        restitution scales the velocity away from the edge, velocity along it is kept so particles slide"""
+        n = arrays.count
+        bounce(arrays, old_x, old_y, self.first_hits(old_x[:n], old_y[:n], arrays.x[:n], arrays.y[:n]), restitution)
+
+    def first_hits(self, old_x, old_y, x, y):
+        """return (time, normal x, normal y) arrays of the first edge each move from old_x, old_y to x, y crosses,
+        time as a fraction (0 - 1) of the move (inf if it crosses none) and the edge's unit normal facing against it"""
+        n = len(x)
+        time = np.full(n, np.inf)
+        normal_x = np.zeros(n)
+        normal_y = np.zeros(n)
+
+        if n == 0 or len(self.edges) == 0:
+            return time, normal_x, normal_y
+
+        move_x = x - old_x
+        move_y = y - old_y
+        length = np.hypot(move_x, move_y)
+
+        # every cell the move passes through is walked (see raycast), so a fast move can't skip an edge in between
+        distance, found = self.raycast(np.column_stack((old_x, old_y)), np.column_stack((move_x, move_y)), length)
+        hit = np.flatnonzero(found >= 0)
+
+        if len(hit) == 0:
+            return time, normal_x, normal_y
+
+        time[hit] = distance[hit] / length[hit]
+        edges = self.edges[found[hit]]
+
+        # unit normal of the hit edge, facing against the move
+        hit_x = edges[:, 1] - edges[:, 3]
+        hit_y = edges[:, 2] - edges[:, 0]
+        edge_length = np.hypot(hit_x, hit_y)
+        hit_x /= edge_length
+        hit_y /= edge_length
+        flip = (hit_x * move_x[hit] + hit_y * move_y[hit]) > 0
+        hit_x[flip] *= -1
+        hit_y[flip] *= -1
+        normal_x[hit] = hit_x
+        normal_y[hit] = hit_y
+
+        return time, normal_x, normal_y
+
+    def raycast(self, origins, directions, max_dists):
+        """first edge hit by each ray, origins and directions are (n, 2) arrays, max_dists (n,).
+        walks the cells along all rays at once (DDA) and only tests edges in the cells visited,
+        returns (distance, edge index) arrays with inf and -1 for rays that hit nothing"""
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 2)
+        n = len(origins)
+        max_dists = np.broadcast_to(np.asarray(max_dists, dtype=np.float64), (n,))
+
+        distance = np.full(n, np.inf)
+        found = np.full(n, -1, dtype=np.int64)
+
+        if n == 0 or len(self.edges) == 0:
+            return distance, found
+
+        length = np.hypot(directions[:, 0], directions[:, 1])
+        directions = directions / np.where(length > 0, length, 1)[:, None]
+        move = directions * max_dists[:, None]
+
+        size = self.cell_size
+        low = np.array([self._origin_x, self._origin_y])
+        high = low + (self._columns * size, self._rows * size)
+
+        # clip each ray to the grid (slab test), rays that miss it are never walked
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse = 1 / directions
+            near = (low - origins) * inverse
+            far = (high - origins) * inverse
+
+        near = np.where(directions == 0, np.where((origins >= low) & (origins < high), -np.inf, np.inf), near)
+        far = np.where(directions == 0, np.where((origins >= low) & (origins < high), np.inf, -np.inf), far)
+        enter = np.maximum(np.max(np.minimum(near, far), axis=1), 0)
+        leave = np.min(np.maximum(near, far), axis=1)
+        active = (length > 0) & (enter <= leave) & (enter <= max_dists)
+
+        # cell each ray starts in, and distance along the ray to the next column / row boundary
+        start = (origins + directions * enter[:, None] - low) / size
+        cell = np.clip(np.floor(start).astype(np.int64), 0, (self._columns - 1, self._rows - 1))
+        step = np.sign(directions).astype(np.int64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            boundary = low + (cell + (step > 0)) * size
+            next_boundary = np.where(step != 0, (boundary - origins) * inverse, np.inf)
+            cell_distance = np.where(step != 0, size * np.abs(inverse), np.inf)
+
+        while active.any():
+            rays = np.flatnonzero(active)
+            candidates = self._cells[cell[rays, 1] * self._columns + cell[rays, 0]]
+            edges = self.edges[np.maximum(candidates, 0)]
+
+            t = np.where(candidates >= 0, ray_hits(origins[rays, None], move[rays, None],
+                                                  edges[..., :2], edges[..., 2:]), np.inf)
+            first = np.argmin(t, axis=1)
+            t = t[np.arange(len(rays)), first] * max_dists[rays]
+            exit_distance = np.min(next_boundary[rays], axis=1)
+
+            # only hits inside the current cell count, ones further along are found in a later cell
+            hit = np.isfinite(t) & (t <= exit_distance)
+            distance[rays[hit]] = t[hit]
+            found[rays[hit]] = candidates[hit, first[hit]]
+
+            # step the rest into the neighbouring cell across the nearest boundary
+            axis = np.argmin(next_boundary[rays], axis=1)
+            cell[rays, axis] += step[rays, axis]
+            next_boundary[rays, axis] += cell_distance[rays, axis]
+
+            inside = (cell[rays, 0] >= 0) & (cell[rays, 0] < self._columns) & (cell[rays, 1] >= 0) & \
+                     (cell[rays, 1] < self._rows)
+            active[rays] = ~hit & inside & (exit_distance <= max_dists[rays])
+
+        return distance, found
+
+
+class EdgeGridSet:
+    def __init__(self):
+        """EdgeGrids of separate parts of a level (e.g. the chunks of a streamed level) queried like one EdgeGrid,
+        so a part is added or removed without rebuilding the grids of the others"""
+        self._grids = {}
+        # (first edge index, grid) of each grid in the last raycast
+        self._offsets = []
+
+    def __str__(self):
+        return "EdgeGridSet ({} grids, {} edges)".format(len(self._grids), sum(len(grid.edges) for grid in
+                                                                              self._grids.values()))
+
+    def __len__(self):
+        return len(self._grids)
+
+    def add(self, key, grid):
+        self._grids[key] = grid
+
+    def get(self, key):
+        """return the grid added under key, or None"""
+        return self._grids.get(key)
+
+    def remove(self, key):
+        self._grids.pop(key, None)
+
+    def collide(self, arrays, old_x, old_y, restitution = 0.5):
+        """see EdgeGrid.collide, only grids the particles' moves could reach are tested, and each particle only
+        bounces off the first edge it crossed in any of them"""
+        n = arrays.count
+
+        if n == 0:
+            return
+
+        x0 = old_x[:n]
+        y0 = old_y[:n]
+        x = arrays.x[:n]
+        y = arrays.y[:n]
+        min_x = min(float(x0.min()), float(x.min()))
+        min_y = min(float(y0.min()), float(y.min()))
+        max_x = max(float(x0.max()), float(x.max()))
+        max_y = max(float(y0.max()), float(y.max()))
+        first = None
+
+        for grid in self._grids.values():
+            grid_min_x, grid_min_y, grid_max_x, grid_max_y = grid.get_bounds()
+
+            if max_x < grid_min_x or min_x > grid_max_x or max_y < grid_min_y or min_y > grid_max_y:
+                continue
+
+            hits = grid.first_hits(x0, y0, x, y)
+
+            if first is None:
+                first = hits
+            else:
+                closer = hits[0] < first[0]
+
+                for best, found in zip(first, hits):
+                    best[closer] = found[closer]
+
+        if first is not None:
+            bounce(arrays, old_x, old_y, first, restitution)
+
+    def raycast(self, origins, directions, max_dists):
+        """see EdgeGrid.raycast, edge indices are only valid for get_edge until a grid is added or removed"""
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        distance = np.full(len(origins), np.inf)
+        found = np.full(len(origins), -1, dtype=np.int64)
+        offset = 0
+        self._offsets = []
+
+        for grid in self._grids.values():
+            grid_distance, grid_found = grid.raycast(origins, directions, max_dists)
+            closer = grid_distance < distance
+            distance[closer] = grid_distance[closer]
+            found[closer] = grid_found[closer] + offset
+
+            self._offsets.append((offset, grid))
+            offset += len(grid.edges)
+
+        return distance, found
+
+    def get_edge(self, edge):
+        """return (tile, side (Line)) of an edge index from the last raycast"""
+        for offset, grid in reversed(self._offsets):
+            if edge >= offset:
+                return grid.get_edge(edge - offset)
+
+        raise ValueError("Edge {} is not in the set!".format(edge))
+
+
+class SpatialHash:
+    def __init__(self, cell_size = 64):
+        """rects (tile hitboxes) stored in each cell of a uniform grid their bounding box overlaps,
+        so only rects near an area have to be checked"""
+        self.cell_size = cell_size
+        self._cells = {}
+
+    def __str__(self):
+        return "SpatialHash ({} cells of {})".format(len(self._cells), self.cell_size)
+
+    def __cell_range__(self, min_x, min_y, max_x, max_y):
+        """all (column, row) cells overlapping a bounding box"""
+        size = self.cell_size
+
+        for column in range(int(min_x // size), int(max_x // size) + 1):
+            for row in range(int(min_y // size), int(max_y // size) + 1):
+                yield column, row
+
+    def add(self, rect, cells = None):
+        """cells are the (column, row) cells rect overlaps if they are known already (e.g. from a level cache)"""
+        if cells is None:
+            sides = rect.checkbox_sides
+            cells = self.__cell_range__(sides["min_x"], sides["min_y"], sides["max_x"], sides["max_y"])
+
+        for cell in cells:
+            self._cells.setdefault(cell, []).append(rect)
+
+    def remove(self, rect):
+        sides = rect.checkbox_sides
+
+        for cell in self.__cell_range__(sides["min_x"], sides["min_y"], sides["max_x"], sides["max_y"]):
+            items = self._cells.get(cell)
+
+            if items is not None and rect in items:
+                items.remove(rect)
+
+                if not items:
+                    del self._cells[cell]
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """return every rect in the cells overlapping a bounding box, each once"""
+        found = {}
+
+        for cell in self.__cell_range__(min_x, min_y, max_x, max_y):
+            for rect in self._cells.get(cell, ()):
+                found[id(rect)] = rect
+
+        return list(found.values())
+
+    def get_cells(self):
+        """return {(column, row): list of rects in that cell}"""
+        return self._cells
+
+    def clear(self):
+        self._cells = {}
@@ -0,0 +1,76 @@
+"""run a level without a display as fast as possible, e.g. for benchmarks and bulk tests on build servers.
+
+run from the repository root: python -m game.headless test4 --ticks 6000"""
+import pyglet as pgl
+
+# no window will be made, pyglet mustn't make its hidden shadow window either (needs a display)
+pgl.options['shadow_window'] = False
+
+import argparse
+from time import perf_counter
+from . import render
+from .level import Level
+from .version import get_version
+
+
+def make_level(window_size = (1920, 1080)):
+    """empty level drawing nothing, with a window of window_size for screen wrapping"""
+    render.set_headless(True)
+    current, supported = get_version()
+
+    return Level(current, supported, render.NullWindow(*window_size), render.NullBatch())
+
+
+def run(filename, ticks, dt = 1 / 60, level = None, stream = False):
+    """load level filename (in levels/, without .dat) and update it ticks times by dt, return a report of the final state.
+    if stream, the level is streamed in chunks around the player (see Level.load)"""
+    if level is None:
+        level = make_level()
+
+    level.load(filename, stream)
+
+    start = perf_counter()
+
+    for _ in range(ticks):
+        level.update(dt)
+
+    seconds = perf_counter() - start
+    player = level.player
+
+    return {"level": filename,
+            "ticks": ticks,
+            "dt": dt,
+            "seconds": seconds,
+            "ticks_per_second": ticks / seconds if seconds > 0 else float("inf"),
+            "player": {"x": player.x, "y": player.y, "rot": player.rot,
+                       "vel_x": player.vel_x, "vel_y": player.vel_y, "vel_rot": player.vel_rot},
+            "particles": sum(emitter.get_particle_count() for emitter in level.get_data()["particles"]),
+            "chunks": level.get_chunk_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="simulate a level without a display")
+    parser.add_argument("level", help="level name in levels/, without .dat")
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--dt", type=float, default=1 / 60)
+    parser.add_argument("--stream", action="store_true", help="stream the level in chunks around the player")
+    parser.add_argument("--no-cache", action="store_true", help="load the level from its file, not the level cache")
+    args = parser.parse_args()
+
+    level = make_level()
+    level.use_cache = not args.no_cache
+    report = run(args.level, args.ticks, args.dt, level, args.stream)
+    player = report["player"]
+
+    print("{} ticks of {:.4f}s in {:.3f}s ({:.0f} ticks / s)".format(report["ticks"], report["dt"], report["seconds"],
+                                                                       report["ticks_per_second"]))
+    print("player x: {:.2f}, y: {:.2f}, rotation: {:.1f}".format(player["x"], player["y"], player["rot"]))
+    print("player velocity x: {:.2f}, y: {:.2f}, rotation: {:.2f}".format(player["vel_x"], player["vel_y"], player["vel_rot"]))
+    print("particles alive: {}".format(report["particles"]))
+
+    if args.stream:
+        print("chunks loaded: {} / {}".format(*report["chunks"]))
+
+
+if __name__ == '__main__':
+    main()
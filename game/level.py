@@ -1,27 +1,28 @@
 import os.path
+import mmap
 import pyglet as pgl
 from .player import Player
 from .debug import Debug
-from .tile import Tile
+from .tile import Tile, bake_many
 from .particle import PointEmitter
+from .budget import ParticleBudget
+from .particle_worker import ParticleWorker
+from .grid import EdgeGrid, EdgeGridSet, SpatialHash
+from .level_cache import LevelCache
+from .loader import LevelLoader
+from .streaming import ChunkIndex
+from .timestep import base_rate
+from . import level_cache, level_format, render
 
 
-def to_bin(num):
-    """convert a number to a list of 2 8 bit binary numbers"""
-    if num > 65535:
-        raise ValueError("Number out of range! ({} > 65536)".format(num))
+# key of the grid of tiles added to a streamed level (see add_tile) in its EdgeGridSet, chunks are keyed by index
+added_tiles = "added"
 
-    else:
-        return [num // 255, num % 255]
 
-
-def from_bin(byte_a, byte_b):
-    """convert 2 bytes into a single number"""
-    return (255 * byte_a) + byte_b
-
-
-class Level:
-    def __init__(self, current_version, supported_levels, window, batch):
+class Level(pgl.event.EventDispatcher):
+    def __init__(self, current_version, supported_levels, window, batch, use_cache = True):
+        """use_cache loads levels loaded before from the level cache (see level_cache.py), the editor bypasses it so
+        it always works on what is in the file"""
         self._current_version = current_version
         self._supported_levels = supported_levels
 
@@ -38,94 +39,364 @@ class Level:
         self._window = window
         self._batch = batch
 
-        self._background = pgl.graphics.OrderedGroup(0)
-        self._player_group = pgl.graphics.OrderedGroup(1)
-        self._foreground = pgl.graphics.OrderedGroup(2)
+        # everything in the world is drawn through the camera, debug text stays where it is on the window
+        self._camera = render.CameraGroup(0)
+        self._background = pgl.graphics.OrderedGroup(0, parent=self._camera)
+        self._player_group = pgl.graphics.OrderedGroup(1, parent=self._camera)
+        self._foreground = pgl.graphics.OrderedGroup(2, parent=self._camera)
         self._debug_group = pgl.graphics.OrderedGroup(3)
 
         self.player = None
+        self.particle_budget = ParticleBudget()
+
+        # emitters out of view are either updated as normal ('off'), not updated ('skip') or only aged ('age')
+        self._cull_mode = "off"
+        self._sleeping_emitters = 0
+        self._culled_emitters = 0
+        self._particle_worker = None
+        self._edge_grid = None
+        self._tile_hash = SpatialHash()
+
+        # streamed levels keep the mapped file open and only create the chunks near the camera, see load
+        self._stream_file = None
+        self._stream_arrays = None
+        self._chunks = None
+        self._chunk_objects = {}
+
+        # LevelLoader of a load_async in progress
+        self._loader = None
+        self.use_cache = use_cache
+        self._cache = LevelCache(current_version)
+        # level files are loaded from and saved to here
+        self.directory = "levels"
 
         self.debug = Debug(self._batch, self._debug_group)
 
-    def update(self, dt):
+    def update(self, dt, frame_time = None):
+        """step level by dt seconds. frame_time is the real time between frames for the particle budget,
+        if it differs from dt (e.g. fixed ticks, see FixedTimestep)"""
         if self.player is not None:
-            self.__screen_wrap__(self.player)
-            self.player.accelerate(0, -self._data["gravity"])
+            # streamed levels are bigger than the window, the camera follows the player instead
+            if self._chunks is None:
+                self.__screen_wrap__(self.player)
+            self.player.accelerate(0, -self._data["gravity"] * dt * base_rate)
             self.player.update(dt)
+
+            if self._chunks is not None:
+                self.__follow__(self.player.x, self.player.y)
+                self.__stream__()
         self.debug.update()
+        self.particle_budget.update(dt if frame_time is None else frame_time, self._data["particles"])
+        self.__update_emitters__(dt)
 
-        for particle in self._data["particles"]:
-            particle.update(dt)
+        if self._particle_worker is not None:
+            self._particle_worker.flush()
+
+    def render(self, alpha = 1):
+        """move sprites alpha (0 - 1) of the way between the last two updates"""
+        if self.player is not None:
+            self.player.render(alpha)
+
+            if self._chunks is not None:
+                self.__follow__(*self.player.get_render_pos())
+
+    def set_camera(self, x, y):
+        """set the world position at the bottom left of the window"""
+        self._camera.x = x
+        self._camera.y = y
+
+    def get_camera(self):
+        return self._camera.x, self._camera.y
+
+    def __follow__(self, x, y):
+        """centre the camera on x, y"""
+        self.set_camera(x - self._window.width / 2, y - self._window.height / 2)
+
+    def __view_bounds__(self):
+        return self._camera.x, self._camera.y, self._camera.x + self._window.width, self._camera.y + self._window.height
+
+    def __update_emitters__(self, dt):
+        """update emitters, skipping sleeping ones and culling ones out of view"""
+        self._sleeping_emitters = 0
+        self._culled_emitters = 0
+
+        for emitter in self._data["particles"]:
+            if emitter.is_sleeping():
+                self._sleeping_emitters += 1
+
+            elif self._cull_mode != "off" and not self.__in_view__(emitter.get_bounds()):
+                self._culled_emitters += 1
+
+                if self._cull_mode == "age":
+                    emitter.advance(dt)
+
+            else:
+                emitter.update(dt)
+
+    def set_cull_mode(self, mode):
+        """set what happens to emitters out of view, 'off' (update as normal), 'skip' (don't update) or 'age' (only age particles)"""
+        if mode not in ("off", "skip", "age"):
+            raise ValueError("Mode '{}' is invalid! (should be 'off', 'skip' or 'age')".format(mode))
+
+        self._cull_mode = mode
+
+    def set_particle_worker(self, mode):
+        """step particles of every (non colliding) emitter in a worker process ('process'), in this process through the same code
+        ('sync') or as normal (None)"""
+        if self._particle_worker is not None:
+            for emitter in self._data["particles"]:
+                emitter.detach_worker()
+
+            self._particle_worker.close()
+            self._particle_worker = None
+
+        if mode is not None:
+            self._particle_worker = ParticleWorker(mode)
+
+            # colliding emitters need the level's tiles, they stay in this process
+            for emitter in self._data["particles"]:
+                if not emitter.collide:
+                    emitter.attach_worker(self._particle_worker)
+
+    def get_sleeping_count(self):
+        return self._sleeping_emitters
+
+    def get_culled_count(self):
+        return self._culled_emitters
+
+    def __in_view__(self, bounds):
+        """check if bounds (min x, min y, max x, max y) overlap the window"""
+        min_x, min_y, max_x, max_y = bounds
+        view_min_x, view_min_y, view_max_x, view_max_y = self.__view_bounds__()
+
+        return max_x >= view_min_x and min_x <= view_max_x and max_y >= view_min_y and min_y <= view_max_y
+
+    def load(self, filename, stream = False):
+        """load data from file (in directory, without .dat), refer to level_format.txt for details.
+        if stream, only chunks of the level near the camera are created as it moves, the file stays open until unload"""
+        if self._loader is not None:
+            raise ValueError("Level {} is still loading!".format(self._name))
+
+        self._name = filename
+        filename += ".dat"
+
+        if not os.path.isfile(self.__file_path__(filename)):
+            raise FileNotFoundError("File {} not found!".format(filename))
 
-    def load(self, filename):
-        """load data from file, refer to level_format.txt for details"""
+        else:
+            with open(self.__file_path__(filename), "rb") as file:
+                # version 2 sections are read straight from the mapped file
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            # streamed levels only ever create a few chunks, they aren't cached
+            key = self.cache_key(data) if not stream else None
+            snapshot = self._cache.get(key) if key is not None else None
+
+            # if this raises, the mapped file is left to be closed when it is garbage collected. the error's traceback
+            # still holds views of it, closing it here would raise a BufferError in place of the error
+            if snapshot is not None:
+                self.__create_snapshot__(snapshot)
+            else:
+                self.__load_data__(data, stream)
+
+            # streamed chunks are read from the mapped file as they come into view
+            if self._stream_file is None:
+                data.close()
+
+            if stream:
+                self.__follow__(self.player.x, self.player.y)
+                self.__stream__()
+
+            if snapshot is not None:
+                self.finish_load(self.snapshot_collision(snapshot, self._data["tiles"]))
+            else:
+                self.finish_load()
+
+                if key is not None:
+                    self.store(key, *self.get_contents(), self._tile_hash, self._edge_grid)
+
+    def load_async(self, filename, on_progress = None, time_slice = 0.005):
+        """load data from file without blocking the window, return the LevelLoader doing it (its cancel stops the load).
+        the file is read and decoded on a worker thread, objects are created on this thread in slices of at most
+        time_slice seconds each frame, calling on_progress(created, total) after each slice. on_load is dispatched
+        when the level is loaded"""
+        if self._loader is not None:
+            raise ValueError("Level {} is still loading!".format(self._name))
+
+        self._name = filename
         filename += ".dat"
 
-        if not os.path.isfile('levels/{}'.format(filename)):
+        if not os.path.isfile(self.__file_path__(filename)):
             raise FileNotFoundError("File {} not found!".format(filename))
 
+        self._loader = LevelLoader(self, self.__file_path__(filename), on_progress, time_slice)
+        self._loader.start()
+
+        return self._loader
+
+    def finish_load(self, collision = None):
+        """index the created objects, set up debug and mark the level as loaded.
+        collision is (tile hash, edge grid) if they were built already (see LevelLoader)"""
+        self._loader = None
+
+        if collision is None:
+            self.__build_collision__()
         else:
-            with open("levels/{}".format(filename), "rb") as file:
-                data = list(file.read())
-                file.close()
+            self._tile_hash, self._edge_grid = collision
 
-            if data[0] not in self._supported_levels:
-                raise ValueError(
-                    "Level is unsupported version! ({}, supported: {})".format(data[0], self._supported_levels))
+            for emitter in self._data["particles"]:
+                emitter.set_collision_grid(self._edge_grid)
 
-            self.player = Player((from_bin(data[1], data[2]), from_bin(data[3], data[4])), batch=self._batch,
-                                 group=self._player_group)
-            self._window.push_handlers(self.player.key_handler)
-            self._data["particles"].append(self.player.smoke_particles)
+        self.__debug_setup__()
+        self._loaded = True
+        self.dispatch_event('on_load', self)
 
-            self._data["gravity"] = data[5]
+    def cancel_load(self):
+        """drop a load_async that was cancelled (see LevelLoader.cancel) and everything it created"""
+        self._loader = None
+        self.__discard__()
 
-            index = 6
+    def __file_path__(self, filename):
+        return os.path.join(self.directory, filename)
 
-            while index < len(data):
-                object_type = data[index]
+    def cache_key(self, data):
+        """return level cache key of level file bytes data, or None if the cache is bypassed"""
+        if not self.use_cache:
+            return None
 
-                object_data = [object_type]
+        return self._cache.key(data)
 
-                # Tile
-                if object_type == 1:
-                    object_data.extend(data[index + 1: index + 10])
-                    index += 10
-                    param_id = data[index]
+    def __create_snapshot__(self, snapshot):
+        """create player and objects from a level cache Snapshot, tiles get their cached hitboxes"""
+        self.create_player(snapshot.header)
+        self.__create_elements__(list(level_format.iter_v2_records(snapshot.arrays)),
+                                 level_cache.baked_hitboxes(snapshot))
 
-                    while param_id != 0:
-                        object_data.append(param_id)
-                        object_data.extend(data[index + 1: index + 4])
-                        index += 4
+    @staticmethod
+    def snapshot_collision(snapshot, tiles):
+        """return (tile hash, edge grid) of tiles created from a Snapshot (in order), from its cached cells"""
+        return level_cache.tile_hash(snapshot, tiles), EdgeGrid.from_tiles(tiles, cells=level_cache.grid_cells(snapshot))
 
-                # PointEmitter
-                elif object_type == 2:
-                    object_data.extend(data[index + 1: index + 8])
-                    index += 8
-                    param_id = data[index]
+    def get_contents(self):
+        """return (LevelHeader, tiles, emitters) of what is loaded, in new lists (see store)"""
+        header = level_format.LevelHeader(2, self._data["start_pos"][0], self._data["start_pos"][1], self._data["gravity"])
 
-                    while param_id != 0:
-                        object_data.append(param_id)
-                        index += 1
+        return header, list(self._data["tiles"]), self.__level_emitters__()
+
+    def store(self, key, header, tiles, emitters, tile_hash, edge_grid):
+        """put a snapshot of a loaded level (its LevelHeader, Tiles, PointEmitters and collision data) in the level
+        cache under key. only what it is given is read, so it can run on the loader's worker thread"""
+        self._cache.put(key, level_cache.encode(header, tiles, emitters, tile_hash, edge_grid))
+
+    def get_cache(self):
+        return self._cache
+
+    def decode(self, data, stream = False):
+        """return (header, records, arrays) of the bytes of a level file. records is an iterator of TileRecords and
+        EmitterRecords, arrays the sections of a version 2 file (None for version 1)"""
+        if data[0] not in self._supported_levels:
+            raise ValueError("Level is unsupported version! ({}, supported: {})".format(data[0], self._supported_levels))
+
+        if data[0] == 1:
+            if stream:
+                raise ValueError("Version 1 levels can't be streamed! (upgrade it with python -m game.level_format)")
+
+            header = level_format.read_header(data)
+            records = level_format.iter_records(data)
+            arrays = None
+        else:
+            header, arrays = level_format.read_v2(data)
+            records = level_format.iter_v2_records(arrays)
+
+            if stream and b"CHNK" not in arrays:
+                raise ValueError("Level has no chunk index, it can't be streamed! (save it again to add one)")
+
+        return header, records, arrays
+
+    def __load_data__(self, data, stream = False):
+        """create player and objects from the bytes of a level file, or only the player if stream"""
+        header, records, arrays = self.decode(data, stream)
+        self.create_player(header)
+
+        if stream:
+            self._chunks = ChunkIndex(arrays[b"CHNK"])
+            self._stream_arrays = arrays
+            self._stream_file = data
+        else:
+            self.__create_elements__(list(records))
+
+    def create_player(self, header):
+        """create the player and set level settings from a LevelHeader"""
+        self.player = Player((header.start_x, header.start_y), batch=self._batch, group=self._player_group)
+        self._window.push_handlers(self.player.key_handler)
+        self._data["particles"].append(self.player.smoke_particles)
+
+        self._data["gravity"] = header.gravity
+        self._data["start_pos"] = (header.start_x, header.start_y)
+
+    def __stream__(self):
+        """create chunks that came near the camera and delete ones that are far away from it"""
+        to_load, to_unload = self._chunks.update(self.__view_bounds__())
+
+        if not to_load and not to_unload:
+            return
+
+        removed = set()
+
+        for index in to_unload:
+            tiles, emitters = self._chunk_objects.pop(index)
+
+            if self._edge_grid is not None:
+                self._edge_grid.remove(index)
+
+            for tile in tiles:
+                self._tile_hash.remove(tile.hitbox)
+                tile.delete()
 
-                        if param_id in (3, 5, 10, 15):  # 1 byte length
-                            object_data.append(data[index])
-                            index += 1
+            for emitter in emitters:
+                emitter.delete()
 
-                        elif param_id in (1, 2, 4, 6, 7, 8, 9, 11, 12, 13):  # 2 byte length
-                            object_data.extend(data[index: index + 2])
-                            index += 2
+            removed.update(id(item) for item in tiles + emitters)
 
-                        else:  # 3 byte length
-                            object_data.extend(data[index: index + 3])
-                            index += 3
+        if removed:
+            # in place, so lists handed out by get_data stay current
+            self._data["tiles"][:] = [tile for tile in self._data["tiles"] if id(tile) not in removed]
+            self._data["particles"][:] = [emitter for emitter in self._data["particles"] if id(emitter) not in removed]
 
-                # Create object
-                self.__create_element__(object_data)
-                index += 1
+        for index in to_load:
+            arrays = level_format.chunk_arrays(self._stream_arrays, self._stream_arrays[b"CHNK"][index])
+            tiles = []
+            emitters = []
 
-            self.__debug_setup__()
-            self._loaded = True
+            for item in self.__create_elements__(list(level_format.iter_v2_records(arrays))):
+                (tiles if isinstance(item, Tile) else emitters).append(item)
+
+            for tile in tiles:
+                self._tile_hash.add(tile.hitbox)
+
+            # before the load finishes there is no grid yet, it is built from every created chunk then
+            if self._edge_grid is not None:
+                self._edge_grid.add(index, EdgeGrid.from_tiles(tiles))
+
+                for emitter in emitters:
+                    emitter.set_collision_grid(self._edge_grid)
+
+            if self._particle_worker is not None:
+                for emitter in emitters:
+                    if not emitter.collide:
+                        emitter.attach_worker(self._particle_worker)
+
+            self._chunk_objects[index] = (tiles, emitters)
+
+    def is_streaming(self):
+        return self._chunks is not None
+
+    def get_chunk_count(self):
+        """return amount of chunks created, out of all chunks in a streamed level"""
+        if self._chunks is None:
+            return 0, 0
+
+        return self._chunks.get_loaded_count(), len(self._chunks)
 
     def load_empty(self):
         if not self._loaded:
@@ -138,212 +409,185 @@ class Level:
         self._loaded = True
 
     def save(self, filename, override = False):
-        """save items in data to a file, formatted as specified in level_format.txt"""
+        """save tiles and emitters to a file (in directory, without .dat) in the version 2 format, see level_format.txt"""
         filename += ".dat"
 
-        if not override and os.path.isfile('levels/{}'.format(filename)):
+        if self._chunks is not None:
+            raise ValueError("Streamed levels can't be saved, only the chunks near the camera are loaded!")
+
+        if not override and os.path.isfile(self.__file_path__(filename)):
             raise FileExistsError("File {} already exists!".format(filename))
 
         else:
             if self._data["start_pos"] is None:
-                self._data["start_pos"] = [0, 200, 1, 44]
-
-            if self.player is not None:
-                self._data["particles"].remove(self.player.smoke_particles)
-
-            # Initial data
-            data = [self._current_version]
-            data.extend(self._data["start_pos"])
-            data.append(self._data["gravity"])
-
-            # Tiles data
-            for tile in self._data["tiles"]:
-                data.append(1)
-                data.extend(to_bin(tile.x))
-                data.extend(to_bin(tile.y))
-                data.extend(to_bin(tile.rot))
-                data.append(tile.shape)
-                data.append(tile.style)
-
-                if tile.has_outline:
-                    data.append(1)
-                else:
-                    data.append(0)
-
-                # Optional parameters
-                if tile.colour != (255, 255, 255):
-                    data.append(1)
-                    data.extend(tile.colour)
+                self._data["start_pos"] = (200, 299)
 
-                if tile.has_outline and tile.line_colour != (255, 255, 255):
-                    data.append(2)
-                    data.extend(tile.line_colour)
+            header = level_format.LevelHeader(2, self._data["start_pos"][0], self._data["start_pos"][1],
+                                              self._data["gravity"])
 
-                data.append(0)
+            with open(self.__file_path__(filename), "wb") as file:
+                file.write(level_format.encode_v2(header, level_format.tiles_to_array(self._data["tiles"]),
+                                                  level_format.emitters_to_array(self.__level_emitters__())))
 
-            # Particles data
-            for particle in self._data["particles"]:
-                emitter_data = [2]
-                emitter_data.extend(to_bin(particle.x))
-                emitter_data.extend(to_bin(particle.y))
+    def __level_emitters__(self):
+        """emitters saved with the level, the player's emitter belongs to the player"""
+        return [emitter for emitter in self._data["particles"]
+                if self.player is None or emitter is not self.player.smoke_particles]
 
-                if particle.direction != 0:
-                    data.append(1)
-                    data.extend(to_bin(particle.direction))
+    def unload(self):
+        """delete everything in the level, cancelling a load_async in progress"""
+        if self._loader is not None:
+            self._loader.cancel()
 
-                if particle.max_particles != 10:
-                    data.append(2)
-                    data.extend(to_bin(particle.max_particles))
+        if self._loaded:
+            self.__discard__()
 
-                if particle.emit_speed != 1:
-                    data.append(3)
-                    data.append(particle.emit_speed)
+    def __discard__(self):
+        """delete the player and every object, also ones of a load that didn't finish"""
+        self.debug.delete_all()
+        self.debug.delete_dynamic_variables()
+        self.set_particle_worker(None)
 
-                if particle.spread != 360:
-                    data.append(4)
-                    data.extend(to_bin(particle.spread))
+        if self.player is not None:
+            self.player.delete()
 
-                if particle.particle_image_id != 1:
-                    data.append(5)
-                    data.append(particle.particle_image_id)
+        for tile in self._data["tiles"]:
+            tile.delete()
 
-                if particle.particle_vel != 10:
-                    data.append(6)
-                    data.extend(to_bin(particle.particle_vel))
+        for particle in self._data["particles"]:
+            particle.delete()
 
-                if particle.particle_vel_rand != 0:
-                    data.append(7)
-                    data.extend(to_bin(particle.particle_vel_rand))
+        for title in self._data["titles"]:
+            title.delete()
 
-                if particle.particle_rot_vel != 0:
-                    data.append(8)
-                    data.extend(to_bin(particle.particle_rot_vel))
+        self.player = None
+        self._edge_grid = None
+        self._tile_hash.clear()
+
+        if self._stream_file is not None:
+            # arrays are views of the mapped file, they must go before it is closed
+            self._stream_arrays = None
+            self._stream_file.close()
+            self._stream_file = None
+
+        self._chunks = None
+        self._chunk_objects = {}
+        self.set_camera(0, 0)
+        self.version = None
+        self._name = None
+        self._data = {"tiles": [],
+                      "particles": [],
+                      "titles": [],
+                      "start_pos": None,
+                      "gravity": 20}
 
-                if particle.particle_rot_vel_rand != 0:
-                    data.append(9)
-                    data.extend(to_bin(particle.particle_rot_vel_rand))
+        self._loaded = False
 
-                if particle.particle_size != 10:
-                    data.append(10)
-                    data.append(particle.particle_size)
+    @staticmethod
+    def bake(records, hitboxes = None):
+        """return the BakedHitbox of each TileRecord in records (None for other records), all baked at once.
+        hitboxes are the tiles' BakedHitboxes in order if they are known (from the level cache)"""
+        tiles = [record for record in records if isinstance(record, level_format.TileRecord)]
 
-                if particle.particle_size_rand != 0:
-                    data.append(11)
-                    data.extend(to_bin(particle.particle_size_rand))
+        if hitboxes is None:
+            hitboxes = bake_many([tile.shape for tile in tiles], [tile.x for tile in tiles], [tile.y for tile in tiles],
+                                 [tile.rot for tile in tiles])
 
-                if particle.particle_lifetime != 1:
-                    data.append(12)
-                    data.extend(to_bin(particle.particle_lifetime))
+        hitboxes = iter(hitboxes)
 
-                if particle.particle_lifetime_rand != 0:
-                    data.append(13)
-                    data.extend(to_bin(particle.particle_lifetime_rand))
+        return [next(hitboxes) if isinstance(record, level_format.TileRecord) else None for record in records]
 
-                if particle.particle_colour != (255, 255, 255):
-                    data.append(14)
-                    data.extend(particle.particle_colour)
+    def __create_elements__(self, records, hitboxes = None):
+        """create objects from a list of records and return them, see bake for hitboxes"""
+        return [self.create_element(record, baked) for record, baked in zip(records, self.bake(records, hitboxes))]
 
-                if particle.particle_drag != 1:
-                    data.append(15)
-                    data.append(particle.particle_drag)
+    def create_element(self, record, baked = None):
+        """create a new object from a TileRecord or EmitterRecord and return it, refer to level_format.txt for details.
+        baked is a tile's BakedHitbox if it is known (from the level cache)"""
+        if isinstance(record, level_format.TileRecord):
+            tile = Tile((record.x, record.y), record.rot, record.style, record.shape, colour = record.colour,
+                        outline = record.outline, outline_colour = record.outline_colour, batch = self._batch,
+                        group = self._background, baked = baked)
+            self._data["tiles"].append(tile)
 
-                data.append(0)
-
-            file = open("levels/{}".format(filename), "wb")
-            file.write(bytes(data))
-            file.close()
+            return tile
 
-    def unload(self):
-        if self._loaded:
-            self.player.delete()
-
-            for tile in self._data["tiles"]:
-                tile.delete()
+        elif isinstance(record, level_format.EmitterRecord):
+            # parameter names match PointEmitter's arguments, ones not in the file keep their default
+            emitter = PointEmitter((record.x, record.y), render_mode="quads", batch=self._batch, group=self._foreground,
+                                   **record.params)
+            self._data["particles"].append(emitter)
 
-            for particle in self._data["particles"]:
-                particle.delete()
+            return emitter
 
-            for title in self._data["titles"]:
-                title.delete()
+    def __build_collision__(self):
+        """index tile hitboxes for player collision and tile edges for particle collision"""
+        self._tile_hash.clear()
 
-            self.player = None
-            self.version = None
-            self._name = None
-            self._data = {"tiles": [],
-                          "particles": [],
-                          "titles": [],
-                          "start_pos": None,
-                          "gravity": 20}
+        for tile in self._data["tiles"]:
+            self._tile_hash.add(tile.hitbox)
 
-            self._loaded = False
+        self.__build_edge_grid__()
 
-    def __create_element__(self, data):
-        """create a new object from the parameters in data, refer to level_format.txt for details"""
-        #  Tile
-        if data[0] == 1:
-            pos_x = from_bin(data[1], data[2])
-            pos_y = from_bin(data[3], data[4])
-            rot = from_bin(data[5], data[6])
-            shape_id = data[7]
-            style_id = data[8]
-            has_outline = bool(data[9])
+    def __build_edge_grid__(self):
+        if self._chunks is not None:
+            # one grid per created chunk, so __stream__ adds and removes chunks without rebuilding the rest
+            self._edge_grid = EdgeGridSet()
 
-            tile = Tile((pos_x, pos_y), rot, style_id, shape_id, outline = has_outline, batch = self._batch, group = self._background)
+            for index, (tiles, _) in self._chunk_objects.items():
+                self._edge_grid.add(index, EdgeGrid.from_tiles(tiles))
+        else:
+            self._edge_grid = EdgeGrid.from_tiles(self._data["tiles"])
+
+        for emitter in self._data["particles"]:
+            emitter.set_collision_grid(self._edge_grid)
+
+    def add_tile(self, tile):
+        """add a tile to the level and its collision data, only the edge grid cells it is in change"""
+        self._data["tiles"].append(tile)
+        self._tile_hash.add(tile.hitbox)
+        self.__add_edges__([tile])
+
+    def __add_edges__(self, tiles):
+        """put the edges of tiles added to the level in the edge grid cells they are in, without rebuilding it"""
+        if self._edge_grid is None:
+            self.__build_edge_grid__()
+        elif self._chunks is not None:
+            # added tiles aren't part of a chunk, they keep a grid of their own that stays when chunks unload
+            grid = self._edge_grid.get(added_tiles)
+
+            if grid is None:
+                self._edge_grid.add(added_tiles, EdgeGrid.from_tiles(tiles))
+            else:
+                grid.add_tiles(tiles)
+        else:
+            self._edge_grid.add_tiles(tiles)
 
-            index = 11
+    def raycast(self, origin, direction, max_dist):
+        """first tile hit by a ray from origin in direction, return (tile, side (Line), distance) or None"""
+        return self.raycast_many([origin], [direction], [max_dist])[0]
 
-            while index < len(data):
-                if data[index] == 1:  # tile colour
-                    tile.set_colour(data[index + 1: index + 4])
+    def segment_query(self, a, b):
+        """first tile hit going from point a to point b, return (tile, side (Line), distance from a) or None"""
+        direction = (b[0] - a[0], b[1] - a[1])
 
-                elif data[index] == 2:  # line colour
-                    tile.set_outline_colour(data[index + 1, index + 4])
+        return self.raycast(a, direction, (direction[0] ** 2 + direction[1] ** 2) ** 0.5)
 
-                index += 4
+    def raycast_many(self, origins, directions, max_dists):
+        """raycast for many rays at once (e.g. AI sensors), return a list with a result or None for each ray"""
+        if self._edge_grid is None:
+            return [None] * len(origins)
 
-            self._data["tiles"].append(tile)
+        distances, edges = self._edge_grid.raycast(origins, directions, max_dists)
+        results = []
 
-        #  Particle emitter
-        elif data[0] == 4:
-            data = data[1:]
-            emitter = PointEmitter((0, 0), batch=self._batch, group=self._foreground)
-
-            for i in range(len(data) // 3):
-                var = data[i * 3]  # variable id
-                val = from_bin(data[(i * 3) + 1], data[(i * 3) + 2])  # variable value
-
-                if var == 1:
-                    emitter.set_pos(val, emitter.y)
-                elif var == 2:
-                    emitter.set_pos(emitter.x, val)
-                elif var == 3:
-                    emitter.set_pos(emitter.x, emitter.y, direction=val)
-                elif var == 4:
-                    emitter.set_intensity(spread=val)
-                elif var == 5:
-                    emitter.set_intensity(max_particles=val)
-                elif var == 6:
-                    emitter.set_intensity(emit_speed=val)
-                elif var == 7:
-                    emitter.set_intensity(lifetime=val)
-                elif var == 8:
-                    emitter.set_intensity(lifetime_rand=val)
-                elif var == 9:
-                    emitter.set_intensity(size=val)
-                elif var == 10:
-                    emitter.set_intensity(size_rand=val)
-                elif var == 11:
-                    emitter.set_intensity(vel=val)
-                elif var == 12:
-                    emitter.set_intensity(vel_rand=val)
-                elif var == 13:
-                    emitter.set_intensity(rot_vel=val)
-                elif var == 14:
-                    emitter.set_intensity(rot_vel_rand=val)
-                elif var == 15:
-                    emitter.set_intensity(drag=val)
+        for distance, edge in zip(distances.tolist(), edges.tolist()):
+            if edge < 0:
+                results.append(None)
+            else:
+                results.append(self._edge_grid.get_edge(edge) + (distance,))
 
-            self._data["particles"].append(emitter)
+        return results
 
     def start_pos(self, pos):
         """set point at which player spawns"""
@@ -364,22 +608,38 @@ class Level:
 
     def __debug_setup__(self):
         """add objects in self._data to debug groups"""
-        self.debug.add_group(self._data["tiles"], 'tiles')
+        # streamed tiles and emitters come and go, only the player is debugged then
+        if self._chunks is None:
+            self.debug.add_group(self._data["tiles"], 'tiles')
+            self.debug.add_group(self._data["particles"], 'particles')
         self.debug.add_group([self.player, self.player.hitbox], 'player')
-        self.debug.add_group(self._data["particles"], 'particles')
 
         particle_counts = [particle.get_particle_count for particle in self._data["particles"]]
 
         self.debug.dynamic_variable("Particles", particle_counts, (10, self._window.height - 20), size=15,
                                     anchor_x='left')
+        self.debug.dynamic_variable("Particle pool misses", [particle.get_pool_misses for particle in self._data["particles"]],
+                                    (10, self._window.height - 80), size=15, anchor_x='left')
+        self.debug.dynamic_variable("Particle quality", self.particle_budget.get_scale, (10, self._window.height - 100),
+                                    size=15, anchor_x='left')
+        self.debug.dynamic_variable("Particles cut", self.particle_budget.get_cut_counts, (10, self._window.height - 120),
+                                    size=15, anchor_x='left')
+        self.debug.dynamic_variable("Emitters sleeping", self.get_sleeping_count, (10, self._window.height - 140),
+                                    size=15, anchor_x='left')
+        self.debug.dynamic_variable("Emitters culled", self.get_culled_count, (10, self._window.height - 160),
+                                    size=15, anchor_x='left')
+        self.debug.dynamic_variable("Contact cache hits", self.player.contact_cache.get_hit_rate,
+                                    (10, self._window.height - 180), size=15, anchor_x='left')
+        self.debug.dynamic_variable("Chunks loaded", self.get_chunk_count, (10, self._window.height - 200), size=15,
+                                    anchor_x='left')
+        self.debug.dynamic_variable("Touching cache hits", self.player.contact_cache.get_touching_hit_rate,
+                                    (10, self._window.height - 220), size=15, anchor_x='left')
         self.debug.dynamic_variable("Player velocity", self.player.print_velocity, (10, self._window.height - 40),
                                     size=15, anchor_x='left')
         self.debug.dynamic_variable("Player position", self.player.print_pos, (10, self._window.height - 60), size=15,
                                     anchor_x='left')
 
-        # TODO: make this into a proper mechanic
-        for tile in self._data["tiles"]:
-            self.player.near_rect(tile.hitbox)
+        self.player.set_broadphase(self._tile_hash)
 
     def get_data(self):
         return self._data
@@ -388,12 +648,19 @@ class Level:
         """override or add data to level data"""
         if mode == "override":
             self._data = new_data
+            self.__build_collision__()
 
         elif mode == "merge":
             # Add elements that aren't already in data
+            added = []
+
             for tile in new_data["tiles"]:
                 if tile not in self._data["tiles"]:
                     self._data["tiles"].append(tile)
+                    self._tile_hash.add(tile.hitbox)
+                    added.append(tile)
+
+            self.__add_edges__(added)
 
             for particle in new_data["particles"]:
                 if particle not in self._data["particles"]:
@@ -407,3 +674,13 @@ class Level:
 
     def is_loaded(self):
         return self._loaded
+
+    def get_name(self):
+        return self._name
+
+    def is_loading(self):
+        return self._loader is not None
+
+
+# dispatched with the level when a load (or load_async) has finished
+Level.register_event_type('on_load')
@@ -0,0 +1,224 @@
+"""on disk cache of decoded and baked levels, so loading a level that was loaded before skips decoding the file,
+baking tile hitboxes and building the broadphase and edge grid.
+
+each entry is a flat binary snapshot named after the sha256 of the level file and the game version, so editing a
+level or updating the game never hits an old entry. entries go in a section table like version 2 level files:
+header '<4sHiiBH' (magic, cache version, start x, start y, gravity, section count), grid '<IddIII' (spatial hash cell
+size, edge grid origin x, origin y, columns, rows, cell width), section table, then the sections of section_dtypes.
+the least recently used entries are deleted when the cache grows past its size limit"""
+import hashlib
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+from . import level_format
+from .grid import SpatialHash
+from .tile import BakedHitbox
+
+# bump when what is cached (or how it is worked out) changes, old entries are then never hit
+cache_version = 2
+magic = b"SPLC"
+header_format = struct.Struct("<4sHiiBH")
+grid_format = struct.Struct("<IddIII")
+
+# per tile: its corners (rows of the CORN section) and bounding box
+baked_dtype = np.dtype([("corner_start", "<u4"), ("corner_count", "<u4"), ("aabb", "<f8", 4)])
+# per corner of every tile: world space corner, start of the side ending at it and that side's normal
+corner_dtype = np.dtype([("corner", "<f8", 2), ("side_start", "<f8", 2), ("normal", "<f8", 2)])
+# per spatial hash cell a tile is in
+hash_dtype = np.dtype([("column", "<i4"), ("row", "<i4"), ("tile", "<u4")])
+
+section_dtypes = {b"TILE": level_format.tile_dtype, b"EMIT": level_format.emitter_dtype, b"BAKE": baked_dtype,
+                  b"CORN": corner_dtype, b"HASH": hash_dtype, b"GRID": np.dtype("<i8")}
+
+# grid: spatial hash cell size and EdgeGrid.get_cells without the cells, arrays: {section name: structured array}
+Snapshot = namedtuple("Snapshot", ["header", "grid", "arrays"])
+
+
+def encode(header, tiles, emitters, tile_hash, edge_grid):
+    """return snapshot bytes of a loaded level, tiles and emitters are the level's Tile and PointEmitter objects,
+    tile_hash the SpatialHash of the tiles' hitboxes and edge_grid the EdgeGrid of the tiles"""
+    counts = [len(tile.baked.corners) for tile in tiles]
+    baked = np.zeros(len(tiles), dtype=baked_dtype)
+    baked["corner_count"] = counts
+    baked["corner_start"] = np.cumsum(counts) - counts
+    corners = np.zeros(sum(counts), dtype=corner_dtype)
+
+    if tiles:
+        baked["aabb"] = [tile.baked.aabb for tile in tiles]
+        corners["corner"] = np.concatenate([tile.baked.corners for tile in tiles])
+        corners["side_start"] = np.concatenate([tile.baked.side_starts for tile in tiles])
+        corners["normal"] = np.concatenate([tile.baked.normals for tile in tiles])
+
+    indices = {id(tile.hitbox): i for i, tile in enumerate(tiles)}
+    cells = [(column, row, indices[id(rect)]) for (column, row), rects in tile_hash.get_cells().items() for rect in rects]
+    hash_cells = np.array(cells, dtype=hash_dtype)
+
+    origin_x, origin_y, columns, rows, grid_cells = edge_grid.get_cells()
+
+    parts = [(b"TILE", level_format.tiles_to_array(tiles)),
+             (b"EMIT", level_format.emitters_to_array(emitters)),
+             (b"BAKE", baked),
+             (b"CORN", corners),
+             (b"HASH", hash_cells),
+             (b"GRID", grid_cells.astype("<i8").reshape(-1))]
+    prefix = (header_format.pack(magic, cache_version, header.start_x, header.start_y, header.gravity, len(parts)) +
+              grid_format.pack(tile_hash.cell_size, origin_x, origin_y, columns, rows, grid_cells.shape[1]))
+
+    return level_format.pack_sections(prefix, parts)
+
+
+def decode(data):
+    """return Snapshot of snapshot bytes, arrays are read only views into data"""
+    if len(data) < header_format.size + grid_format.size:
+        raise ValueError("Cache entry is too short! ({} bytes)".format(len(data)))
+
+    entry_magic, version, start_x, start_y, gravity, count = header_format.unpack_from(data)
+
+    if entry_magic != magic or version != cache_version:
+        raise ValueError("Not a level cache entry of version {}! (magic {}, version {})".format(cache_version,
+                                                                                               entry_magic, version))
+
+    grid = grid_format.unpack_from(data, header_format.size)
+    arrays = level_format.read_sections(data, header_format.size + grid_format.size, count, section_dtypes)
+
+    if set(arrays) != set(section_dtypes):
+        raise ValueError("Cache entry is missing sections! (has {})".format(sorted(arrays)))
+
+    # sections refer to each other, a damaged entry must fail here and not while the level is created from it
+    tiles = len(arrays[b"TILE"])
+    baked = arrays[b"BAKE"]
+    edges = len(arrays[b"CORN"])
+    _, _, _, columns, rows, width = grid
+
+    if len(baked) != tiles or (baked["corner_start"].astype(np.int64) + baked["corner_count"] > edges).any() or \
+            (arrays[b"HASH"]["tile"] >= tiles).any() or len(arrays[b"GRID"]) != columns * rows * width or \
+            (arrays[b"GRID"] >= edges).any() or (arrays[b"GRID"] < -1).any():
+        raise ValueError("Cache entry sections don't match! ({} tiles, {} edges)".format(tiles, edges))
+
+    return Snapshot(level_format.LevelHeader(2, start_x, start_y, gravity), grid, arrays)
+
+
+def baked_hitboxes(snapshot):
+    """return a BakedHitbox for each tile of a Snapshot"""
+    tiles = snapshot.arrays[b"TILE"]
+    baked = snapshot.arrays[b"BAKE"]
+    corners = snapshot.arrays[b"CORN"]
+    hitboxes = []
+
+    for rot, start, count, aabb in zip(tiles["rot"].tolist(), baked["corner_start"].tolist(),
+                                       baked["corner_count"].tolist(), baked["aabb"].tolist()):
+        tile_corners = corners[start:start + count]
+        hitboxes.append(BakedHitbox(rot, tile_corners["corner"], tile_corners["side_start"], tile_corners["normal"],
+                                    tuple(aabb)))
+
+    return hitboxes
+
+
+def tile_hash(snapshot, tiles):
+    """return the SpatialHash of a Snapshot, holding the hitboxes of tiles (created from the snapshot, in order)"""
+    spatial_hash = SpatialHash(snapshot.grid[0])
+    cells = snapshot.arrays[b"HASH"]
+
+    for column, row, tile in zip(cells["column"].tolist(), cells["row"].tolist(), cells["tile"].tolist()):
+        spatial_hash.add(tiles[tile].hitbox, ((column, row),))
+
+    return spatial_hash
+
+
+def grid_cells(snapshot):
+    """return the EdgeGrid cells of a Snapshot, see EdgeGrid.get_cells"""
+    _, origin_x, origin_y, columns, rows, width = snapshot.grid
+
+    return origin_x, origin_y, columns, rows, snapshot.arrays[b"GRID"].reshape(-1, width)
+
+
+class LevelCache:
+    def __init__(self, game_version, directory = "cache/levels", max_bytes = 64 * 1024 * 1024):
+        """snapshots of levels of game_version (the current level version) in directory, the least recently used
+        are deleted once there are more than max_bytes of them"""
+        self.game_version = game_version
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return "LevelCache in {} ({} hits, {} misses)".format(self.directory, self.hits, self.misses)
+
+    def key(self, data):
+        """return the key of level file bytes data"""
+        key = hashlib.sha256(data)
+        key.update("{}-{}".format(self.game_version, cache_version).encode("ascii"))
+
+        return key.hexdigest()
+
+    def __path__(self, key):
+        return os.path.join(self.directory, key + ".lvc")
+
+    def get(self, key):
+        """return the Snapshot of a level file's key, or None if it isn't cached"""
+        path = self.__path__(key)
+
+        try:
+            with open(path, "rb") as file:
+                snapshot = decode(file.read())
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (ValueError, struct.error, EOFError):
+            # a broken entry (e.g. truncated by a crash while writing, or corrupted) is made again
+            os.remove(path)
+            self.misses += 1
+            return None
+
+        # mark as recently used for eviction
+        os.utime(path)
+        self.hits += 1
+
+        return snapshot
+
+    def put(self, key, snapshot):
+        """store snapshot bytes (see encode) under a level file's key, then evict if the cache is too big"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.__path__(key)
+
+        # written under another name first, so an entry is never seen half written
+        with open(path + ".tmp", "wb") as file:
+            file.write(snapshot)
+
+        os.replace(path + ".tmp", path)
+        self.__evict__()
+
+    def __evict__(self):
+        """delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith(".lvc"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_bytes:
+                break
+
+            os.remove(os.path.join(self.directory, name))
+            size -= entry_size
+
+    def get_size(self):
+        """return bytes of entries in the cache"""
+        if not os.path.isdir(self.directory):
+            return 0
+
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)
+                   if name.endswith(".lvc"))
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".lvc"):
+                    os.remove(os.path.join(self.directory, name))
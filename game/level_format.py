@@ -0,0 +1,348 @@
+"""reading and writing .dat level files, see levels/level_format.txt.
+version 1 is decoded from a memoryview of the file, fixed size parts are read with precompiled structs and each
+object is yielded as a record as soon as it is decoded.
+version 2 keeps tiles and emitters in sections of fixed size little endian records, listed in a section table,
+so each section is viewed as a numpy structured array without decoding anything. records are sorted by chunk of the
+world, and a chunk index section lists each chunk's records so big levels can be streamed a chunk at a time.
+
+run from the repository root to upgrade a version 1 file: python -m game.level_format levels/test4.dat"""
+import argparse
+import struct
+from collections import namedtuple
+import numpy as np
+
+LevelHeader = namedtuple("LevelHeader", ["version", "start_x", "start_y", "gravity"])
+TileRecord = namedtuple("TileRecord", ["x", "y", "rot", "shape", "style", "outline", "colour", "outline_colour"])
+# params maps parameter name to value, only parameters in the file are there (the rest keep their default)
+EmitterRecord = namedtuple("EmitterRecord", ["x", "y", "params"])
+
+# version 1: 2 byte numbers are stored in base 255 (high byte * 255 + low byte)
+header_format = struct.Struct("<6B")
+tile_format = struct.Struct("<9B")
+emitter_format = struct.Struct("<4B")
+colour_format = struct.Struct("<3B")
+byte_format = struct.Struct("<B")
+short_format = struct.Struct("<2B")
+
+tile_id = 1
+emitter_id = 2
+terminator = 0
+
+# tile parameter id: name (all colours)
+tile_params = {1: "colour", 2: "outline_colour"}
+
+# emitter parameter id: (name, struct it is stored as, number it is stored multiplied by, see the (x 0.1) parameters)
+emitter_params = {1: ("direction", short_format, 1),
+                  2: ("max_particles", short_format, 1),
+                  3: ("emit_speed", byte_format, 1),
+                  4: ("spread", short_format, 1),
+                  5: ("image_id", byte_format, 1),
+                  6: ("vel", short_format, 10),
+                  7: ("vel_rand", short_format, 10),
+                  8: ("rot_vel", short_format, 1),
+                  9: ("rot_vel_rand", short_format, 1),
+                  10: ("size", byte_format, 1),
+                  11: ("size_rand", short_format, 10),
+                  12: ("lifetime", short_format, 10),
+                  13: ("lifetime_rand", short_format, 10),
+                  14: ("colour", colour_format, 1),
+                  15: ("drag", byte_format, 10)}
+
+
+def read_header(data):
+    """return LevelHeader of level file bytes data"""
+    if len(data) < header_format.size:
+        raise ValueError("Level file is too short! ({} bytes)".format(len(data)))
+
+    version, x_high, x_low, y_high, y_low, gravity = header_format.unpack_from(data)
+
+    return LevelHeader(version, x_high * 255 + x_low, y_high * 255 + y_low, gravity)
+
+
+def iter_records(data):
+    """yield a TileRecord or EmitterRecord for each object in level file bytes data, in file order"""
+    with memoryview(data) as view:
+        index = header_format.size
+        end = len(view)
+
+        while index < end:
+            object_type = view[index]
+            start = index
+            index += 1
+
+            try:
+                if object_type == tile_id:
+                    x_high, x_low, y_high, y_low, rot_high, rot_low, shape, style, outline = \
+                        tile_format.unpack_from(view, index)
+                    index += tile_format.size
+                    colours = {"colour": (255, 255, 255), "outline_colour": (255, 255, 255)}
+
+                    while view[index] != terminator:
+                        param_id = view[index]
+
+                        if param_id not in tile_params:
+                            raise ValueError("Unknown tile parameter {} at byte {}!".format(param_id, index))
+
+                        colours[tile_params[param_id]] = colour_format.unpack_from(view, index + 1)
+                        index += 1 + colour_format.size
+
+                    yield TileRecord(x_high * 255 + x_low, y_high * 255 + y_low, rot_high * 255 + rot_low, shape, style,
+                                     bool(outline), colours["colour"], colours["outline_colour"])
+
+                elif object_type == emitter_id:
+                    x_high, x_low, y_high, y_low = emitter_format.unpack_from(view, index)
+                    index += emitter_format.size
+                    params = {}
+
+                    while view[index] != terminator:
+                        param_id = view[index]
+
+                        if param_id not in emitter_params:
+                            raise ValueError("Unknown emitter parameter {} at byte {}!".format(param_id, index))
+
+                        name, param_format, multiplier = emitter_params[param_id]
+                        value = param_format.unpack_from(view, index + 1)
+
+                        if param_format is colour_format:
+                            params[name] = value
+                        else:
+                            number = value[0] * 255 + value[1] if param_format is short_format else value[0]
+                            params[name] = number / multiplier if multiplier != 1 else number
+
+                        index += 1 + param_format.size
+
+                    yield EmitterRecord(x_high * 255 + x_low, y_high * 255 + y_low, params)
+
+                else:
+                    raise ValueError("Unknown object type {} at byte {}!".format(object_type, start))
+
+            except (IndexError, struct.error):
+                raise ValueError("Level file ends in the middle of the object at byte {}!".format(start)) from None
+
+            # skip terminator
+            index += 1
+
+
+# version 2: header, then section table entries (name, byte offset, record count), then the sections
+v2_magic = b"SPNY"
+v2_header_format = struct.Struct("<B4siiBH")
+section_format = struct.Struct("<4sII")
+
+tile_dtype = np.dtype([("x", "<i4"), ("y", "<i4"), ("rot", "<u2"), ("shape", "u1"), ("style", "u1"),
+                       ("outline", "u1"), ("colour", "u1", 3), ("outline_colour", "u1", 3), ("padding", "u1")])
+
+emitter_dtype = np.dtype([("x", "<i4"), ("y", "<i4"), ("direction", "<f4"), ("max_particles", "<u2"),
+                          ("emit_speed", "<f4"), ("spread", "<f4"), ("image_id", "u1"), ("vel", "<f4"),
+                          ("vel_rand", "<f4"), ("rot_vel", "<f4"), ("rot_vel_rand", "<f4"), ("size", "<f4"),
+                          ("size_rand", "<f4"), ("lifetime", "<f4"), ("lifetime_rand", "<f4"), ("colour", "u1", 3),
+                          ("drag", "<f4")])
+
+# PointEmitter's defaults for the parameters in emitter_dtype
+emitter_defaults = {"direction": 0, "max_particles": 10, "emit_speed": 1, "spread": 360, "image_id": 1, "vel": 10,
+                    "vel_rand": 0, "rot_vel": 0, "rot_vel_rand": 0, "size": 10, "size_rand": 0, "lifetime": 1,
+                    "lifetime_rand": 0, "colour": (255, 255, 255), "drag": 1}
+
+# tiles and emitters are sorted by the square chunk of the world they are in, a chunk's tiles and emitters are one
+# range of records in their sections. chunk bounds are the chunk's square, objects can stick out of it a little
+chunk_dtype = np.dtype([("min_x", "<i4"), ("min_y", "<i4"), ("max_x", "<i4"), ("max_y", "<i4"), ("tile_start", "<u4"),
+                        ("tile_count", "<u4"), ("emitter_start", "<u4"), ("emitter_count", "<u4")])
+chunk_size = 512
+
+# section name: record dtype
+sections = {b"TILE": tile_dtype, b"EMIT": emitter_dtype, b"CHNK": chunk_dtype}
+
+
+def read_v2(data):
+    """return (LevelHeader, {section name: structured array}) of version 2 level file bytes data.
+    the arrays are views into data (e.g. an mmap), they must be deleted before it is closed"""
+    if len(data) < v2_header_format.size:
+        raise ValueError("Level file is too short! ({} bytes)".format(len(data)))
+
+    version, magic, start_x, start_y, gravity, count = v2_header_format.unpack_from(data)
+
+    if version != 2 or magic != v2_magic:
+        raise ValueError("Not a version 2 level file! (version {}, magic {})".format(version, magic))
+
+    arrays = read_sections(data, v2_header_format.size, count, sections)
+
+    # the chunk index is optional, files without it can't be streamed
+    for name in (b"TILE", b"EMIT"):
+        arrays.setdefault(name, np.zeros(0, dtype=sections[name]))
+
+    return LevelHeader(version, start_x, start_y, gravity), arrays
+
+
+def iter_v2_records(arrays):
+    """yield a TileRecord or EmitterRecord for each tile and emitter of read_v2's arrays, like iter_records"""
+    tiles = arrays[b"TILE"]
+    columns = [tiles[name].tolist() for name in ("x", "y", "rot", "shape", "style", "outline")]
+    colours = [tuple(colour) for colour in tiles["colour"].tolist()]
+    outline_colours = [tuple(colour) for colour in tiles["outline_colour"].tolist()]
+
+    for x, y, rot, shape, style, outline, colour, outline_colour in zip(*columns, colours, outline_colours):
+        yield TileRecord(x, y, rot, shape, style, bool(outline), colour, outline_colour)
+
+    emitters = arrays[b"EMIT"]
+    names = [name for name in emitter_dtype.names if name not in ("x", "y")]
+
+    for emitter in emitters.tolist():
+        params = dict(zip(names, emitter[2:]))
+        params["colour"] = tuple(params["colour"].tolist())
+        yield EmitterRecord(emitter[0], emitter[1], params)
+
+
+def encode_v2(header, tiles, emitters, size = chunk_size):
+    """return bytes of a version 2 level file, tiles and emitters are structured arrays of tile_dtype / emitter_dtype.
+    they are written in chunks of size, with a chunk index section"""
+    tiles, emitters, chunks = split_chunks(np.asarray(tiles, dtype=tile_dtype), np.asarray(emitters, dtype=emitter_dtype),
+                                           size)
+    parts = [(b"TILE", np.ascontiguousarray(tiles)),
+             (b"EMIT", np.ascontiguousarray(emitters)),
+             (b"CHNK", chunks)]
+
+    return pack_sections(v2_header_format.pack(2, v2_magic, header.start_x, header.start_y, header.gravity, len(parts)),
+                         parts)
+
+
+def read_sections(data, table_offset, count, dtypes):
+    """return {section name: structured array} of the count sections listed in the section table at table_offset.
+    dtypes maps section name to record dtype, sections not in it are skipped"""
+    arrays = {}
+
+    for i in range(count):
+        name, offset, records = section_format.unpack_from(data, table_offset + i * section_format.size)
+
+        if name not in dtypes:
+            # sections added by later versions are skipped
+            continue
+
+        if offset + records * dtypes[name].itemsize > len(data):
+            raise ValueError("Section {} runs past the end of the file!".format(name.decode("ascii")))
+
+        arrays[name] = np.frombuffer(data, dtype=dtypes[name], count=records, offset=offset)
+
+    return arrays
+
+
+def pack_sections(header, parts):
+    """return bytes of header (bytes), a section table and the sections, parts is a list of (name, array)"""
+    offset = len(header) + len(parts) * section_format.size
+    table = []
+
+    for name, array in parts:
+        table.append(section_format.pack(name, offset, len(array)))
+        offset += array.nbytes
+
+    return b"".join([header] + table + [np.ascontiguousarray(array).tobytes() for _, array in parts])
+
+
+def split_chunks(tiles, emitters, size = chunk_size):
+    """return (tiles, emitters, chunks), tiles and emitters sorted by the chunk of size they are in and a chunk_dtype
+    array of the chunks that have any"""
+    tile_cells = np.stack((tiles["x"] // size, tiles["y"] // size), axis=1).astype(np.int64)
+    emitter_cells = np.stack((emitters["x"] // size, emitters["y"] // size), axis=1).astype(np.int64)
+    cells, inverse = np.unique(np.concatenate((tile_cells, emitter_cells)), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    tile_chunk = inverse[:len(tiles)]
+    emitter_chunk = inverse[len(tiles):]
+    tile_counts = np.bincount(tile_chunk, minlength=len(cells))
+    emitter_counts = np.bincount(emitter_chunk, minlength=len(cells))
+
+    chunks = np.zeros(len(cells), dtype=chunk_dtype)
+    chunks["min_x"] = cells[:, 0] * size
+    chunks["min_y"] = cells[:, 1] * size
+    chunks["max_x"] = chunks["min_x"] + size
+    chunks["max_y"] = chunks["min_y"] + size
+    chunks["tile_start"] = np.cumsum(tile_counts) - tile_counts
+    chunks["tile_count"] = tile_counts
+    chunks["emitter_start"] = np.cumsum(emitter_counts) - emitter_counts
+    chunks["emitter_count"] = emitter_counts
+
+    return tiles[np.argsort(tile_chunk, kind="stable")], emitters[np.argsort(emitter_chunk, kind="stable")], chunks
+
+
+def chunk_arrays(arrays, chunk):
+    """tile and emitter sections (like read_v2's arrays) of only the objects in a chunk, a chunk_dtype record"""
+    tile_start = int(chunk["tile_start"])
+    emitter_start = int(chunk["emitter_start"])
+
+    return {b"TILE": arrays[b"TILE"][tile_start:tile_start + int(chunk["tile_count"])],
+            b"EMIT": arrays[b"EMIT"][emitter_start:emitter_start + int(chunk["emitter_count"])]}
+
+
+def tiles_to_array(tiles):
+    """return tile_dtype array of Tile objects"""
+    array = np.zeros(len(tiles), dtype=tile_dtype)
+
+    if tiles:
+        for name, attribute in (("x", "x"), ("y", "y"), ("rot", "rot"), ("shape", "shape"), ("style", "style"),
+                                ("outline", "has_outline"), ("colour", "colour"), ("outline_colour", "outline_colour")):
+            array[name] = [getattr(tile, attribute) for tile in tiles]
+
+    return array
+
+
+def emitters_to_array(emitters):
+    """return emitter_dtype array of PointEmitter objects"""
+    array = np.zeros(len(emitters), dtype=emitter_dtype)
+
+    if emitters:
+        for name, attribute in (("x", "x"), ("y", "y"), ("direction", "direction"), ("max_particles", "max_particles"),
+                                ("emit_speed", "emit_speed"), ("spread", "spread"), ("image_id", "particle_image_id"),
+                                ("vel", "particle_vel"), ("vel_rand", "particle_vel_rand"),
+                                ("rot_vel", "particle_rot_vel"), ("rot_vel_rand", "particle_rot_vel_rand"),
+                                ("size", "particle_size"), ("size_rand", "particle_size_rand"),
+                                ("lifetime", "particle_lifetime"), ("lifetime_rand", "particle_lifetime_rand"),
+                                ("colour", "particle_colour"), ("drag", "particle_drag")):
+            array[name] = [getattr(emitter, attribute) for emitter in emitters]
+
+    return array
+
+
+def records_to_arrays(records):
+    """return (tiles, emitters) structured arrays of TileRecords and EmitterRecords,
+    emitter parameters not in a record get PointEmitter's defaults"""
+    tiles = [record for record in records if isinstance(record, TileRecord)]
+    emitters = [record for record in records if isinstance(record, EmitterRecord)]
+
+    tile_array = np.zeros(len(tiles), dtype=tile_dtype)
+
+    for i, tile in enumerate(tiles):
+        tile_array[i] = (tile.x, tile.y, tile.rot, tile.shape, tile.style, tile.outline, tile.colour,
+                         tile.outline_colour, 0)
+
+    emitter_array = np.zeros(len(emitters), dtype=emitter_dtype)
+
+    for i, emitter in enumerate(emitters):
+        params = dict(emitter_defaults, **emitter.params)
+        emitter_array[i] = tuple([emitter.x, emitter.y] + [params[name] for name in emitter_dtype.names[2:]])
+
+    return tile_array, emitter_array
+
+
+def upgrade(data):
+    """return a version 1 level file (bytes) converted to version 2"""
+    header = read_header(data)
+
+    if header.version != 1:
+        raise ValueError("Only version 1 levels can be upgraded! (version {})".format(header.version))
+
+    return encode_v2(header, *records_to_arrays(list(iter_records(data))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="upgrade a version 1 level file to version 2")
+    parser.add_argument("file")
+    parser.add_argument("--out", help="file to write, the input file is overwritten if not given")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as file:
+        data = upgrade(file.read())
+
+    with open(args.out if args.out is not None else args.file, "wb") as file:
+        file.write(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""load levels without blocking the window. the file is read and decoded into records on a worker thread, which
+never touches pyglet. objects (sprites, vertex lists) are created from the records on the main thread through the
+pyglet clock, a few milliseconds worth every frame, so the window keeps drawing at full frame rate. collision data of
+the created tiles is built (or read from the level cache) and cached on the worker thread again"""
+import gc
+import queue
+import threading
+from time import perf_counter
+import pyglet as pgl
+from .grid import EdgeGrid, SpatialHash
+from . import level_cache, level_format
+
+
+class LevelLoader:
+    def __init__(self, level, path, on_progress = None, time_slice = 0.005):
+        """loads the level file at path into level, see Level.load_async"""
+        self._level = level
+        self._path = path
+        self._on_progress = on_progress
+        self.time_slice = time_slice
+
+        self.created = 0
+        self.total = None
+        self._records = None
+        # level cache key and Snapshot (None if it wasn't cached) of the file, BakedHitbox of each record (None for
+        # emitters)
+        self._key = None
+        self._snapshot = None
+        self._hitboxes = []
+
+        # the worker puts (header, records, hitboxes), then (tile hash, edge grid) of the created tiles, or the error it raised
+        self._results = queue.Queue()
+        self._indexing = False
+        self._cancelled = threading.Event()
+        # if garbage collection was on before the load, see start
+        self._collecting = False
+        self._thread = threading.Thread(target=self.__decode__, name="level loader", daemon=True)
+
+    def __str__(self):
+        return "LevelLoader of {} ({} / {} objects)".format(self._path, self.created, self.total)
+
+    def start(self):
+        # a garbage collection walks every object created so far, which takes many frames' worth of time once there are
+        # thousands of records and tiles (on either thread, the other waits for it), so there are none while loading
+        self._collecting = gc.isenabled()
+        gc.disable()
+        self._thread.start()
+        pgl.clock.schedule(self.update)
+
+    def __resume_collection__(self):
+        """turn garbage collection back on after loading. everything made while loading is moved straight to the oldest
+        generation (freeze then unfreeze), so the first collections don't walk it all again"""
+        gc.freeze()
+        gc.unfreeze()
+
+        if self._collecting:
+            self._collecting = False
+            gc.enable()
+
+    def __decode__(self):
+        """worker thread: read and decode the whole file, then wait for the objects to index"""
+        try:
+            with open(self._path, "rb") as file:
+                data = file.read()
+
+            self._key = self._level.cache_key(data)
+            self._snapshot = self._level.get_cache().get(self._key) if self._key is not None else None
+
+            if self._snapshot is not None:
+                header = self._snapshot.header
+                records = level_format.iter_v2_records(self._snapshot.arrays)
+                hitboxes = level_cache.baked_hitboxes(self._snapshot)
+            else:
+                header, records, _ = self._level.decode(data)
+                hitboxes = None
+
+            decoded = []
+
+            for record in records:
+                if self._cancelled.is_set():
+                    return
+
+                decoded.append(record)
+
+            # tile hitboxes are baked here too, all at once
+            self._results.put((header, decoded, self._level.bake(decoded, hitboxes)))
+
+        except Exception as error:
+            self._results.put(error)
+
+    def _build_index(self, header, tiles, emitters):
+        """worker thread: build the broadphase and edge grid of the created tiles, or read them from the snapshot,
+        and cache the level. it only reads the LevelHeader, tiles and emitters it is given, never the level"""
+        try:
+            if self._snapshot is not None:
+                self._results.put(self._level.snapshot_collision(self._snapshot, tiles))
+                return
+
+            tile_hash = SpatialHash()
+
+            for tile in tiles:
+                tile_hash.add(tile.hitbox)
+
+            edge_grid = EdgeGrid.from_tiles(tiles)
+
+            if self._key is not None and not self._cancelled.is_set():
+                self._level.store(self._key, header, tiles, emitters, tile_hash, edge_grid)
+
+            self._results.put((tile_hash, edge_grid))
+
+        except Exception as error:
+            self._results.put(error)
+
+    def __result__(self):
+        """return what the worker put, or None if it isn't done yet"""
+        try:
+            result = self._results.get_nowait()
+        except queue.Empty:
+            return None
+
+        if isinstance(result, Exception):
+            self.cancel()
+            raise result
+
+        return result
+
+    def update(self, dt = 0):
+        """create objects for at most time_slice seconds, finish the load once every object is created and indexed"""
+        if self._indexing:
+            collision = self.__result__()
+
+            if collision is not None:
+                pgl.clock.unschedule(self.update)
+                self.__resume_collection__()
+                self._level.finish_load(collision)
+
+            return
+
+        # collection is off and update is scheduled until the load ends, an object that can't be made (e.g. a missing
+        # image) ends it too
+        try:
+            self.__create__()
+        except Exception:
+            self.cancel()
+            raise
+
+    def __create__(self):
+        """create the player, then objects for at most time_slice seconds, and start indexing once all are created"""
+        if self._records is None:
+            decoded = self.__result__()
+
+            if decoded is None:
+                return
+
+            header, self._records, self._hitboxes = decoded
+            self.total = len(self._records)
+            self._level.create_player(header)
+
+        end = perf_counter() + self.time_slice
+
+        while self.created < self.total and perf_counter() < end:
+            self._level.create_element(self._records[self.created], self._hitboxes[self.created])
+            self.created += 1
+
+        if self._on_progress is not None:
+            self._on_progress(self.created, self.total)
+
+        if self.created == self.total:
+            self._records = None
+            self._indexing = True
+            # the worker gets its own lists, cancel / unload reset the level's while it runs
+            self._thread = threading.Thread(target=self._build_index, args=self._level.get_contents(),
+                                            name="level indexer", daemon=True)
+            self._thread.start()
+
+    def get_progress(self):
+        """return fraction (0 - 1) of objects created, 0 while the file is still being decoded"""
+        if not self.total:
+            return 1 if self.total == 0 else 0
+
+        return self.created / self.total
+
+    def cancel(self):
+        """stop loading and delete what was created so far, the level is left unloaded"""
+        self._cancelled.set()
+        pgl.clock.unschedule(self.update)
+        self.__resume_collection__()
+        self._records = None
+        self._indexing = False
+
+        if self._level.is_loading():
+            self._level.cancel_load()
@@ -1,7 +1,8 @@
 from math import cos, sin, pi
-from random import randrange
-from time import time
+import numpy as np
 import pyglet as pgl
+from .timestep import base_rate
+from . import render
 
 
 class Particle:
@@ -14,16 +15,17 @@ class Particle:
         self._vel_y = vel[1]
         self._drag = drag
 
-        self.age = time()
+        # seconds of simulation time the particle has been alive for
+        self.age = 0
         self.lifetime = lifetime
 
         # sprite stuff
-        self._image = pgl.resource.image(image)
+        self._image = render.image(image)
         self._image.center_x = self._image.width // 2
         self._image.center_y = self._image.height // 2
         self._image.anchor_x = self._image.width // 2
         self._image.anchor_y = self._image.height // 2
-        self._sprite = pgl.sprite.Sprite(img=self._image, x=self._x, y=self._y, batch=batch, group=group)
+        self._sprite = render.sprite(self._image, self._x, self._y, batch, group)
         self._sprite.scale = size / 10
         self._sprite.color = colour
 
@@ -32,7 +34,31 @@ class Particle:
         self._debug_vertex_list = None
 
     def __str__(self):
-        return "Particle ({:.3f}, {:.3f}), vel = ({:.3f}, {:.3f}), rotation vel = {:.3f}, age = ({:.3f} / {})".format(self._x, self._y, self._vel_x, self._vel_y, self._rot_vel, time() - self.age, self.lifetime)
+        return "Particle ({:.3f}, {:.3f}), vel = ({:.3f}, {:.3f}), rotation vel = {:.3f}, age = ({:.3f} / {})".format(self._x, self._y, self._vel_x, self._vel_y, self._rot_vel, self.age, self.lifetime)
+
+    def reset(self, pos, rot_vel, vel, drag, lifetime, size, colour = (255, 255, 255)):
+        """reuse particle with new parameters, show it again if it was hidden"""
+        self._x = pos[0]
+        self._y = pos[1]
+        self.rot = 0
+        self._rot_vel = rot_vel
+        self._vel_x = vel[0]
+        self._vel_y = vel[1]
+        self._drag = drag
+
+        self.age = 0
+        self.lifetime = lifetime
+
+        self._sprite.update(x=self._x, y=self._y, rotation=0, scale=size / 10)
+        self._sprite.color = colour
+        self._sprite.visible = True
+
+    def hide(self):
+        """stop drawing particle so it can be kept in a pool"""
+        self._sprite.visible = False
+
+        if self.debug:
+            self.debug_disable()
 
     def kill(self):
         """remove particle"""
@@ -48,8 +74,9 @@ class Particle:
         self._x += self._vel_x * dt
         self._y += self._vel_y * dt
         self.rot += self._rot_vel * dt
+        self.age += dt
 
-        self.__drag__()
+        self.__drag__(dt)
 
         self._sprite.x = self._x
         self._sprite.y = self._y
@@ -61,10 +88,11 @@ class Particle:
             self._debug_vertex_list[1].vertices = [self._x, self._y, self._x + self._vel_x * 0.1,
                                                    self._y + self._vel_y * 0.1]
 
-    def __drag__(self):
+    def __drag__(self, dt):
         """gradually slow velocity"""
-        self._vel_x *= self._drag
-        self._vel_y *= self._drag
+        drag = self._drag ** (dt * base_rate)
+        self._vel_x *= drag
+        self._vel_y *= drag
 
     def debug_enable(self, batch, group=None):
         """enable drawing of rotation and velocity vectors"""
@@ -89,9 +117,246 @@ class Particle:
         self._debug_vertex_list = None
 
 
+class Pool:
+    """free list of pre-built objects, counts how many requests were served from the list (hits) or not (misses)"""
+    def __init__(self, factory, size = 0):
+        self._factory = factory
+        self._free = []
+        self._built = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self.reserve(size)
+
+    def __str__(self):
+        return "Pool ({} free / {} built), hits = {}, misses = {}".format(len(self._free), self._built, self.hits, self.misses)
+
+    def reserve(self, size):
+        """build objects until at least size objects exist"""
+        while self._built < size:
+            self._free.append(self._factory())
+            self._built += 1
+
+    def acquire(self):
+        """take an object from the free list, build a new one if it is empty"""
+        if self._free:
+            self.hits += 1
+            return self._free.pop()
+
+        self.misses += 1
+        self._built += 1
+        return self._factory()
+
+    def release(self, item):
+        """return object to the free list"""
+        self._free.append(item)
+
+    def clear(self, destroy):
+        """call destroy on every free object and forget them"""
+        for item in self._free:
+            destroy(item)
+
+        self._built -= len(self._free)
+        self._free = []
+
+
+class ParticleArrays:
+    """state of every live particle of an emitter, stored as one contiguous array per attribute.
+    live particles are always packed into the first `count` slots"""
+    fields = ("x", "y", "vel_x", "vel_y", "rot", "rot_vel", "size", "age", "lifetime")
+
+    def __init__(self, capacity = 16, buffer = None):
+        """if buffer is given the arrays are views into it (len(fields) * capacity float64s) and can't grow,
+        particles that don't fit are not spawned"""
+        self.count = 0
+        self.capacity = 0
+        self._fixed = buffer is not None
+
+        if self._fixed:
+            arrays = np.ndarray((len(self.fields), capacity), dtype=np.float64, buffer=buffer)
+
+            for name, array in zip(self.fields, arrays):
+                setattr(self, name, array)
+
+            self.capacity = capacity
+
+        else:
+            for name in self.fields:
+                setattr(self, name, np.zeros(0, dtype=np.float64))
+
+            self.__grow__(max(capacity, 1))
+
+    def __str__(self):
+        return "ParticleArrays ({} / {})".format(self.count, self.capacity)
+
+    def __grow__(self, capacity):
+        """reallocate arrays with room for at least capacity particles, keeping live particles"""
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=np.float64)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+        self.capacity = capacity
+
+    def spawn(self, x, y, vel_x, vel_y, rot_vel, size, lifetime):
+        """append len(vel_x) particles, other values can be arrays of the same length or single values.
+        return the slice of slots they were written to"""
+        n = len(vel_x)
+
+        if self._fixed and self.count + n > self.capacity:
+            n = self.capacity - self.count
+            x, y, vel_x, vel_y, rot_vel, size, lifetime = (value[:n] if isinstance(value, np.ndarray) else value
+                                                           for value in (x, y, vel_x, vel_y, rot_vel, size, lifetime))
+
+        elif self.count + n > self.capacity:
+            capacity = self.capacity
+
+            while capacity < self.count + n:
+                capacity *= 2
+
+            self.__grow__(capacity)
+
+        new = slice(self.count, self.count + n)
+        self.x[new] = x
+        self.y[new] = y
+        self.vel_x[new] = vel_x
+        self.vel_y[new] = vel_y
+        self.rot[new] = 0
+        self.rot_vel[new] = rot_vel
+        self.size[new] = size
+        self.age[new] = 0
+        self.lifetime[new] = lifetime
+        self.count += n
+
+        return new
+
+    def step(self, dt, drag):
+        """move, rotate, age and slow every live particle, drag is the velocity kept per 1 / base_rate seconds"""
+        n = self.count
+        vel_x = self.vel_x[:n]
+        vel_y = self.vel_y[:n]
+
+        self.x[:n] += vel_x * dt
+        self.y[:n] += vel_y * dt
+        self.rot[:n] += self.rot_vel[:n] * dt
+        self.age[:n] += dt
+
+        if drag != 1:
+            drag **= dt * base_rate
+            vel_x *= drag
+            vel_y *= drag
+
+    def retire(self):
+        """drop particles older than their lifetime, return boolean mask of survivors (or None if all survived)"""
+        n = self.count
+        alive = self.age[:n] <= self.lifetime[:n]
+        survivors = int(np.count_nonzero(alive))
+
+        if survivors == n:
+            return None
+
+        for name in self.fields:
+            array = getattr(self, name)
+            array[:survivors] = array[:n][alive]
+
+        self.count = survivors
+
+        return alive
+
+    def clear(self):
+        self.count = 0
+
+
+class QuadRenderer:
+    """draws all particles of an emitter as one growable list of textured quads in the batch"""
+    def __init__(self, image, batch, group=None):
+        self._texture = image.get_texture()
+        self._group = pgl.sprite.SpriteGroup(self._texture, pgl.gl.GL_SRC_ALPHA, pgl.gl.GL_ONE_MINUS_SRC_ALPHA, group)
+        self._batch = batch
+
+        # corners of the image relative to its anchor, in the same order pyglet sprites use
+        x1 = -image.anchor_x
+        y1 = -image.anchor_y
+        x2 = x1 + image.width
+        y2 = y1 + image.height
+        self._corners_x = np.array([x1, x2, x2, x1], dtype=np.float64)
+        self._corners_y = np.array([y1, y1, y2, y2], dtype=np.float64)
+
+        self._capacity = 0
+        self._vertex_list = None
+        self._vertices = None
+        self._colours = None
+
+    def __resize__(self, capacity):
+        """grow vertex list and write buffers to fit capacity quads"""
+        tex_coords = list(self._texture.tex_coords) * capacity
+
+        if self._vertex_list is None:
+            self._vertex_list = self._batch.add(capacity * 4, pgl.gl.GL_QUADS, self._group, 'v2f/stream',
+                                                'c4B/stream', ('t3f/static', tex_coords))
+        else:
+            self._vertex_list.resize(capacity * 4)
+            self._vertex_list.tex_coords[:] = tex_coords
+
+        self._vertices = np.zeros((capacity, 4, 2), dtype=np.float64)
+        self._colours = np.zeros((capacity, 4, 4), dtype=np.uint8)
+        self._capacity = capacity
+
+    def update(self, arrays, colour):
+        """rewrite corners and colours of every quad from the particle arrays, unused quads are collapsed"""
+        if arrays.capacity > self._capacity:
+            self.__resize__(arrays.capacity)
+
+        n = arrays.count
+        scale = arrays.size[:n, None] / 10
+        angle = np.radians(-arrays.rot[:n])[:, None]
+        cos_r = np.cos(angle)
+        sin_r = np.sin(angle)
+        local_x = self._corners_x * scale
+        local_y = self._corners_y * scale
+
+        self._vertices[:n, :, 0] = local_x * cos_r - local_y * sin_r + arrays.x[:n, None]
+        self._vertices[:n, :, 1] = local_x * sin_r + local_y * cos_r + arrays.y[:n, None]
+        self._vertices[n:] = 0
+
+        self._colours[:n, :, :3] = colour
+        self._colours[:n, :, 3] = 255
+        self._colours[n:] = 0
+
+        self._vertex_list.vertices[:] = self._vertices.ravel().tolist()
+        self._vertex_list.colors[:] = self._colours.ravel().tolist()
+
+    def delete(self):
+        if self._vertex_list is not None:
+            self._vertex_list.delete()
+            self._vertex_list = None
+
+
 class PointEmitter:
-    def __init__(self, pos, direction = 0, max_particles = 10, emit_speed = 1, spread = 360, image_id = 1, vel = 10, vel_rand = 0, rot_vel = 0, rot_vel_rand = 0, size = 10, size_rand = 0, lifetime = 1, lifetime_rand = 0, colour = (255, 255, 255), drag = 1, batch = None, group = None):
-        """rotation related items are in degrees! - rot_vel, rot_vel_rand, direction, spread"""
+    def __init__(self, pos, direction = 0, max_particles = 10, emit_speed = 1, spread = 360, image_id = 1, vel = 10, vel_rand = 0, rot_vel = 0, rot_vel_rand = 0, size = 10, size_rand = 0, lifetime = 1, lifetime_rand = 0, colour = (255, 255, 255), drag = 1, backend = "array", render_mode = "sprites", priority = 1, seed = None, collide = False, restitution = 0.5, batch = None, group = None):
+        """rotation related items are in degrees! - rot_vel, rot_vel_rand, direction, spread
+        priority (> 0) decides how much this emitter is cut back when the level particle budget runs out, higher is cut less
+        seed is passed to the emitter's random generator, emitters with the same seed and inputs emit the same particles
+        backend is either 'array' (particle state in numpy arrays, updated in bulk) or 'object' (one Particle per particle)
+        render_mode is either 'sprites' (one sprite per particle) or 'quads' (one vertex list for all particles, array backend only)
+        collide makes particles bounce off the level's tile edges (array backend only), keeping restitution of their speed into the edge"""
+        if backend not in ("array", "object"):
+            raise ValueError("{} is invalid for backend! (must be 'array' or 'object')".format(backend))
+
+        if render_mode not in ("sprites", "quads"):
+            raise ValueError("{} is invalid for render_mode! (must be 'sprites' or 'quads')".format(render_mode))
+
+        if render_mode == "quads" and backend != "array":
+            raise ValueError("render_mode 'quads' needs the 'array' backend!")
+
+        if priority <= 0:
+            raise ValueError("Priority must be above 0! ({})".format(priority))
+
+        if collide and backend != "array":
+            raise ValueError("Particle collision needs the 'array' backend!")
+
         # emitter parameters
         self.x = pos[0]
         self.y = pos[1]
@@ -120,50 +385,277 @@ class PointEmitter:
         self._debug = False
         self._debug_vertex_list = None
         self._debug_group = None
-        self._time_since_emit = 0
+        self._debug_particle_lines = None
+        self._emit_accumulator = 0
+        self._full_accumulator = 0
+        self._random = np.random.default_rng(seed)
+        self._backend = backend
+
+        # set by the level particle budget, scales emit speed and max particles
+        self.priority = priority
+        self._quality = 1
+        self._cut = 0
         self._particles = []
 
-    def update(self, dt):
-        self._time_since_emit += dt
+        # array backend state, sprites are kept in the same order as the particle slots
+        self._render_mode = render_mode
+        self._arrays = None
+        self._sprites = []
+        self._image = None
+        self._renderer = None
+        self._pool = None
+
+        # set when particles are stepped by a ParticleWorker, see attach_worker
+        self._worker = None
+        self._worker_slot = None
+        self._snapshot = None
+
+        # EdgeGrid of the level, set by the level once tiles are loaded
+        self.collide = collide
+        self.restitution = restitution
+        self._grid = None
+
+        if backend == "array":
+            self._arrays = ParticleArrays(max(max_particles, 1))
+
+        # dead particles / sprites are hidden and kept here instead of being deleted
+        if render_mode == "quads":
+            self._renderer = QuadRenderer(self.__get_image__(), batch, group)
+        elif backend == "array":
+            self._pool = Pool(self.__new_sprite__, max_particles)
+        else:
+            self._pool = Pool(self.__new_particle__, max_particles)
 
-        if self._time_since_emit > 1 / self.emit_speed and len(self._particles) < self.max_particles:
-            self._particles.append(self.__emit__())
-            self._time_since_emit = 0
-
-        for particle in self._particles:
+    def update(self, dt):
+        if self.is_sleeping():
+            return
+
+        count = self.get_particle_count()
+
+        # particles due this frame at full quality and at the quality set by the budget, fractions carry over
+        self._full_accumulator, full = self.__due__(self._full_accumulator + dt * self.emit_speed,
+                                                    self.max_particles - count)
+        self._emit_accumulator, scaled = self.__due__(self._emit_accumulator + dt * self.emit_speed * self._quality,
+                                                      int(self.max_particles * self._quality) - count)
+        self._cut += max(full - scaled, 0)
+
+        spawn = None
+
+        if scaled > 0:
+            if self._worker is not None:
+                spawn = self.__spawn_values__(scaled)
+            elif self._backend == "array":
+                self.__emit_array__(scaled)
+            else:
+                self._particles.extend(self.__emit__(scaled))
+
+        if self._worker is not None:
+            self._worker.submit(self._worker_slot, dt, self.particle_drag, spawn)
+            self._renderer.update(self._snapshot.read(), self.particle_colour)
+        elif self._backend == "array":
+            self.__update_arrays__(dt)
+        else:
+            self.__update_objects__(dt)
+
+    def advance(self, dt):
+        """only age particles and drop dead ones, without moving, emitting or drawing (for emitters out of view)"""
+        if self._worker is not None:
+            # the worker always does a full step, it costs this process nothing
+            self._worker.submit(self._worker_slot, dt, self.particle_drag)
+            self._snapshot.read()
+
+        elif self._backend == "array":
+            self._arrays.age[:self._arrays.count] += dt
+            alive = self._arrays.retire()
+
+            if self._renderer is None:
+                self.__update_sprites__(alive)
+
+        else:
+            particles = self._particles
+            alive = 0
+
+            for particle in particles:
+                particle.age += dt
+
+                if particle.age > particle.lifetime:
+                    particle.hide()
+                    self._pool.release(particle)
+                else:
+                    particles[alive] = particle
+                    alive += 1
+
+            del particles[alive:]
+
+    def is_sleeping(self):
+        """True if there are no particles alive and none will be emitted"""
+        if self.get_particle_count() > 0:
+            return False
+
+        return self.emit_speed * self._quality <= 0 or int(self.max_particles * self._quality) <= 0
+
+    def get_bounds(self):
+        """return (min x, min y, max x, max y) of the region particles can reach from the current position"""
+        vel = abs(self.particle_vel) + self.particle_vel_rand / 2
+        lifetime = self.particle_lifetime + self.particle_lifetime_rand / 2
+        reach = vel * lifetime + self.particle_size + self.particle_size_rand / 10
+
+        return self.x - reach, self.y - reach, self.x + reach, self.y + reach
+
+    def __due__(self, total, room):
+        """take the whole particles (up to room) out of an emission accumulator, return (what is left, particles due)"""
+        due = int(total)
+
+        if due >= room:
+            # don't build up a backlog while the emitter is full
+            due = max(room, 0)
+            total = min(total, due + 1)
+
+        return total - due, due
+
+    def __update_objects__(self, dt):
+        """step every Particle object individually, compact survivors to the front of the list in the same pass"""
+        particles = self._particles
+        alive = 0
+
+        for particle in particles:
             particle.update(dt)
 
-            if time() - particle.age > particle.lifetime:
-                particle.kill()
-                self._particles.remove(particle)
+            if particle.age > particle.lifetime:
+                particle.hide()
+                self._pool.release(particle)
+            else:
+                particles[alive] = particle
+                alive += 1
+
+        del particles[alive:]
 
         if self._debug:
             for particle in self._particles:
                 if not particle.debug:
                     particle.debug_enable(self._batch, self._debug_group)
 
-    def __emit__(self):
-        """create new particle with randomised parameters within range of limits"""
-        rot_vel = self.particle_rot_vel
-        if self.particle_rot_vel_rand != 0: rot_vel += randrange(-self.particle_rot_vel_rand // 2, self.particle_rot_vel_rand // 2)
+    def __update_arrays__(self, dt):
+        """step every particle in a few bulk array operations, then push the new state to the renderer / sprites"""
+        arrays = self._arrays
+
+        if self.collide and self._grid is not None:
+            old_x = arrays.x[:arrays.count].copy()
+            old_y = arrays.y[:arrays.count].copy()
+            arrays.step(dt, self.particle_drag)
+            self._grid.collide(arrays, old_x, old_y, self.restitution)
+        else:
+            arrays.step(dt, self.particle_drag)
+
+        alive = arrays.retire()
+
+        if self._renderer is not None:
+            self._renderer.update(arrays, self.particle_colour)
+        else:
+            self.__update_sprites__(alive)
+
+        if self._debug:
+            self.__update_debug_arrays__()
+
+    def __update_sprites__(self, alive):
+        """return sprites of retired particles to the pool, move the rest to their particle"""
+        arrays = self._arrays
+
+        if alive is not None:
+            sprites = []
+
+            for sprite, is_alive in zip(self._sprites, alive):
+                if is_alive:
+                    sprites.append(sprite)
+                else:
+                    sprite.visible = False
+                    self._pool.release(sprite)
+
+            self._sprites = sprites
+
+        n = arrays.count
+        for sprite, x, y, rot in zip(self._sprites, arrays.x[:n].tolist(), arrays.y[:n].tolist(), arrays.rot[:n].tolist()):
+            sprite.update(x=x, y=y, rotation=rot)
+
+    def __spawn_values__(self, n):
+        """arguments for ParticleArrays.spawn to add n particles with randomised parameters"""
+        rot_vel, vel_x, vel_y, lifetime, size = self.__randomise__(n)
+
+        return self.x, self.y, vel_x, vel_y, rot_vel, size, lifetime
+
+    def __emit_array__(self, n):
+        """add n particles with randomised parameters to the particle arrays"""
+        spawn = self.__spawn_values__(n)
+        size = spawn[5]
+
+        self._arrays.spawn(*spawn)
+
+        if self._renderer is not None:
+            return
+
+        for scale in (size / 10).tolist():
+            sprite = self._pool.acquire()
+            sprite.update(x=self.x, y=self.y, rotation=0, scale=scale)
+            sprite.color = self.particle_colour
+            sprite.visible = True
+            self._sprites.append(sprite)
+
+    def __emit__(self, n):
+        """take n particles from the pool and give them randomised parameters within range of limits"""
+        particles = []
+        values = zip(*(array.tolist() for array in self.__randomise__(n)))
+
+        for rot_vel, vel_x, vel_y, lifetime, size in values:
+            particle = self._pool.acquire()
+            particle.reset((self.x, self.y), rot_vel, (vel_x, vel_y), self.particle_drag, lifetime, size, self.particle_colour)
+            particles.append(particle)
+
+        return particles
 
-        vel = self.particle_vel
-        if self.particle_vel_rand != 0: vel += randrange(-self.particle_vel_rand // 2, self.particle_vel_rand // 2)
+    def __get_image__(self):
+        """load particle image centred on its anchor, once per emitter"""
+        if self._image is None:
+            self._image = render.image(self.particle_image)
+            self._image.anchor_x = self._image.width // 2
+            self._image.anchor_y = self._image.height // 2
 
-        lifetime = self.particle_lifetime
-        if self.particle_lifetime_rand != 0: lifetime += randrange(((-self.particle_lifetime_rand * 1000) // 2), ((self.particle_lifetime_rand * 1000) // 2)) / 1000
+        return self._image
 
-        direction = self.direction
-        if self.spread != 0: direction += randrange(-self.spread // 2, self.spread // 2)
-        direction = (cos(direction * pi / 180) * vel, -sin(direction * pi / 180) * vel)
+    def __new_sprite__(self):
+        """build a hidden sprite for the pool"""
+        sprite = render.sprite(self.__get_image__(), self.x, self.y, self._batch, self._group)
+        sprite.visible = False
 
-        size = self.particle_size / 10
-        if self.particle_size_rand != 0: size += randrange(-self.particle_size_rand // 2, self.particle_size_rand // 2) / 100
+        return sprite
 
-        particle = Particle((self.x, self.y), rot_vel, direction, self.particle_drag, lifetime, self.particle_image, size, self.particle_colour, self._batch, self._group)
+    def __new_particle__(self):
+        """build a hidden particle for the pool"""
+        particle = Particle((self.x, self.y), 0, (0, 0), self.particle_drag, 0, self.particle_image, self.particle_size, self.particle_colour, self._batch, self._group)
+        particle.hide()
 
         return particle
 
+    def __randomise__(self, n):
+        """pick rotation velocities, velocities, lifetimes and sizes of n new particles within range of limits,
+        return as arrays (rot_vel, vel_x, vel_y, lifetime, size)"""
+        rot_vel = self.particle_rot_vel + self.__random_offsets__(self.particle_rot_vel_rand, n)
+        vel = self.particle_vel + self.__random_offsets__(self.particle_vel_rand, n)
+        lifetime = self.particle_lifetime + self.__random_offsets__(int(self.particle_lifetime_rand * 1000), n) / 1000
+        size = self.particle_size / 10 + self.__random_offsets__(self.particle_size_rand, n) / 100
+
+        direction = np.radians(self.direction + self.__random_offsets__(self.spread, n))
+        vel_x = np.cos(direction) * vel
+        vel_y = -np.sin(direction) * vel
+
+        return rot_vel, vel_x, vel_y, lifetime, size
+
+    def __random_offsets__(self, spread, n):
+        """n random whole numbers from -spread / 2 up to (not including) spread / 2, all 0 if there is no spread"""
+        if spread == 0:
+            return np.zeros(n)
+
+        return self._random.integers(-spread // 2, spread // 2, size=n)
+
     def set_pos(self, x, y, direction = None):
         """set positon, rotation from which particles are emitted"""
         self.x = x
@@ -186,7 +678,11 @@ class PointEmitter:
     def set_intensity(self, vel = None, vel_rand = None, rot_vel = None, rot_vel_rand = None, emit_speed = None, size = None, size_rand = None, spread = None, max_particles = None, lifetime = None, lifetime_rand = None, colour = None, drag = None):
         """change parameters related to intensity of particles emitted"""
         # emitter parameters
-        if max_particles is not None: self.max_particles = max_particles
+        if max_particles is not None:
+            self.max_particles = max_particles
+
+            if self._pool is not None:
+                self._pool.reserve(max_particles)
         if emit_speed is not None: self.emit_speed = emit_speed
         if spread is not None: self.spread = spread
 
@@ -224,6 +720,37 @@ class PointEmitter:
 
         self._debug_vertex_list = [angle1, angle2, direction]
 
+        if self._backend == "array":
+            # rotation and velocity vectors of every particle share one vertex list
+            self._debug_particle_lines = batch.add(0, pgl.gl.GL_LINES, group, 'v2f/stream', 'c3B/stream')
+            self.__update_debug_arrays__()
+
+    def __update_debug_arrays__(self):
+        """rewrite rotation and velocity vectors of all particles in one go"""
+        arrays = self._arrays
+        n = arrays.count
+        x = arrays.x[:n]
+        y = arrays.y[:n]
+        rot = arrays.rot[:n] * pi / 180
+
+        lines = np.empty((n, 2, 4), dtype=np.float64)
+        lines[:, 0, 0] = x
+        lines[:, 0, 1] = y
+        lines[:, 0, 2] = x + np.cos(rot) * 30
+        lines[:, 0, 3] = y - np.sin(rot) * 30
+        lines[:, 1, 0] = x
+        lines[:, 1, 1] = y
+        lines[:, 1, 2] = x + arrays.vel_x[:n] * 0.1
+        lines[:, 1, 3] = y + arrays.vel_y[:n] * 0.1
+
+        colours = np.tile(np.array([0, 255, 0, 0, 100, 0, 255, 0, 0, 100, 0, 0], dtype=np.uint8), n)
+
+        if self._debug_particle_lines.get_size() != n * 4:
+            self._debug_particle_lines.resize(n * 4)
+
+        self._debug_particle_lines.vertices[:] = lines.ravel().tolist()
+        self._debug_particle_lines.colors[:] = colours.tolist()
+
     def debug_disable(self):
         """disable drawing of debug vectors"""
         self._debug = False
@@ -236,10 +763,91 @@ class PointEmitter:
         for particle in self._particles:
             particle.debug_disable()
 
+        if self._debug_particle_lines is not None:
+            self._debug_particle_lines.delete()
+            self._debug_particle_lines = None
+
+    def set_collision_grid(self, grid):
+        """set EdgeGrid particles collide with, if collide is on"""
+        self._grid = grid
+
+    def attach_worker(self, worker):
+        """let worker (a ParticleWorker) step this emitter's particles, only the particle positions are read back here.
+        it has room for max_particles, needs the array backend and quads render mode"""
+        if self._backend != "array" or self._render_mode != "quads":
+            raise ValueError("Only emitters with the 'array' backend and 'quads' render mode can use a worker!")
+
+        if self.collide:
+            raise ValueError("Colliding emitters can't use a worker!")
+
+        self.detach_worker()
+        self._arrays.clear()
+        self._worker = worker
+        self._worker_slot, self._snapshot = worker.attach(max(self.max_particles, 1))
+
+    def detach_worker(self):
+        """step particles in this process again, particles stepped by the worker are lost"""
+        if self._worker is not None:
+            # drop views into the worker's memory before it is freed
+            self._snapshot = None
+            self._worker.detach(self._worker_slot)
+            self._worker = None
+            self._worker_slot = None
+
     def get_particle_count(self):
         """return amount of particles current alive in system"""
+        if self._worker is not None:
+            return self._snapshot.count
+
+        if self._backend == "array":
+            return self._arrays.count
+
         return len(self._particles)
 
+    def set_quality(self, scale):
+        """scale emit speed and max particles by scale (0 - 1), used by the level particle budget"""
+        self._quality = scale
+
+    def get_cut_count(self):
+        """return amount of particles that weren't emitted because quality was scaled down"""
+        return self._cut
+
+    def get_pool_hits(self):
+        """return amount of emitted particles that reused a pooled particle / sprite"""
+        if self._pool is None:
+            return 0
+
+        return self._pool.hits
+
+    def get_pool_misses(self):
+        """return amount of emitted particles that needed a new particle / sprite, because the pool was empty"""
+        if self._pool is None:
+            return 0
+
+        return self._pool.misses
+
     def delete(self):
+        self.detach_worker()
+
         for particle in self._particles:
             particle.kill()
+
+        for sprite in self._sprites:
+            sprite.delete()
+
+        self._particles = []
+        self._sprites = []
+
+        if self._renderer is not None:
+            self._renderer.delete()
+        elif self._backend == "array":
+            self._pool.clear(lambda sprite: sprite.delete())
+        else:
+            self._pool.clear(lambda particle: particle.kill())
+
+        if self._arrays is not None:
+            self._arrays.clear()
+
+        if self._debug_particle_lines is not None:
+            self._debug_particle_lines.delete()
+            self._debug_particle_lines = None
@@ -0,0 +1,208 @@
+import os
+import sys
+from multiprocessing import Pipe, Process, shared_memory, resource_tracker
+import numpy as np
+from .particle import ParticleArrays
+
+# particle attributes copied out for drawing, see QuadRenderer.update
+render_fields = ("x", "y", "rot", "size")
+
+
+def block_size(capacity):
+    """bytes needed for one emitter: state arrays, 2 render buffers and a header (front buffer, count of each buffer,
+    sequence number of the last tick that started writing a render buffer)"""
+    return (len(ParticleArrays.fields) * capacity + 2 * len(render_fields) * capacity + 4) * 8
+
+
+def split_block(buffer, capacity):
+    """return (state, render, header) float64 views into an emitter's block of memory"""
+    state_size = len(ParticleArrays.fields) * capacity
+    render_size = 2 * len(render_fields) * capacity
+
+    floats = np.ndarray(state_size + render_size + 4, dtype=np.float64, buffer=buffer)
+    render = floats[state_size:state_size + render_size].reshape(2, len(render_fields), capacity)
+    header = floats[state_size + render_size:]
+
+    return floats[:state_size], render, header
+
+
+class Simulation:
+    """steps the particles of one emitter inside a block of memory, the same code runs in the worker process and in sync mode"""
+    def __init__(self, buffer, capacity):
+        state, self._render, self._header = split_block(buffer, capacity)
+        self._arrays = ParticleArrays(capacity, buffer=state)
+
+    def tick(self, dt, drag, spawn):
+        """add spawned particles, move and retire them, then publish the result in the back render buffer"""
+        arrays = self._arrays
+
+        if spawn is not None:
+            arrays.spawn(*spawn)
+
+        arrays.step(dt, drag)
+        arrays.retire()
+
+        back = 1 - int(self._header[0])
+        n = arrays.count
+        # before writing, so a Snapshot copying the buffer this tick writes (the front one of the tick before last)
+        # sees it changed
+        self._header[3] += 1
+
+        for i, name in enumerate(render_fields):
+            self._render[back, i, :n] = getattr(arrays, name)[:n]
+
+        self._header[1 + back] = n
+        self._header[0] = back
+
+
+class Snapshot:
+    """copy of the front render buffer of an emitter, has the attributes QuadRenderer reads"""
+    def __init__(self, render, header, capacity):
+        self._render = render
+        self._header = header
+
+        self.capacity = capacity
+        self.count = 0
+
+        for name in render_fields:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+
+    def read(self):
+        """copy particles of the latest finished tick, again if a tick started writing while copying (the worker can
+        finish two while this copies, the second one writes the buffer being copied)"""
+        while True:
+            sequence = self._header[3]
+            front = int(self._header[0])
+            self.count = int(self._header[1 + front])
+
+            for i, name in enumerate(render_fields):
+                getattr(self, name)[:self.count] = self._render[front, i, :self.count]
+
+            if self._header[3] == sequence:
+                return self
+
+
+def attach_block(name):
+    """open the shared memory block name made by the main process, which is the only one to unlink it, so it isn't
+    tracked here (the resource tracker would unlink it when the worker exits)"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    block = shared_memory.SharedMemory(name=name)
+
+    # only posix blocks are tracked, under their name with the leading slash
+    if os.name == "posix":
+        resource_tracker.unregister("/" + block.name, "shared_memory")
+
+    return block
+
+
+def run_worker(connection):
+    """worker process main loop, handles messages sent by ParticleWorker"""
+    blocks = {}
+    simulations = {}
+
+    while True:
+        message = connection.recv()
+
+        if message[0] == "tick":
+            for slot, dt, drag, spawn in message[1]:
+                if slot in simulations:
+                    simulations[slot].tick(dt, drag, spawn)
+
+        elif message[0] == "attach":
+            slot, name, capacity = message[1:]
+            blocks[slot] = attach_block(name)
+            simulations[slot] = Simulation(blocks[slot].buf, capacity)
+
+        elif message[0] == "detach":
+            simulations.pop(message[1])
+            blocks.pop(message[1]).close()
+
+        elif message[0] == "close":
+            simulations.clear()
+
+            for block in blocks.values():
+                block.close()
+
+            break
+
+
+class ParticleWorker:
+    def __init__(self, mode = "process"):
+        """steps particles of attached emitters in a worker process ('process') over shared memory,
+        or in this process ('sync') with the same results, e.g. for headless tests"""
+        if mode not in ("process", "sync"):
+            raise ValueError("Mode '{}' is invalid! (should be 'process' or 'sync')".format(mode))
+
+        self._mode = mode
+        self._next_slot = 0
+        self._blocks = {}
+        self._simulations = {}
+        self._pending = []
+
+        self._connection = None
+        self._process = None
+
+        if mode == "process":
+            self._connection, child = Pipe()
+            self._process = Process(target=run_worker, args=(child,), daemon=True)
+            self._process.start()
+
+    def __str__(self):
+        return "ParticleWorker ({}, {} emitters)".format(self._mode, len(self._blocks))
+
+    def attach(self, capacity):
+        """reserve memory for an emitter with room for capacity particles, return (slot id, snapshot of its particles)"""
+        slot = self._next_slot
+        self._next_slot += 1
+
+        if self._mode == "process":
+            block = shared_memory.SharedMemory(create=True, size=block_size(capacity))
+            self._connection.send(("attach", slot, block.name, capacity))
+            buffer = block.buf
+        else:
+            block = bytearray(block_size(capacity))
+            self._simulations[slot] = Simulation(block, capacity)
+            buffer = block
+
+        self._blocks[slot] = block
+        _, render, header = split_block(buffer, capacity)
+
+        return slot, Snapshot(render, header, capacity)
+
+    def detach(self, slot):
+        """free an emitter's memory"""
+        self._pending = [item for item in self._pending if item[0] != slot]
+        block = self._blocks.pop(slot)
+
+        if self._mode == "process":
+            self._connection.send(("detach", slot))
+            block.close()
+            block.unlink()
+        else:
+            self._simulations.pop(slot)
+
+    def submit(self, slot, dt, drag, spawn = None):
+        """queue a tick of an emitter, spawn is a tuple of arguments for ParticleArrays.spawn"""
+        self._pending.append((slot, dt, drag, spawn))
+
+    def flush(self):
+        """run every queued tick, sent to the worker as one message so this never waits for it"""
+        if self._mode == "process":
+            self._connection.send(("tick", self._pending))
+        else:
+            for slot, dt, drag, spawn in self._pending:
+                self._simulations[slot].tick(dt, drag, spawn)
+
+        self._pending = []
+
+    def close(self):
+        """stop the worker process and free all memory"""
+        for slot in list(self._blocks.keys()):
+            self.detach(slot)
+
+        if self._process is not None:
+            self._connection.send(("close",))
+            self._process.join()
+            self._process = None
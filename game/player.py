@@ -2,6 +2,9 @@ import pyglet as pgl
 from pyglet.window import key
 from math import sqrt, atan2, cos, sin, pi
 from .rect import Rect
+from .contact import ContactCache
+from .timestep import base_rate
+from . import render
 from .particle import PointEmitter
 
 
@@ -21,24 +24,35 @@ class Player:
         self._max_rot_vel = 300
         self._rot_drag = 0.97
 
+        # moves are split at surfaces at most this many times per update, stopping skin pixels short of them
+        self._max_sweeps = 3
+        self._skin = 0.01
+
         self.vel_x = 0
         self.vel_y = 0
         self.rot = 0
         self.vel_rot = 0
 
+        # state at the start of the last update, the sprite is drawn between it and the current state
+        self._prev_x = self.x
+        self._prev_y = self.y
+        self._prev_rot = self.rot
+
         self.key_handler = key.KeyStateHandler()
 
         #  Image / sprite setup
-        self._image = pgl.resource.image("player.png")
+        self._image = render.image("player.png")
         self._image.center_x = self._image.width // 2
         self._image.center_y = self._image.height // 2
         self._image.anchor_x = self._image.width // 2
         self._image.anchor_y = self._image.height // 2
-        self._sprite = pgl.sprite.Sprite(img=self._image, x=self.x, y=self.y, batch=batch, group=group)
+        self._sprite = render.sprite(self._image, self.x, self.y, batch, group)
         self._sprite.scale = 0.1
 
-        self.smoke_particles = PointEmitter((self.x, self.y), direction = self.rot, max_particles = 20, size = 5, size_rand = 50, vel = 300, vel_rand = 2, rot_vel_rand = 100, spread = 50, emit_speed = 50, lifetime = 0.15, lifetime_rand = 0.1, batch = batch, group = group)
+        self.smoke_particles = PointEmitter((self.x, self.y), direction = self.rot, max_particles = 20, size = 5, size_rand = 50, vel = 300, vel_rand = 2, rot_vel_rand = 100, spread = 50, emit_speed = 50, lifetime = 0.15, lifetime_rand = 0.1, render_mode = "quads", priority = 2, collide = True, batch = batch, group = group)
         self._rects_in_range = []
+        self._broadphase = None
+        self.contact_cache = ContactCache()
 
         self._debug = False
         self._debug_direction = None
@@ -46,32 +60,34 @@ class Player:
 
     def delete(self):
         self._sprite.delete()
-        self.debug_disable()
+
+        if self._debug:
+            self.debug_disable()
+
         self.hitbox.delete()
         self.smoke_particles.delete()
         del self
 
     def update(self, dt):
+        self._prev_x = self.x
+        self._prev_y = self.y
+        self._prev_rot = self.rot
+        scale = dt * base_rate
+
         self.smoke_particles.set_intensity(max_particles = 0)
         #  key handling
         if self.key_handler[key.W]:
-            self.accelerate(0, self._acc, mode = "relative")
+            self.accelerate(0, self._acc * scale, mode = "relative")
             self.smoke_particles.set_intensity(max_particles = 20)
         if self.key_handler[key.S]:
-            self.accelerate(0, -self._acc, mode = "relative")
+            self.accelerate(0, -self._acc * scale, mode = "relative")
         if self.key_handler[key.A]:
-            self.__acc_rot__(-self._rot_acc)
+            self.__acc_rot__(-self._rot_acc * scale)
         if self.key_handler[key.D]:
-            self.__acc_rot__(self._rot_acc)
-
-        for rect in self._rects_in_range:
-            self.__contact__(rect)
+            self.__acc_rot__(self._rot_acc * scale)
 
         #  physics update
-        self.x += self.vel_x * dt
-        self.y += self.vel_y * dt
         self.rot += self.vel_rot * dt
-        self.__drag__()
 
         while self.rot > 360:
             self.rot -= 360
@@ -80,45 +96,99 @@ class Player:
             self.rot += 360
 
         self.hitbox.update(self.x, self.y, self.rot)
+        self.__push_out__()
+        self.__move__(self.vel_x * dt, self.vel_y * dt, dt)
+        self.__drag__(dt)
         self.smoke_particles.set_pos(self.x, self.y, direction = self.rot + 90)
         self.smoke_particles.update(dt)
 
-        #  sprite update
-        self._sprite.x = self.x
-        self._sprite.y = self.y
-        self._sprite.rotation = self.rot
-
         #  debug updating
         if self._debug:
             self._debug_direction.vertices = [self.x, self.y, self.x + (cos((self.rot - 90) * pi / 180) * 100),
                                               self.y + (sin((self.rot - 90) * pi / 180) * -100)]
             self._debug_velocity.vertices = [self.x, self.y, self.x + self.vel_x * 0.5, self.y + self.vel_y * 0.5]
 
-    def __contact__(self, rect):
-        """check if self contacts rect, and slide if so"""
-        line = self.hitbox.contacts(rect)
+    def render(self, alpha = 1):
+        """place sprite alpha (0 - 1) of the way from the state before the last update to the current one"""
+        turn = (self.rot - self._prev_rot + 180) % 360 - 180
+
+        self._sprite.x = self._prev_x + (self.x - self._prev_x) * alpha
+        self._sprite.y = self._prev_y + (self.y - self._prev_y) * alpha
+        self._sprite.rotation = self._prev_rot + turn * alpha
+
+    def get_render_pos(self):
+        """position the sprite was last placed at by render"""
+        return self._sprite.x, self._sprite.y
+
+    def __move__(self, dx, dy, dt):
+        """move hitbox by dx, dy (the move of a dt second update), stopping at the first surface hit and sliding along
+        it with the rest of the move"""
+        for _ in range(self._max_sweeps):
+            sides = self.hitbox.checkbox_sides
+            rects = self.__query_rects__(min(sides["min_x"], sides["min_x"] + dx), min(sides["min_y"], sides["min_y"] + dy),
+                                         max(sides["max_x"], sides["max_x"] + dx), max(sides["max_y"], sides["max_y"] + dy))
+            hit = self.hitbox.sweep(dx, dy, rects)
+
+            if hit is None:
+                self.x += dx
+                self.y += dy
+                break
+
+            time, normal_x, normal_y, rect = hit
+
+            # stop just short of the surface
+            length = sqrt(dx ** 2 + dy ** 2)
+            time = max(time - self._skin / length, 0)
+            self.x += dx * time
+            self.y += dy * time
+
+            # rest of the move, without the part going into the surface
+            dx *= 1 - time
+            dy *= 1 - time
+            into = dx * normal_x + dy * normal_y
+            dx -= into * normal_x
+            dy -= into * normal_y
+
+            # the rest of the move is made at the mean of the speed before and after friction, so sliding goes as
+            # far at any tick rate
+            kept = self.__slide_normal__(normal_x, normal_y, rect.friction, dt)
+            dx *= (1 + kept) / 2
+            dy *= (1 + kept) / 2
+            self.hitbox.update(self.x, self.y, self.rot)
+
+            if dx == 0 and dy == 0:
+                break
 
-        if line is not None:
-            self.__slide__(line, rect.friction)
+        self.hitbox.update(self.x, self.y, self.rot)
 
-    def __slide__(self, line, friction):
-        """if velocity direction is towards line, set velocity parallel to line"""
-        angle = line.angle()
+    def __push_out__(self):
+        """move hitbox out of rects it overlaps (e.g. after rotating into them) the shortest way, sweeping can't"""
+        for _ in range(self._max_sweeps):
+            overlaps = self.contact_cache.separations(self.hitbox, self.__nearby_rects__())
 
-        # get angle of self velocity
-        vel_angle = atan2(self.vel_y, self.vel_x)
+            if not overlaps:
+                break
 
-        # if velocity is towards line
-        if angle - pi < vel_angle < angle:
-            # get self total velocity
-            vel = sqrt(self.vel_x ** 2 + self.vel_y ** 2)
+            # out of the deepest first, that often takes it out of the others too
+            depth, normal_x, normal_y = max(separation for _, separation in overlaps)
+            self.x += normal_x * (depth + self._skin)
+            self.y += normal_y * (depth + self._skin)
+            self.__slide_normal__(normal_x, normal_y, 1, 0)
+            self.hitbox.update(self.x, self.y, self.rot)
 
-            # get component of velocity that is parallel to line
-            new_vel = cos(angle - vel_angle) * vel * friction
+    def __slide_normal__(self, normal_x, normal_y, friction, dt):
+        """remove velocity going into a surface with normal (normal_x, normal_y), slow the rest by friction (velocity
+        kept per 1 / base_rate seconds) for dt seconds. return the fraction of the sliding speed kept"""
+        into = self.vel_x * normal_x + self.vel_y * normal_y
 
-            # set self x, y velocity to this velocity & angle
-            self.vel_x = new_vel * cos(angle)
-            self.vel_y = new_vel * sin(angle)
+        if into >= 0:
+            return 1
+
+        friction **= dt * base_rate
+        self.vel_x = (self.vel_x - into * normal_x) * friction
+        self.vel_y = (self.vel_y - into * normal_y) * friction
+
+        return friction
 
     def debug_enable(self, batch, group = None):
         """enable drawing of rotation and velocity vectors"""
@@ -169,9 +239,39 @@ class Player:
     def near_rect(self, rect):
         self._rects_in_range.append(rect)
 
+    def set_broadphase(self, spatial_hash):
+        """check collision only against rects in the cells of spatial_hash (a SpatialHash) the hitbox overlaps"""
+        self._broadphase = spatial_hash
+
+    def __nearby_rects__(self):
+        """rects that could be touching the hitbox"""
+        sides = self.hitbox.checkbox_sides
+        return self.__query_rects__(sides["min_x"], sides["min_y"], sides["max_x"], sides["max_y"])
+
+    def __query_rects__(self, min_x, min_y, max_x, max_y):
+        """rects that could be in a bounding box"""
+        if self._broadphase is None:
+            return self._rects_in_range
+
+        return self._broadphase.query(min_x, min_y, max_x, max_y)
+
+    def get_state(self):
+        """return (x, y, rot, vel_x, vel_y, vel_rot)"""
+        return self.x, self.y, self.rot, self.vel_x, self.vel_y, self.vel_rot
+
+    def set_state(self, state):
+        """set position, rotation and velocities from a get_state tuple"""
+        self.x, self.y, self.rot, self.vel_x, self.vel_y, self.vel_rot = state
+        self._prev_x = self.x
+        self._prev_y = self.y
+        self._prev_rot = self.rot
+        self.hitbox.update(self.x, self.y, self.rot)
+
     def set_pos(self, pos):
         self.x = pos[0]
         self.y = pos[1]
+        self._prev_x = self.x
+        self._prev_y = self.y
 
     def __acc_rot__(self, a):
         """accelerate rotation of player, cap at max_rot"""
@@ -181,11 +281,12 @@ class Player:
         if self.vel_rot > self._max_rot_vel: self.vel_rot = self._max_rot_vel
         if self.vel_rot < -self._max_rot_vel: self.vel_rot = -self._max_rot_vel
 
-    def __drag__(self):
+    def __drag__(self, dt):
         """apply drag to motion of player, set motion to 0 if it is too low"""
-        self.vel_x *= self._drag
-        self.vel_y *= self._drag
-        self.vel_rot *= self._rot_drag
+        scale = dt * base_rate
+        self.vel_x *= self._drag ** scale
+        self.vel_y *= self._drag ** scale
+        self.vel_rot *= self._rot_drag ** scale
 
         if -0.1 < self.vel_x < 0.1: self.vel_x = 0
         if -0.1 < self.vel_y < 0.1: self.vel_y = 0
@@ -1,11 +1,68 @@
+import numpy as np
 import pyglet as pgl
+from array import array
 from math import cos, sin, pi, atan2
 
 
+def ccw_many(point1, point2, point3):
+    """vectorized version of the counterclockwise test in Line.contacts, points are (..., 2) arrays"""
+    return (point3[..., 1] - point1[..., 1]) * (point2[..., 0] - point1[..., 0]) > \
+           (point2[..., 1] - point1[..., 1]) * (point3[..., 0] - point1[..., 0])
+
+
+def cross(a, b):
+    """2d cross product of (..., 2) arrays"""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def ray_hits(origins, move, starts, ends):
+    """fraction of move (0 - 1) at which each point in origins (n, 1, 2) moving by move hits each segment
+    starts -> ends (1, m, 2), inf where it doesn't"""
+    edge = ends - starts
+    to_start = starts - origins
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = cross(move, edge)
+        along_move = cross(to_start, edge) / denominator
+        along_edge = cross(to_start, move) / denominator
+
+    hit = (denominator != 0) & (along_move >= 0) & (along_move <= 1) & (along_edge >= 0) & (along_edge <= 1)
+
+    return np.where(hit, along_move, np.inf)
+
+
 class Point:
+    __slots__ = ("_buffer", "_index")
+
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        self._buffer = array("d", (x, y))
+        self._index = 0
+
+    @classmethod
+    def view(cls, buffer, index):
+        """point stored at buffer[index] and buffer[index + 1] (a flat sequence of x, y pairs), it moves whenever
+        buffer is changed"""
+        point = cls.__new__(cls)
+        point._buffer = buffer
+        point._index = index
+
+        return point
+
+    @property
+    def x(self):
+        return self._buffer[self._index]
+
+    @x.setter
+    def x(self, value):
+        self._buffer[self._index] = value
+
+    @property
+    def y(self):
+        return self._buffer[self._index + 1]
+
+    @y.setter
+    def y(self, value):
+        self._buffer[self._index + 1] = value
 
     def __str__(self):
         return "Point ({}, {})".format(self.x, self.y)
@@ -18,11 +75,13 @@ class Point:
         return False
 
     def set_pos(self, x, y):
-        self.x = x
-        self.y = y
+        self._buffer[self._index] = x
+        self._buffer[self._index + 1] = y
 
 
 class Line:
+    __slots__ = ("_points", "_debug", "_debug_vertex")
+
     def __init__(self, points):
         self._points = points
 
@@ -31,7 +90,10 @@ class Line:
 
     def update(self, points):
         self._points = points
+        self.redraw()
 
+    def redraw(self):
+        """move debug vertex to current points"""
         if self._debug:
             self._debug_vertex.vertices = [self._points[0].x, self._points[0].y, self._points[1].x, self._points[1].y]
 
@@ -113,43 +175,243 @@ class Rect:
         self.y = pos[1]
         self.rot = 0
 
-        self._points = [Point(point[0] + self.x, point[1] + self.y) for point in points]
-        self._points_ref = [Point(point[0], point[1]) for point in points]
-        self._sides = [Line([points[i - 1], points[i]]) for i in range(len(points))]
+        # all geometry lives in flat preallocated x, y buffers that update() overwrites in place one float at a time
+        # (numpy calls on arrays this small cost more than the maths), the (n, 2) arrays are numpy views of the same
+        # memory for the vectorized tests. side i goes from corner i - 1 to corner i
+        reference = np.array(points, dtype=np.float64).reshape(-1, 2)
+        corners = reference + (self.x, self.y)
+        self._radius = float(np.sqrt((reference ** 2).sum(axis=1)).max())
+        self._reference = tuple(reference.ravel().tolist())
+        self._reference_normals = tuple(self.__side_normals__(corners).ravel().tolist())
+        self._flat_corners = array("d", corners.ravel().tolist())
+        self._flat_side_starts = array("d", np.roll(corners, 1, axis=0).ravel().tolist())
+        self._flat_normals = array("d", self._reference_normals)
+        self._corners = np.frombuffer(self._flat_corners).reshape(-1, 2)
+        self._side_starts = np.frombuffer(self._flat_side_starts).reshape(-1, 2)
+        self._normals = np.frombuffer(self._flat_normals).reshape(-1, 2)
+
+        # Points and Lines are views into the buffers, they are made once and move with them
+        count = len(self._corners)
+        self._points = [Point.view(self._flat_corners, 2 * i) for i in range(count)]
+        self._sides = [Line([self._points[i - 1], self._points[i]]) for i in range(count)]
 
         self.friction = 0.9
 
-        self._checkbox = None
+        self._checkbox_corners = array("d", bytes(8 * 8))
+        self._checkbox = [Point.view(self._checkbox_corners, 2 * i) for i in range(4)]
         self.checkbox_sides = {}
-        self.__update_checkbox__()
+        corners = self._flat_corners
+        self.__update_checkbox__(min(corners[0::2]), min(corners[1::2]), max(corners[0::2]), max(corners[1::2]))
 
         self._debug = False
         self._debug_vertex_list = []
 
     def update(self, x, y, rot):
-        """update position and rotation"""
+        """update position and rotation, everything is written into existing arrays"""
         self.__update_position__(x, y, rot)
-        self.__update_sides__()
-        self.__update_checkbox__()
 
         if self._debug:
+            for side in self._sides:
+                side.redraw()
+
             for i in range(4):
                 self._debug_vertex_list[i].vertices = [self._checkbox[i - 1].x, self._checkbox[i - 1].y,
                                                        self._checkbox[i].x, self._checkbox[i].y]
 
     def contacts(self, rect):
-        """check if self contacts other rect"""
-        #  check if rects are in range
-        if self.__in_range__(rect):
-            #  check each side of rect to see if it intersects
-            rect_sides = rect.get_sides()
+        """check if self contacts other rect, return the first side of rect hit by a side of self or None"""
+        if not self.__in_range__(rect):
+            return None
+
+        # Line.contacts for every pair of sides, inlined over the flat corners
+        own = self._flat_corners
+        other = rect._flat_corners
+        own_count = len(own)
+
+        for j in range(0, len(other), 2):
+            ax = other[j - 2]
+            ay = other[j - 1]
+            bx = other[j]
+            by = other[j + 1]
+
+            for i in range(0, own_count, 2):
+                cx = own[i - 2]
+                cy = own[i - 1]
+                dx = own[i]
+                dy = own[i + 1]
+
+                if ((dy - ay) * (cx - ax) > (cy - ay) * (dx - ax)) != ((dy - by) * (cx - bx) > (cy - by) * (dx - bx)) and \
+                        ((cy - ay) * (bx - ax) > (by - ay) * (cx - ax)) != ((dy - ay) * (bx - ax) > (by - ay) * (dx - ax)):
+                    return rect.get_sides()[j // 2]
 
-            for rect_side in rect_sides:
-                for side in self._sides:
-                    if side.contacts(rect_side):
-                        return rect_side
         return None
 
+    def contacts_many(self, rects):
+        """check self against many rects at once, gives the same sides as calling contacts on each.
+        return list of (rect, side of rect that was hit) for every rect in contact"""
+        rects = [rect for rect in rects if self.__in_range__(rect)]
+
+        if not rects:
+            return []
+
+        # every side of every rect in range, against every side of self
+        starts = np.concatenate([rect._side_starts for rect in rects])
+        ends = np.concatenate([rect._corners for rect in rects])
+        own_starts = self._side_starts[None, :, :]
+        own_ends = self._corners[None, :, :]
+        point_a = starts[:, None, :]
+        point_b = ends[:, None, :]
+
+        hits = (ccw_many(point_a, own_starts, own_ends) != ccw_many(point_b, own_starts, own_ends)) & \
+               (ccw_many(point_a, point_b, own_starts) != ccw_many(point_a, point_b, own_ends))
+        side_hit = hits.any(axis=1).tolist()
+
+        contacts = []
+        index = 0
+
+        for rect in rects:
+            sides = rect.get_sides()
+
+            for i in range(len(sides)):
+                if side_hit[index + i]:
+                    contacts.append((rect, sides[i]))
+                    break
+
+            index += len(sides)
+
+        return contacts
+
+    def sweep(self, dx, dy, rects):
+        """move self by (dx, dy) through static rects without tunnelling.
+        return (time of impact 0 - 1, normal x, normal y, rect) of the first hit, normal facing against the move, or None.
+        sides the move is leaving (or sliding along) are ignored, so a rect that starts out touching or overlapping
+        another can always move away from it"""
+        if not rects or (dx == 0 and dy == 0):
+            return None
+
+        move = np.array([dx, dy], dtype=np.float64)
+        starts = np.concatenate([rect._side_starts for rect in rects])
+        ends = np.concatenate([rect._corners for rect in rects])
+        normals = np.concatenate([rect._normals for rect in rects])
+        owners = np.repeat(np.arange(len(rects)), [len(rect._corners) for rect in rects])
+
+        # own corners running into other sides, and other corners (side ends) running into own sides
+        corner_hits = ray_hits(self._corners[:, None, :], move, starts[None, :, :], ends[None, :, :])
+        side_hits = ray_hits(ends[:, None, :], -move, self._side_starts[None, :, :], self._corners[None, :, :])
+
+        # only other sides facing the move and own sides facing along it can be run into
+        corner_hits[:, normals @ move >= 0] = np.inf
+        side_hits[:, self._normals @ move <= 0] = np.inf
+
+        corner_first = np.unravel_index(np.argmin(corner_hits), corner_hits.shape)
+        side_first = np.unravel_index(np.argmin(side_hits), side_hits.shape)
+        corner_time = corner_hits[corner_first]
+        side_time = side_hits[side_first]
+
+        if corner_time == np.inf and side_time == np.inf:
+            return None
+
+        if corner_time <= side_time:
+            time = corner_time
+            normal_x, normal_y = normals[corner_first[1]].tolist()
+            rect = rects[owners[corner_first[1]]]
+        else:
+            time = side_time
+            normal_x, normal_y = (-self._normals[side_first[1]]).tolist()
+            rect = rects[owners[side_first[0]]]
+
+        return float(time), normal_x, normal_y, rect
+
+    def separation(self, rect):
+        """shortest way out of rect, as (depth, normal x, normal y) to move self depth along the normal, or None if
+        they don't overlap. it is the smallest overlap along the side normals of both (separating axis test), a
+        concave rect is pushed out of as its convex hull"""
+        if not self.__in_range__(rect):
+            return None
+
+        own = self._flat_corners
+        other = rect._flat_corners
+
+        # sides cross, or one is entirely inside the other
+        if self.contacts(rect) is None and not self.__inside__(own[0], own[1], other) and \
+                not self.__inside__(other[0], other[1], own):
+            return None
+
+        best = None
+
+        for axes in (rect._normals.ravel().tolist(), self._normals.ravel().tolist()):
+            for i in range(0, len(axes), 2):
+                normal_x = axes[i]
+                normal_y = axes[i + 1]
+                own_min = other_min = float("inf")
+                own_max = other_max = float("-inf")
+
+                for j in range(0, len(own), 2):
+                    projection = own[j] * normal_x + own[j + 1] * normal_y
+                    if projection < own_min: own_min = projection
+                    if projection > own_max: own_max = projection
+
+                for j in range(0, len(other), 2):
+                    projection = other[j] * normal_x + other[j + 1] * normal_y
+                    if projection < other_min: other_min = projection
+                    if projection > other_max: other_max = projection
+
+                # out past either end of rect along this axis
+                forward = other_max - own_min
+                backward = own_max - other_min
+
+                if forward <= 0 or backward <= 0:
+                    return None
+
+                if forward <= backward:
+                    candidate = (forward, normal_x, normal_y)
+                else:
+                    candidate = (backward, -normal_x, -normal_y)
+
+                if best is None or candidate[0] < best[0]:
+                    best = candidate
+
+        return best
+
+    def separating_axis(self, rect):
+        """axis self and rect are furthest apart along, as (gap, normal x, normal y) with the normal pointing from rect
+        towards self. the axes are the side normals of both and the x and y axes, gap is 0 or less if they overlap
+        along every one of them"""
+        own = self._flat_corners
+        other = rect._flat_corners
+        best = None
+
+        for axes in ((1.0, 0.0, 0.0, 1.0), rect._normals.ravel().tolist(), self._normals.ravel().tolist()):
+            for i in range(0, len(axes), 2):
+                normal_x = axes[i]
+                normal_y = axes[i + 1]
+                own_min = other_min = float("inf")
+                own_max = other_max = float("-inf")
+
+                for j in range(0, len(own), 2):
+                    projection = own[j] * normal_x + own[j + 1] * normal_y
+                    if projection < own_min: own_min = projection
+                    if projection > own_max: own_max = projection
+
+                for j in range(0, len(other), 2):
+                    projection = other[j] * normal_x + other[j + 1] * normal_y
+                    if projection < other_min: other_min = projection
+                    if projection > other_max: other_max = projection
+
+                # past the far end of rect along the axis, or before its near end
+                forward = own_min - other_max
+                backward = other_min - own_max
+
+                if forward >= backward:
+                    candidate = (forward, normal_x, normal_y)
+                else:
+                    candidate = (backward, -normal_x, -normal_y)
+
+                if best is None or candidate[0] > best[0]:
+                    best = candidate
+
+        return best
+
     def debug_enable(self, batch, group=None):
         """enable drawing of rotation and velocity vectors"""
         self._debug = True
@@ -196,6 +458,14 @@ class Rect:
     def get_sides(self):
         return self._sides.copy()
 
+    def get_normals(self):
+        """unit normals of the sides, pointing outward"""
+        return self._normals.copy()
+
+    def get_radius(self):
+        """distance from pos to the furthest corner"""
+        return self._radius
+
     def delete(self):
         for side in self._sides:
             side.delete()
@@ -215,35 +485,86 @@ class Rect:
         self.y = y
         self.rot = rot
 
-        points = self._points_ref.copy()
-
         #  for some reason, self.rot needs to be negative, not sure why
         c, s = cos(-self.rot * pi / 180), sin(-self.rot * pi / 180)
 
-        self._points = [Point(c * point.x - s * point.y + self.x, s * point.x + c * point.y + self.y) for point in
-                        points]
-
-    def __update_sides__(self):
-        for i in range(len(self._sides)):
-            self._sides[i].update([self._points[i - 1], self._points[i]])
-
-    def __update_checkbox__(self):
+        reference = self._reference
+        reference_normals = self._reference_normals
+        corners = self._flat_corners
+        side_starts = self._flat_side_starts
+        normals = self._flat_normals
+        count = len(reference)
+        min_x = min_y = float("inf")
+        max_x = max_y = float("-inf")
+
+        for i in range(0, count, 2):
+            reference_x = reference[i]
+            reference_y = reference[i + 1]
+            corner_x = c * reference_x - s * reference_y + x
+            corner_y = s * reference_x + c * reference_y + y
+
+            corners[i] = corner_x
+            corners[i + 1] = corner_y
+            # the side starting at this corner is the next one
+            start = (i + 2) % count
+            side_starts[start] = corner_x
+            side_starts[start + 1] = corner_y
+
+            normal_x = reference_normals[i]
+            normal_y = reference_normals[i + 1]
+            normals[i] = c * normal_x - s * normal_y
+            normals[i + 1] = s * normal_x + c * normal_y
+
+            if corner_x < min_x: min_x = corner_x
+            if corner_x > max_x: max_x = corner_x
+            if corner_y < min_y: min_y = corner_y
+            if corner_y > max_y: max_y = corner_y
+
+        self.__update_checkbox__(min_x, min_y, max_x, max_y)
+
+    @staticmethod
+    def __side_normals__(corners):
+        """unit normals of the sides of corners (an (n, 2) array), pointing outward"""
+        direction = corners - np.roll(corners, 1, axis=0)
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        length[length == 0] = 1
+
+        # (-dy, dx) points out of clockwise polygons, which have a negative signed area
+        if cross(np.roll(corners, 1, axis=0), corners).sum() > 0:
+            length = -length
+
+        return np.stack((-direction[:, 1], direction[:, 0]), axis=1) / length[:, None]
+
+    def __update_checkbox__(self, min_x, min_y, max_x, max_y):
         """update checkbox (bounding box of hitbox)"""
-        #  Update box
-        rect_x = [point.x for point in self._points]
-        rect_y = [point.y for point in self._points]
-
-        min_x = min(rect_x)
-        max_x = max(rect_x)
-        min_y = min(rect_y)
-        max_y = max(rect_y)
-
-        self._checkbox = [Point(min_x, min_y), Point(min_x, max_y), Point(max_x, max_y), Point(max_x, min_y)]
-
-        self.checkbox_sides["min_x"] = min_x
-        self.checkbox_sides["max_x"] = max_x
-        self.checkbox_sides["min_y"] = min_y
-        self.checkbox_sides["max_y"] = max_y
+        # corners in order (min_x, min_y), (min_x, max_y), (max_x, max_y), (max_x, min_y)
+        box = self._checkbox_corners
+        box[0] = box[2] = min_x
+        box[4] = box[6] = max_x
+        box[1] = box[7] = min_y
+        box[3] = box[5] = max_y
+
+        checkbox_sides = self.checkbox_sides
+        checkbox_sides["min_x"] = min_x
+        checkbox_sides["max_x"] = max_x
+        checkbox_sides["min_y"] = min_y
+        checkbox_sides["max_y"] = max_y
+
+    @staticmethod
+    def __inside__(x, y, corners):
+        """check if point x, y is inside the polygon of flat corners (even-odd rule)"""
+        inside = False
+
+        for i in range(0, len(corners), 2):
+            ax = corners[i - 2]
+            ay = corners[i - 1]
+            bx = corners[i]
+            by = corners[i + 1]
+
+            if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+                inside = not inside
+
+        return inside
 
     def __in_range__(self, rect):
         """check if other rect is in range of self (checkboxes intersect)"""
@@ -254,3 +575,80 @@ class Rect:
             return False
         else:
             return True
+
+
+class StaticRect(Rect):
+    def __init__(self, pos, baked):
+        """hitbox of something that never moves (a tile), placed by baked (a BakedHitbox). it only wraps the baked
+        arrays, Points and Lines are made the first time something asks for them (get_sides, debug drawing)"""
+        self.x = pos[0]
+        self.y = pos[1]
+        self.rot = baked.rot
+
+        self._corners = baked.corners
+        self._side_starts = baked.side_starts
+        self._normals = baked.normals
+        self._aabb = baked.aabb
+        self._flat = None
+        self._lines = None
+        self._box = None
+
+        self.friction = 0.9
+
+        min_x, min_y, max_x, max_y = baked.aabb
+        self.checkbox_sides = {"min_x": min_x, "max_x": max_x, "min_y": min_y, "max_y": max_y}
+
+        self._debug = False
+        self._debug_vertex_list = []
+
+    def update(self, x, y, rot):
+        raise ValueError("Rect is baked, it can't be moved!")
+
+    @property
+    def _flat_corners(self):
+        if self._flat is None:
+            self._flat = self._corners.ravel().tolist()
+
+        return self._flat
+
+    @property
+    def _points(self):
+        return self.__lines__()[0]
+
+    @property
+    def _sides(self):
+        return self.__lines__()[1]
+
+    @property
+    def _checkbox(self):
+        if self._box is None:
+            min_x, min_y, max_x, max_y = self._aabb
+            box = [min_x, min_y, min_x, max_y, max_x, max_y, max_x, min_y]
+            self._box = [Point.view(box, 2 * i) for i in range(4)]
+
+        return self._box
+
+    def __lines__(self):
+        """(points, sides), made on first use"""
+        if self._lines is None:
+            corners = self._flat_corners
+            points = [Point.view(corners, 2 * i) for i in range(len(corners) // 2)]
+            self._lines = (points, [Line([points[i - 1], points[i]]) for i in range(len(points))])
+
+        return self._lines
+
+    def get_radius(self):
+        """distance from pos to the furthest corner"""
+        return float(np.hypot(self._corners[:, 0] - self.x, self._corners[:, 1] - self.y).max())
+
+    def delete(self):
+        if self._lines is not None:
+            for side in self._lines[1]:
+                side.delete()
+
+        if self._debug:
+            for vertex in self._debug_vertex_list:
+                vertex.delete()
+            self._debug_vertex_list = None
+
+        del self
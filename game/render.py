@@ -0,0 +1,161 @@
+"""everything that needs a display goes through here: images, sprites, labels and gl state.
+when headless (set_headless(True)) the same calls return stand ins that only keep their attributes,
+so levels, players and particles can be simulated without a window, e.g. on build servers"""
+import pyglet as pgl
+
+headless = False
+
+# vertex list attribute for each pyglet vertex format letter
+attribute_names = {"v": "vertices", "c": "colors", "t": "tex_coords", "n": "normals"}
+
+
+def set_headless(enabled):
+    """pyglet.options['shadow_window'] must be set to False before pyglet.gl is imported for headless use"""
+    global headless
+    headless = enabled
+
+
+def image(name):
+    if headless:
+        return NullImage()
+
+    return pgl.resource.image(name)
+
+
+def sprite(img, x = 0, y = 0, batch = None, group = None):
+    if headless:
+        return NullSprite(img, x, y, batch, group)
+
+    return pgl.sprite.Sprite(img=img, x=x, y=y, batch=batch, group=group)
+
+
+def label(text = "", x = 0, y = 0, font_size = None, font_name = None, batch = None, group = None, anchor_x = 'left', anchor_y = 'baseline'):
+    if headless:
+        return NullLabel(text, x, y)
+
+    return pgl.text.Label(text = text, x = x, y = y, font_size = font_size, font_name = font_name, batch = batch,
+                          group = group, anchor_x = anchor_x, anchor_y = anchor_y)
+
+
+def line_width(width):
+    if not headless:
+        pgl.gl.glLineWidth(width)
+
+
+class NullImage:
+    """stands in for a pyglet image / texture"""
+    def __init__(self, width = 0, height = 0):
+        self.width = width
+        self.height = height
+        self.anchor_x = 0
+        self.anchor_y = 0
+        self.center_x = 0
+        self.center_y = 0
+        self.tex_coords = (0,) * 12
+
+    def get_texture(self):
+        return self
+
+
+class NullSprite:
+    """stands in for a pyglet sprite, keeps position and looks but draws nothing"""
+    def __init__(self, img, x = 0, y = 0, batch = None, group = None):
+        self.image = img
+        self.x = x
+        self.y = y
+        self.batch = batch
+        self.group = group
+
+        self.rotation = 0
+        self.scale = 1
+        self.color = (255, 255, 255)
+        self.opacity = 255
+        self.visible = True
+
+    def update(self, x = None, y = None, rotation = None, scale = None):
+        if x is not None: self.x = x
+        if y is not None: self.y = y
+        if rotation is not None: self.rotation = rotation
+        if scale is not None: self.scale = scale
+
+    def delete(self):
+        pass
+
+
+class NullLabel:
+    """stands in for a pyglet label"""
+    def __init__(self, text = "", x = 0, y = 0):
+        self.text = text
+        self.x = x
+        self.y = y
+
+    def delete(self):
+        pass
+
+
+class NullVertexList:
+    """stands in for a pyglet vertex list, attributes are plain lists"""
+    def __init__(self, count, data):
+        self._count = count
+        self._sizes = {}
+
+        for item in data:
+            if isinstance(item, tuple):
+                item, values = item
+            else:
+                values = None
+
+            name = attribute_names[item[0]]
+            size = int(item[1])
+            self._sizes[name] = size
+            setattr(self, name, list(values) if values is not None else [0] * (count * size))
+
+    def get_size(self):
+        return self._count
+
+    def resize(self, count):
+        for name, size in self._sizes.items():
+            values = getattr(self, name)[:count * size]
+            setattr(self, name, values + [0] * (count * size - len(values)))
+
+        self._count = count
+
+    def delete(self):
+        pass
+
+
+class NullBatch:
+    """stands in for a pyglet batch, vertex lists added to it are never drawn"""
+    def add(self, count, mode, group, *data):
+        return NullVertexList(count, data)
+
+    def draw(self):
+        pass
+
+
+class NullWindow:
+    """stands in for the game window, only has a size and ignores event handlers"""
+    def __init__(self, width = 1920, height = 1080):
+        self.width = width
+        self.height = height
+
+    def push_handlers(self, *args, **kwargs):
+        pass
+
+    def remove_handlers(self, *args, **kwargs):
+        pass
+
+
+class CameraGroup(pgl.graphics.OrderedGroup):
+    """draws its children moved so the world point (x, y) is at the bottom left of the window"""
+    def __init__(self, order, parent = None):
+        super().__init__(order, parent)
+        self.x = 0
+        self.y = 0
+
+    def set_state(self):
+        pgl.gl.glPushMatrix()
+        pgl.gl.glTranslatef(-round(self.x), -round(self.y), 0)
+
+    def unset_state(self):
+        pgl.gl.glPopMatrix()
@@ -0,0 +1,203 @@
+"""record the player's input every tick and play it back exactly, headless and as fast as possible.
+recordings are used as benchmark workloads and as regression checks of the final player state.
+
+file layout (little endian): header '<4sBH' (magic, format version, length of level name), level name (utf-8),
+player state at the start and at the end '<6d' each (x, y, rot, vel_x, vel_y, vel_rot), then one '<dB' record
+per tick (dt, keys held as a bitmask of record_keys) until the end of the file.
+
+run from the repository root: python -m game.replay <file> [--levels <directory of the level>]"""
+import pyglet as pgl
+
+# run on its own the replay is headless, pyglet mustn't make its hidden shadow window (needs a display).
+# the game imports this module for recording and keeps its normal window setup
+if __name__ == '__main__':
+    pgl.options['shadow_window'] = False
+
+import argparse
+import struct
+from math import isclose
+from time import perf_counter
+from pyglet.window import key
+
+magic = b"SPRP"
+format_version = 1
+header = struct.Struct("<4sBH")
+state = struct.Struct("<6d")
+record = struct.Struct("<dB")
+
+# keys the player reads, bit i of a record is record_keys[i]
+record_keys = (key.W, key.A, key.S, key.D)
+
+
+class ReplayKeys:
+    """stands in for a KeyStateHandler, holds the keys of the record being played"""
+    def __init__(self):
+        self.mask = 0
+
+    def __getitem__(self, symbol):
+        if symbol in record_keys:
+            return bool(self.mask & (1 << record_keys.index(symbol)))
+
+        return False
+
+
+class Recording:
+    def __init__(self, level_name, start_state, records = b"", end_state = None):
+        """input of a run of level_name, starting from player state start_state (see Player.get_state)"""
+        self.level_name = level_name
+        self.start_state = start_state
+        self.end_state = end_state
+        self._records = bytearray(records)
+
+    def __str__(self):
+        return "Recording of {} ({} ticks)".format(self.level_name, len(self))
+
+    def __len__(self):
+        return len(self._records) // record.size
+
+    def __iter__(self):
+        """yield (dt, key mask) of every tick"""
+        return record.iter_unpack(self._records)
+
+    def add(self, dt, mask):
+        self._records += record.pack(dt, mask)
+
+    def to_bytes(self):
+        name = self.level_name.encode("utf-8")
+        end_state = self.end_state if self.end_state is not None else self.start_state
+
+        return b"".join((header.pack(magic, format_version, len(name)), name, state.pack(*self.start_state),
+                         state.pack(*end_state), self._records))
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = memoryview(data)
+        file_magic, version, name_length = header.unpack_from(data)
+
+        if file_magic != magic:
+            raise ValueError("Not a replay file! (magic {})".format(bytes(file_magic)))
+        if version != format_version:
+            raise ValueError("Replay is unsupported version! ({}, supported: {})".format(version, format_version))
+
+        offset = header.size
+        name = bytes(data[offset:offset + name_length]).decode("utf-8")
+        offset += name_length
+        start_state = state.unpack_from(data, offset)
+        end_state = state.unpack_from(data, offset + state.size)
+        offset += state.size * 2
+
+        if (len(data) - offset) % record.size != 0:
+            raise ValueError("Replay is truncated! ({} bytes of records)".format(len(data) - offset))
+
+        return cls(name, start_state, data[offset:], end_state)
+
+    def save(self, filename):
+        with open(filename, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+class InputRecorder:
+    def __init__(self, level):
+        """records the player's keys each tick of a loaded level, call record before each Level.update"""
+        if level.player is None:
+            raise ValueError("Level {} has no player to record! (e.g. an empty level in the editor)".format(
+                level.get_name()))
+
+        self._player = level.player
+        self.recording = Recording(level.get_name(), self._player.get_state())
+
+    def record(self, dt):
+        handler = self._player.key_handler
+        mask = 0
+
+        for i, symbol in enumerate(record_keys):
+            if handler[symbol]:
+                mask |= 1 << i
+
+        self.recording.add(dt, mask)
+
+    def finish(self):
+        """store the final player state to check replays against, return the recording"""
+        self.recording.end_state = self._player.get_state()
+
+        return self.recording
+
+
+def play(recording, level = None):
+    """load the level of a recording on a headless level and run the recording, see run"""
+    from .headless import make_level
+
+    if level is None:
+        level = make_level()
+
+    level.load(recording.level_name)
+
+    return run(recording, level)
+
+
+def run(recording, level):
+    """run a recording from its start state on a level that has its level loaded, e.g. again and again for benchmarks.
+    return a report like headless.run with the player's final state"""
+    player = level.player
+    player.set_state(recording.start_state)
+    keys = ReplayKeys()
+    player.key_handler = keys
+
+    start = perf_counter()
+
+    for dt, mask in recording:
+        keys.mask = mask
+        level.update(dt)
+
+    seconds = perf_counter() - start
+
+    return {"level": recording.level_name,
+            "ticks": len(recording),
+            "seconds": seconds,
+            "ticks_per_second": len(recording) / seconds if seconds > 0 else float("inf"),
+            "state": player.get_state()}
+
+
+def compare(recording, final_state, tolerance = 1e-6):
+    """return list of (name, recorded, replayed) for each value of final_state that differs from the recorded end state"""
+    names = ("x", "y", "rot", "vel_x", "vel_y", "vel_rot")
+
+    return [(name, expected, result) for name, expected, result in zip(names, recording.end_state, final_state)
+            if not isclose(expected, result, rel_tol=tolerance, abs_tol=tolerance)]
+
+
+def check(recording, level = None, tolerance = 1e-6):
+    """play a recording and compare the final player state with the recorded one, see compare"""
+    return compare(recording, play(recording, level)["state"], tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="play back a recording headless and check the final player state")
+    parser.add_argument("file")
+    parser.add_argument("--levels", default="levels", help="directory of the recording's level")
+    args = parser.parse_args()
+
+    from .headless import make_level
+
+    level = make_level()
+    level.directory = args.levels
+    recording = Recording.load(args.file)
+    report = play(recording, level)
+    print("{}: {} ticks in {:.3f}s ({:.0f} ticks / s)".format(recording.level_name, report["ticks"], report["seconds"],
+                                                             report["ticks_per_second"]))
+
+    differences = compare(recording, report["state"])
+
+    for name, expected, result in differences:
+        print("{} differs: recorded {}, replayed {}".format(name, expected, result))
+
+    print("FAIL" if differences else "OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class ChunkIndex:
+    def __init__(self, chunks, load_margin = 256, unload_margin = 768):
+        """which chunks (a level_format.chunk_dtype array) of a streamed level should be loaded around the view.
+        chunks within load_margin of the view are loaded, loaded chunks are only unloaded once they are further than
+        unload_margin from it, so chunks on the edge don't load and unload every time the camera moves back and forth"""
+        if unload_margin < load_margin:
+            raise ValueError("Unload margin ({}) is smaller than load margin ({})!".format(unload_margin, load_margin))
+
+        self.load_margin = load_margin
+        self.unload_margin = unload_margin
+
+        self._min_x = chunks["min_x"].astype(np.float64)
+        self._min_y = chunks["min_y"].astype(np.float64)
+        self._max_x = chunks["max_x"].astype(np.float64)
+        self._max_y = chunks["max_y"].astype(np.float64)
+        self.loaded = np.zeros(len(chunks), dtype=bool)
+
+    def __str__(self):
+        return "ChunkIndex ({} / {} chunks loaded)".format(self.get_loaded_count(), len(self))
+
+    def __len__(self):
+        return len(self.loaded)
+
+    def __overlapping__(self, bounds, margin):
+        min_x, min_y, max_x, max_y = bounds
+
+        return ((self._max_x >= min_x - margin) & (self._min_x <= max_x + margin) &
+                (self._max_y >= min_y - margin) & (self._min_y <= max_y + margin))
+
+    def update(self, bounds):
+        """move the view to bounds (min x, min y, max x, max y), return (chunks to load, chunks to unload) as lists
+        of indices and mark them loaded / unloaded"""
+        to_load = np.flatnonzero(self.__overlapping__(bounds, self.load_margin) & ~self.loaded)
+        to_unload = np.flatnonzero(~self.__overlapping__(bounds, self.unload_margin) & self.loaded)
+
+        self.loaded[to_load] = True
+        self.loaded[to_unload] = False
+
+        return to_load.tolist(), to_unload.tolist()
+
+    def get_loaded_count(self):
+        return int(np.count_nonzero(self.loaded))
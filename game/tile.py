@@ -1,9 +1,98 @@
-import pyglet as pgl
-from .rect import Rect
+from collections import namedtuple
+from math import pi
+import numpy as np
+from . import render
+from .rect import StaticRect
+
+# hitbox polygon of a tile shape around its centre, unit normal of each side (side i goes from corner i - 1 to i)
+# and bounding box (min x, min y, max x, max y)
+TileShape = namedtuple("TileShape", ["polygon", "normals", "aabb"])
+
+# hitbox of a placed tile in world space, arrays are read only and shared with the tile's Rect
+BakedHitbox = namedtuple("BakedHitbox", ["rot", "corners", "side_starts", "normals", "aabb"])
+
+shapes = {}
+
+
+def register_shape(shape_id, polygon):
+    """work out normals and bounding box of a tile shape once, and add it to the shape registry.
+    normals point out of the shape whichever way round its corners are listed"""
+    normals = []
+    # (-dy, dx) points out of clockwise polygons, which have a negative signed area
+    area = sum(polygon[i - 1][0] * polygon[i][1] - polygon[i][0] * polygon[i - 1][1] for i in range(len(polygon)))
+    direction = -1 if area > 0 else 1
+
+    for i in range(len(polygon)):
+        dx = polygon[i][0] - polygon[i - 1][0]
+        dy = polygon[i][1] - polygon[i - 1][1]
+        length = (dx ** 2 + dy ** 2) ** 0.5
+        normals.append((-dy / length * direction, dx / length * direction))
+
+    xs = [point[0] for point in polygon]
+    ys = [point[1] for point in polygon]
+
+    shapes[shape_id] = TileShape(tuple(tuple(point) for point in polygon), tuple(normals), (min(xs), min(ys), max(xs), max(ys)))
+
+
+def get_shape(shape_id):
+    if shape_id not in shapes:
+        raise ValueError("Tile shape {} does not exist! (registered: {})".format(shape_id, sorted(shapes.keys())))
+
+    return shapes[shape_id]
+
+
+# ids match level_format.txt
+register_shape(1, [[-20, -20], [-20, 20], [20, 20], [20, -20]])  # all sides
+register_shape(2, [[-20, 20], [-20, -20], [25, -20], [25, 20]])  # end cap
+register_shape(3, [[-25, 20], [-25, -20], [25, -20], [25, 20]])  # pipe
+register_shape(4, [[-20, -20], [-20, 25], [20, 25], [20, 20], [25, 20], [25, -20]])  # L corner piece
+register_shape(5, [[-25, -20], [-25, 20], [25, 20], [25, -20], [20, -20], [20, -25], [-20, -25], [-20, -20]])  # T intersection
+register_shape(6, [[-25, -20], [-25, 20], [-20, 20], [-20, 25], [20, 25], [20, 20], [25, 20], [25, -20], [20, -20],
+                   [20, -25], [-20, -25], [-20, -20]])  # + intersection
+
+
+def bake_many(shape_ids, xs, ys, rots):
+    """world space hitboxes (BakedHitbox) of many tiles that will never move, worked out together for all tiles
+    of each shape. rots are in degrees, same direction as Rect.update"""
+    shape_ids = np.asarray(shape_ids, dtype=np.int64).reshape(-1)
+    xs = np.asarray(xs, dtype=np.float64).reshape(-1, 1)
+    ys = np.asarray(ys, dtype=np.float64).reshape(-1, 1)
+    rot_values = list(rots)
+    angles = np.asarray(rot_values, dtype=np.float64) * (-pi / 180)
+    hitboxes = [None] * len(shape_ids)
+
+    for shape_id in np.unique(shape_ids).tolist():
+        shape = get_shape(shape_id)
+        tiles = np.flatnonzero(shape_ids == shape_id)
+        c = np.cos(angles[tiles])[:, None]
+        s = np.sin(angles[tiles])[:, None]
+        polygon = np.array(shape.polygon, dtype=np.float64)
+        normals = np.array(shape.normals, dtype=np.float64)
+
+        # one (tiles, corners, 2) array per shape, each tile's arrays are views of a row of it
+        corners = np.stack((c * polygon[:, 0] - s * polygon[:, 1] + xs[tiles],
+                            s * polygon[:, 0] + c * polygon[:, 1] + ys[tiles]), axis=2)
+        side_starts = np.roll(corners, 1, axis=1)
+        rotated_normals = np.stack((c * normals[:, 0] - s * normals[:, 1], s * normals[:, 0] + c * normals[:, 1]), axis=2)
+        aabbs = np.concatenate((corners.min(axis=1), corners.max(axis=1)), axis=1).tolist()
+
+        for array in (corners, side_starts, rotated_normals):
+            array.flags.writeable = False
+
+        for i, tile in enumerate(tiles.tolist()):
+            hitboxes[tile] = BakedHitbox(rot_values[tile], corners[i], side_starts[i], rotated_normals[i], tuple(aabbs[i]))
+
+    return hitboxes
+
+
+def bake(shape_id, pos, rot):
+    """world space hitbox of a tile that will never move"""
+    return bake_many([shape_id], [pos[0]], [pos[1]], [rot])[0]
 
 
 class Tile:
-    def __init__(self, pos, rot, style_id, shape_id, colour = (255, 255, 255), outline = False, outline_colour = (255, 255, 255), batch=None, group=None):
+    def __init__(self, pos, rot, style_id, shape_id, colour = (255, 255, 255), outline = False, outline_colour = (255, 255, 255), batch=None, group=None, baked=None):
+        """baked is the tile's BakedHitbox if it was worked out before (e.g. from a level cache)"""
         self.x = pos[0]
         self.y = pos[1]
         self.rot = rot
@@ -16,31 +105,19 @@ class Tile:
         self.has_outline = outline
         self.outline_colour = outline_colour
 
-        if shape_id == 1:
-            hitbox = [[-20, -20], [-20, 20], [20, 20], [20, -20]]
-        elif shape_id == 2:
-            hitbox = [[-20, 20], [-20, -20], [25, -20], [25, 20]]
-        elif shape_id == 3:
-            hitbox = [[-25, 20], [-25, -20], [25, -20], [25, 20]]
-        elif shape_id == 4:
-            hitbox = []
-        elif shape_id == 5:
-            hitbox = []
-        elif shape_id == 6:
-            hitbox = []
-
-        self.hitbox = Rect(pos, hitbox)
-        self.hitbox.update(self.x, self.y, self.rot)
+        # tiles never move, so the hitbox is rotated and placed once
+        self.baked = baked if baked is not None else bake(shape_id, pos, rot)
+        self.hitbox = StaticRect(pos, self.baked)
 
         self.friction = 0.95
 
         #  sprite setup
-        self._image = pgl.resource.image("tile_{}_{}.png".format(self.style, self.shape))
+        self._image = render.image("tile_{}_{}.png".format(self.style, self.shape))
         self._image.center_x = self._image.width // 2
         self._image.center_y = self._image.height // 2
         self._image.anchor_x = self._image.width // 2
         self._image.anchor_y = self._image.height // 2
-        self._sprite = pgl.sprite.Sprite(img=self._image, x=self.x, y=self.y, batch=batch, group=group)
+        self._sprite = render.sprite(self._image, self.x, self.y, batch, group)
         self._sprite.rotation = self.rot
         self._sprite.scale = 0.1
         self._sprite.color = self.colour
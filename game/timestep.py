@@ -0,0 +1,55 @@
+# rate that per tick constants (drag, acceleration, gravity) were tuned at, they are scaled by dt * base_rate
+base_rate = 60
+
+
+class FixedTimestep:
+    def __init__(self, step, tick_rate = 60, max_steps = 5):
+        """calls step(tick length) at a fixed rate however long frames take. frame time is collected and used up
+        in whole ticks, at most max_steps per frame, the rest is dropped so slow frames can't pile up more work"""
+        self.step = step
+        self.max_steps = max_steps
+
+        self.tick_rate = tick_rate
+        self.tick_length = 1 / tick_rate
+
+        # fraction of a tick collected but not simulated yet, for interpolating between the last two ticks
+        self.alpha = 0
+        self.frame_time = 0
+        self.ticks = 0
+        self.dropped = 0
+
+        self._accumulator = 0
+
+    def __str__(self):
+        return "FixedTimestep ({} ticks / s, max {} / frame), {} ticks, {:.2f}s dropped".format(
+            self.tick_rate, self.max_steps, self.ticks, self.dropped)
+
+    def advance(self, dt):
+        """add frame time dt and run every tick that is due, return amount of ticks run"""
+        self.frame_time = dt
+        self._accumulator += dt
+        steps = 0
+
+        while self._accumulator >= self.tick_length and steps < self.max_steps:
+            self.step(self.tick_length)
+            self._accumulator -= self.tick_length
+            self.ticks += 1
+            steps += 1
+
+        if self._accumulator >= self.tick_length:
+            self.dropped += self._accumulator - self._accumulator % self.tick_length
+            self._accumulator %= self.tick_length
+
+        self.alpha = self._accumulator / self.tick_length
+
+        return steps
+
+    def set_tick_rate(self, tick_rate):
+        self.tick_rate = tick_rate
+        self.tick_length = 1 / tick_rate
+        self._accumulator = min(self._accumulator, self.tick_length)
+
+    def reset(self):
+        """forget collected time, e.g. after loading a level"""
+        self._accumulator = 0
+        self.alpha = 0
@@ -0,0 +1,19 @@
+def get_version(filename = "version.txt"):
+    """read version.txt to see what level versions are supported"""
+    with open(filename) as file:
+        data = file.read()
+        curr, supp = None, None
+
+        for line in data.split("\n"):
+            name, val = line.split("=")
+            name = name.strip()
+
+            if name == "current_version":
+                curr = int(val)
+            elif name == "supported_versions":
+                supp = []
+
+                for item in val.split():
+                    supp.append(int(item))
+
+        return curr, supp
@@ -1,10 +1,19 @@
+import os
 from pyglet.window import key
 import pyglet as pgl
 from game.level import Level
 from game import ui
 from game.editor import Editor
+from game.timestep import FixedTimestep
+from game.version import get_version
+from game.replay import InputRecorder
 
 framerate = 60.0
+# simulation runs at tick_rate regardless of framerate, catching up at most max_ticks_per_frame ticks per frame
+tick_rate = 60.0
+max_ticks_per_frame = 5
+# F5 starts / stops recording the player's input, saved in replays/ to be played back with python -m game.replay
+recorder = None
 game_window = pgl.window.Window(1920, 1080)
 pgl.resource.path = ['resources']
 pgl.resource.reindex()
@@ -12,27 +21,9 @@ pgl.font.add_directory('resources/fonts')
 main_batch = pgl.graphics.Batch()
 cursor_hand = game_window.get_system_mouse_cursor(game_window.CURSOR_HAND)
 cursor_normal = game_window.get_system_mouse_cursor(game_window.CURSOR_DEFAULT)
-
-
-def get_version():
-    """read version.txt to see what level versions are supported"""
-    with open("version.txt") as file:
-        data = file.read()
-        curr, supp = None, None
-
-        for line in data.split("\n"):
-            name, val = line.split("=")
-            name = name.strip()
-
-            if name == "current_version":
-                curr = int(val)
-            elif name == "supported_versions":
-                supp = []
-
-                for item in val.split():
-                    supp.append(int(val))
-
-        return curr, supp
+# shown while a level loads in the background, see load_level
+loading_label = pgl.text.Label("", x = game_window.width // 2, y = game_window.height // 2, font_size = 30,
+                               anchor_x = 'center', anchor_y = 'center', batch = main_batch)
 
 
 @game_window.event
@@ -44,6 +35,21 @@ def on_key_press(symbol, modifiers):
         if symbol == key.F2:
             level.save("test4")
 
+        # empty levels (the editor's) have no player to record
+        if symbol == key.F5 and level.player is not None:
+            toggle_recording()
+
+
+def toggle_recording():
+    global recorder
+
+    if recorder is None:
+        recorder = InputRecorder(level)
+    else:
+        os.makedirs("replays", exist_ok = True)
+        recorder.finish().save("replays/{}.rpl".format(level.get_name()))
+        recorder = None
+
 
 @game_window.event
 def on_mouse_press(x, y, button, modifiers):
@@ -59,22 +65,49 @@ def on_mouse_motion(x, y, dx, dy):
 @game_window.event
 def on_draw():
     game_window.clear()
+
+    if level.is_loaded():
+        level.render(timestep.alpha)
+
     main_batch.draw()
 
 
+def load_level(name):
+    """load level name in the background, showing progress until it is loaded"""
+    loading_label.text = "Loading {}...".format(name)
+    level.load_async(name, on_progress = show_progress)
+
+
+def show_progress(created, total):
+    loading_label.text = "Loading {}... {:.0f}%".format(level.get_name(), created / total * 100 if total else 100)
+
+
+def on_load(loaded_level):
+    loading_label.text = ""
+
+
+def tick(dt):
+    if recorder is not None:
+        recorder.record(dt)
+
+    level.update(dt, frame_time = timestep.frame_time)
+
+
 def update(dt):
     if level.is_loaded():
-        level.update(dt)
+        timestep.advance(dt)
 
 
 if __name__ == '__main__':
     # TODO: get all levels in folder and display scrolling list of them, function to call this menu whenever
     current, supported = get_version()
     level = Level(current, supported, game_window, main_batch)
+    level.push_handlers(on_load)
 
     edit = Editor(current, supported, game_window, main_batch)
+    timestep = FixedTimestep(tick, tick_rate, max_ticks_per_frame)
 
-    #load_test = ui.Button((50, game_window.height // 2), "LOAD", "button_bg.png", level.load, params = "test4", batch = main_batch, group = pgl.graphics.OrderedGroup(1), anchor_x = 'left')
+    #load_test = ui.Button((50, game_window.height // 2), "LOAD", "button_bg.png", load_level, params = "test4", batch = main_batch, group = pgl.graphics.OrderedGroup(1), anchor_x = 'left')
     #load_test = ui.Button((50, game_window.height // 2), "LOAD", "button_bg.png", level.load_empty, batch = main_batch, group = pgl.graphics.OrderedGroup(1), anchor_x = 'left')
 
     pgl.clock.schedule_interval(update, 1 / framerate)
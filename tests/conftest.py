@@ -0,0 +1,8 @@
+import pyglet as pgl
+
+# tests run without a display, pyglet mustn't make its hidden shadow window
+pgl.options['shadow_window'] = False
+
+from game import render
+
+render.set_headless(True)
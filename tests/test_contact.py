@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from game.contact import ContactCache
+from game.rect import Rect
+from test_rect import player_points, random_layout
+
+seed = 0
+
+
+@pytest.mark.parametrize("layout", range(50))
+def test_cached_separations_match_separation(layout):
+    """small random moves and turns among random tiles, the cache always gives what separation does"""
+    random = np.random.default_rng((seed, layout))
+    rect, tiles = random_layout(random)
+    hitboxes = [tile.hitbox for tile in tiles]
+    cache = ContactCache()
+
+    for _ in range(40):
+        rect.update(rect.x + float(random.normal(0, 2)), rect.y + float(random.normal(0, 2)),
+                    rect.rot + float(random.choice([0, random.normal(0, 3)])))
+        expected = [(other, rect.separation(other)) for other in hitboxes]
+
+        assert cache.separations(rect, hitboxes) == [(other, separation) for other, separation in expected
+                                                     if separation is not None]
+
+
+def test_sliding_along_a_floor_hits():
+    """a rect sliding along (just above) a floor is answered from the cache"""
+    floor = Rect((0, 0), [[-500, -10], [-500, 10], [500, 10], [500, -10]])
+    rect = Rect((0, 0), player_points)
+    cache = ContactCache()
+
+    for x in range(-200, 200, 3):
+        rect.update(float(x), 25.01, 0)
+
+        assert cache.separations(rect, [floor]) == []
+
+    assert cache.touching_misses == 1
+    assert cache.touching_hits == cache.hits > 100
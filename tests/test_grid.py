@@ -0,0 +1,153 @@
+import numpy as np
+from game.grid import EdgeGrid, EdgeGridSet
+from game.particle import ParticleArrays
+from game.tile import Tile
+
+seed = 0
+# tiles are split into parts by this square of the world, like the chunks of a streamed level
+part_size = 256
+
+
+def make_tiles(random, count = 200, area = 1000):
+    return [Tile((float(x), float(y)), int(rot), 1, int(shape)) for x, y, rot, shape in
+            zip(random.uniform(0, area, count), random.uniform(0, area, count), random.integers(0, 360, count),
+                random.integers(1, 7, count))]
+
+
+def make_grids(tiles):
+    """EdgeGrid of all tiles, and an EdgeGridSet with one grid per part of the world"""
+    parts = {}
+
+    for tile in tiles:
+        parts.setdefault((tile.x // part_size, tile.y // part_size), []).append(tile)
+
+    grids = EdgeGridSet()
+
+    for key, part in parts.items():
+        grids.add(key, EdgeGrid.from_tiles(part))
+
+    return EdgeGrid.from_tiles(tiles), grids
+
+
+def test_grid_set_raycast_matches_one_grid():
+    random = np.random.default_rng(seed)
+    tiles = make_tiles(random)
+    grid, grids = make_grids(tiles)
+    origins = random.uniform(-100, 1100, (500, 2))
+    angles = random.uniform(0, 2 * np.pi, 500)
+    directions = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+    distance, found = grid.raycast(origins, directions, 400)
+    set_distance, set_found = grids.raycast(origins, directions, 400)
+
+    assert np.array_equal(distance, set_distance)
+    assert (found >= 0).any()
+
+    for edge, set_edge in zip(found.tolist(), set_found.tolist()):
+        if edge >= 0:
+            tile, side = grid.get_edge(edge)
+            set_tile, set_side = grids.get_edge(set_edge)
+
+            assert tile is set_tile
+            assert side is set_side
+
+
+def test_grid_set_collide_matches_one_grid():
+    random = np.random.default_rng(seed)
+    grid, grids = make_grids(make_tiles(random))
+    results = []
+
+    for tested in (grid, grids):
+        random = np.random.default_rng(seed)
+        arrays = ParticleArrays(1000)
+        angle = random.uniform(0, 2 * np.pi, 1000)
+        arrays.spawn(random.uniform(0, 1000, 1000), random.uniform(0, 1000, 1000), np.cos(angle) * 300,
+                     np.sin(angle) * 300, 0, 1, 10)
+        old_x = arrays.x.copy()
+        old_y = arrays.y.copy()
+        arrays.x[:arrays.count] += arrays.vel_x[:arrays.count] / 30
+        arrays.y[:arrays.count] += arrays.vel_y[:arrays.count] / 30
+
+        tested.collide(arrays, old_x, old_y)
+        results.append((arrays.x[:arrays.count].copy(), arrays.y[:arrays.count].copy()))
+
+    assert np.allclose(results[0][0], results[1][0])
+    assert np.allclose(results[0][1], results[1][1])
+
+
+def test_fast_move_hits_a_wall_in_a_cell_it_passes_through():
+    """a move across five cells hits a thin wall in the middle one, though neither end is in its cell"""
+    walls = [(0, -500, 0, 500), (-400, 1000, 400, 1000)]
+    grid = EdgeGrid(walls, [None] * 2, [0, 1], cell_size=64)
+    old_x = np.array([-150.0, 150.0, -150.0])
+    old_y = np.array([10.0, 10.0, 300.0])
+    x = np.array([150.0, -150.0, -150.0])
+    y = np.array([40.0, 10.0, 600.0])
+
+    time, normal_x, normal_y = grid.first_hits(old_x, old_y, x, y)
+
+    assert np.allclose(time[:2], 0.5)
+    assert np.allclose(normal_x[:2], (-1, 1)) and np.allclose(normal_y[:2], 0)
+    assert time[2] == np.inf
+
+
+def test_fast_particles_dont_tunnel():
+    """particles moving 5 cells a tick into a thin wall all bounce off it"""
+    grid = EdgeGrid([(0, -500, 0, 500)], [None], [0], cell_size=64)
+    arrays = ParticleArrays(100)
+    arrays.spawn(np.full(100, -160.0), np.linspace(-400, 400, 100), np.full(100, 320 * 60.0), np.zeros(100), 0, 1, 10)
+    old_x = arrays.x[:100].copy()
+    old_y = arrays.y[:100].copy()
+    arrays.step(1 / 60, 1)
+
+    grid.collide(arrays, old_x, old_y)
+
+    assert (arrays.x[:100] < 0).all()
+    assert (arrays.vel_x[:100] < 0).all()
+
+
+def raycast_tiles(grid, random):
+    """(distance, hit tile, hit side) of random rays through the area of make_tiles and around it"""
+    origins = random.uniform(-300, 1300, (500, 2))
+    angles = random.uniform(0, 2 * np.pi, 500)
+    distance, found = grid.raycast(origins, np.stack((np.cos(angles), np.sin(angles)), axis=1), 600)
+
+    return distance, [grid.get_edge(edge) if edge >= 0 else None for edge in found.tolist()]
+
+
+def test_added_tiles_match_a_rebuilt_grid():
+    """tiles added one at a time (inside the grid, outside it on every side, to crowded cells) are found like in a
+    grid built from all of them"""
+    random = np.random.default_rng(seed)
+    tiles = make_tiles(random, area=600)
+    added = make_tiles(random, count=60, area=1200)
+    added += [Tile((-200.0, 300.0), 10, 1, 1), Tile((300.0, -250.0), 20, 1, 2)]
+    added += [Tile((100.0, 100.0), rot, 1, 3) for rot in range(0, 90, 7)]
+
+    grid = EdgeGrid.from_tiles(tiles)
+
+    for tile in added:
+        grid.add_tiles([tile])
+
+    rebuilt = EdgeGrid.from_tiles(tiles + added)
+    distance, hits = raycast_tiles(grid, np.random.default_rng(seed))
+    rebuilt_distance, rebuilt_hits = raycast_tiles(rebuilt, np.random.default_rng(seed))
+
+    assert np.array_equal(distance, rebuilt_distance)
+    assert [hit and (id(hit[0]), id(hit[1])) for hit in hits] == \
+           [hit and (id(hit[0]), id(hit[1])) for hit in rebuilt_hits]
+    assert grid.get_bounds()[0] < 0 and grid.get_bounds()[2] > 1100
+
+
+def test_tiles_can_be_added_to_a_grid_of_cached_cells():
+    random = np.random.default_rng(seed)
+    tiles = make_tiles(random)
+    origin_x, origin_y, columns, rows, cells = EdgeGrid.from_tiles(tiles).get_cells()
+    cells.flags.writeable = False
+    grid = EdgeGrid.from_tiles(tiles, cells=(origin_x, origin_y, columns, rows, cells))
+    tile = Tile((1200.0, 1200.0), 0, 1, 1)
+
+    grid.add_tiles([tile])
+    distance, found = grid.raycast([(1100.0, 1200.0)], [(1.0, 0.0)], 200)
+
+    assert grid.get_edge(found[0])[0] is tile
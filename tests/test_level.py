@@ -0,0 +1,95 @@
+import gc
+import numpy as np
+import pyglet as pgl
+import pytest
+from game import level_format
+from game.headless import make_level
+from game.tile import Tile
+
+
+@pytest.fixture
+def level(tmp_path, monkeypatch):
+    """level not using the level cache, loading from and saving to an empty levels directory in tmp_path"""
+    level = make_level()
+    level.use_cache = False
+    # the game version is read from the repository root before leaving it
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "levels").mkdir()
+
+    return level
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_load_error_isnt_hidden_by_closing_the_file(level, tmp_path, stream):
+    """a bad record in a mapped version 2 file raises its own error"""
+    tiles = np.zeros(1, dtype=level_format.tile_dtype)
+    emitters = np.zeros(0, dtype=level_format.emitter_dtype)
+    (tmp_path / "levels" / "bad.dat").write_bytes(level_format.encode_v2(level_format.LevelHeader(2, 0, 0, 20), tiles,
+                                                                          emitters))
+
+    with pytest.raises(ValueError, match="Tile shape 0 does not exist"):
+        level.load("bad", stream)
+
+
+@pytest.mark.parametrize("cancel", [False, True])
+def test_no_garbage_collection_while_loading_async(level, tmp_path, cancel):
+    """garbage collection is off while an async load runs and back on once it finished or was cancelled"""
+    tiles = np.zeros(50, dtype=level_format.tile_dtype)
+    tiles["x"] = np.arange(50) * 50
+    tiles["shape"] = 1
+    emitters = np.zeros(0, dtype=level_format.emitter_dtype)
+    (tmp_path / "levels" / "async.dat").write_bytes(level_format.encode_v2(level_format.LevelHeader(2, 0, 0, 20), tiles,
+                                                                            emitters))
+    loader = level.load_async("async")
+
+    assert not gc.isenabled()
+
+    if cancel:
+        loader.cancel()
+
+    while level.is_loading():
+        pgl.clock.tick()
+
+    assert gc.isenabled()
+    assert len(level.get_data()["tiles"]) == (0 if cancel else 50)
+
+
+def test_async_load_error_while_creating_ends_the_load(level, tmp_path, monkeypatch):
+    """an object that can't be created cancels the load, turning garbage collection back on"""
+    tiles = np.zeros(5, dtype=level_format.tile_dtype)
+    tiles["shape"] = 1
+    emitters = np.zeros(0, dtype=level_format.emitter_dtype)
+    (tmp_path / "levels" / "async.dat").write_bytes(level_format.encode_v2(level_format.LevelHeader(2, 0, 0, 20), tiles,
+                                                                            emitters))
+
+    def create_element(record, baked = None):
+        raise FileNotFoundError("No image!")
+
+    monkeypatch.setattr(level, "create_element", create_element)
+    level.load_async("async")
+
+    with pytest.raises(FileNotFoundError, match="No image"):
+        while level.is_loading():
+            pgl.clock.tick()
+
+    assert gc.isenabled()
+    assert not level.is_loading()
+    pgl.clock.tick()
+
+
+def test_tile_added_to_a_streamed_level_collides(level, tmp_path):
+    """a tile added while streaming (e.g. in the editor) is raycast against, without being part of a chunk"""
+    tiles = np.zeros(4, dtype=level_format.tile_dtype)
+    tiles["x"] = [0, 600, 1200, 1800]
+    tiles["shape"] = 1
+    emitters = np.zeros(0, dtype=level_format.emitter_dtype)
+    (tmp_path / "levels" / "stream.dat").write_bytes(level_format.encode_v2(level_format.LevelHeader(2, 0, 300, 20),
+                                                                             tiles, emitters))
+    level.load("stream", stream=True)
+    tile = Tile((300.0, 300.0), 0, 1, 1)
+
+    level.add_tile(tile)
+    hit = level.raycast((200, 300), (1, 0), 500)
+
+    assert hit is not None and hit[0] is tile
+    assert level.raycast((0, 100), (0, -1), 100) is not None
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from game import level_cache, level_format
+from game.headless import make_level
+
+
+@pytest.fixture
+def level(tmp_path):
+    """level loading from an empty levels directory and caching in an empty cache directory, both in tmp_path"""
+    level = make_level()
+    level.directory = str(tmp_path / "levels")
+    level.get_cache().directory = str(tmp_path / "cache")
+    (tmp_path / "levels").mkdir()
+
+    tiles = np.zeros(30, dtype=level_format.tile_dtype)
+    tiles["x"] = np.arange(30) * 50
+    tiles["shape"] = 1
+    emitters = np.zeros(0, dtype=level_format.emitter_dtype)
+    (tmp_path / "levels" / "cached.dat").write_bytes(level_format.encode_v2(level_format.LevelHeader(2, 0, 100, 20),
+                                                                             tiles, emitters))
+
+    return level
+
+
+# ways an entry gets damaged, GRID is the last section
+damages = {"header": lambda data: data[:10],
+           "section table": lambda data: data[:level_cache.header_format.size + level_cache.grid_format.size + 7],
+           "sections": lambda data: data[:-100],
+           "grid cells": lambda data: data[:-64] + np.full(8, 10 ** 6, dtype="<i8").tobytes()}
+
+
+@pytest.mark.parametrize("damage", sorted(damages))
+def test_damaged_entry_is_a_miss(level, tmp_path, damage):
+    """a truncated or corrupted entry is deleted and the level is decoded from its file (and cached again)"""
+    level.load("cached")
+    tiles = len(level.get_data()["tiles"])
+    level.unload()
+
+    entry, = (tmp_path / "cache").iterdir()
+    entry.write_bytes(damages[damage](entry.read_bytes()))
+
+    level.load("cached")
+
+    assert len(level.get_data()["tiles"]) == tiles
+    assert level.get_cache().misses == 2
+    assert level_cache.decode(entry.read_bytes()).arrays[b"TILE"].size == tiles
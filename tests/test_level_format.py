@@ -0,0 +1,36 @@
+from game import level_format
+
+
+def version_1(*objects):
+    """version 1 level file bytes, start (10, 20), gravity 20"""
+    return bytes([1, 0, 10, 0, 20, 20]) + b"".join(objects)
+
+
+def test_emitter_parameters_are_scaled():
+    """parameters stored multiplied by 10 (x 0.1 in level_format.txt) are divided back, others are kept as stored"""
+    emitter = bytes([2, 1, 0, 0, 50,
+                     6, 1, 5,      # vel 260 -> 26
+                     2, 0, 40,     # max particles 40
+                     12, 0, 15,    # lifetime 15 -> 1.5
+                     15, 9,        # drag 9 -> 0.9
+                     0])
+    record, = level_format.iter_records(version_1(emitter))
+
+    assert (record.x, record.y) == (255, 50)
+    assert record.params == {"vel": 26, "max_particles": 40, "lifetime": 1.5, "drag": 0.9}
+    assert isinstance(record.params["max_particles"], int)
+
+
+def test_upgrade_keeps_scaled_parameters():
+    emitter = bytes([2, 0, 10, 0, 10, 7, 0, 25, 13, 0, 5, 0])
+    _, arrays = level_format.read_v2(level_format.upgrade(version_1(emitter)))
+
+    assert arrays[b"EMIT"]["vel_rand"].tolist() == [2.5]
+    assert arrays[b"EMIT"]["lifetime_rand"].tolist() == [0.5]
+
+
+def test_v2_start_position_is_signed():
+    header = level_format.LevelHeader(2, -100, 70000, 20)
+    data = level_format.encode_v2(header, level_format.tiles_to_array([]), level_format.emitters_to_array([]))
+
+    assert level_format.read_v2(data)[0] == header
@@ -0,0 +1,39 @@
+import numpy as np
+from game.particle_worker import ParticleWorker, Snapshot, render_fields
+
+
+class TickingRender:
+    """render buffers that run ticks the first time they are read from, like a worker finishing ticks mid copy"""
+    def __init__(self, render, ticks):
+        self._render = render
+        self._ticks = ticks
+
+    def __getitem__(self, key):
+        if self._ticks is not None:
+            ticks, self._ticks = self._ticks, None
+            ticks()
+
+        return self._render[key]
+
+
+def spawn(worker, slot, count):
+    worker.submit(slot, 1 / 60, 0.99, (0.0, 0.0, np.full(count, 10.0), np.full(count, 5.0), 0.0, 4.0, 10.0))
+    worker.flush()
+
+
+def test_read_while_two_ticks_finish_gives_one_tick():
+    worker = ParticleWorker("sync")
+    slot, snapshot = worker.attach(20)
+    spawn(worker, slot, 3)
+    snapshot._render = TickingRender(snapshot._render, lambda: (spawn(worker, slot, 2), spawn(worker, slot, 4)))
+
+    snapshot.read()
+    # read after the ticks, nothing running
+    expected = Snapshot(snapshot._render._render, snapshot._header, 20).read()
+
+    assert snapshot.count == expected.count == 9
+
+    for name in render_fields:
+        assert np.array_equal(getattr(snapshot, name)[:9], getattr(expected, name)[:9])
+
+    worker.close()
@@ -0,0 +1,77 @@
+from pyglet.window import key
+from game import render
+from game.grid import SpatialHash
+from game.player import Player
+from game.tile import Tile
+from game.timestep import base_rate
+
+dt = 1 / 60
+gravity = 20
+# a row of tiles with tops at y = 120, the player resting on it
+floor_top = 120
+
+
+def make_player():
+    spatial_hash = SpatialHash()
+
+    for x in range(0, 800, 40):
+        spatial_hash.add(Tile((float(x), 100.0), 0, 1, 1).hitbox)
+
+    player = Player((300, floor_top + 15.01), batch=render.NullBatch())
+    player.set_broadphase(spatial_hash)
+
+    return player, spatial_hash
+
+
+def hold(player, keys, seconds):
+    for name in (key.W, key.A, key.S, key.D):
+        player.key_handler[name] = name in keys
+
+    for _ in range(int(seconds / dt)):
+        player.accelerate(0, -gravity * dt * base_rate)
+        player.update(dt)
+
+
+def overlapping(player, spatial_hash):
+    sides = player.hitbox.checkbox_sides
+    rects = spatial_hash.query(sides["min_x"], sides["min_y"], sides["max_x"], sides["max_y"])
+
+    return [rect for rect in rects if player.hitbox.separation(rect) is not None]
+
+
+def test_rotating_on_the_floor_doesnt_sink():
+    player, spatial_hash = make_player()
+    hold(player, {key.D}, 1)
+
+    assert player.hitbox.checkbox_sides["min_y"] >= floor_top
+    assert not overlapping(player, spatial_hash)
+
+
+def test_player_can_leave_the_floor_after_rotating():
+    player, spatial_hash = make_player()
+    hold(player, {key.D}, 1)
+    x, y = player.x, player.y
+    hold(player, {key.W}, 0.5)
+
+    assert abs(player.x - x) + abs(player.y - y) > 50
+    assert not overlapping(player, spatial_hash)
+
+
+def test_sliding_is_the_same_at_any_tick_rate():
+    """friction slows a slide as much per second at 30, 60 and 120 updates per second"""
+    results = []
+
+    for rate in (30, 60, 120):
+        player, _ = make_player()
+        player.vel_x = 400
+        x = player.x
+
+        for _ in range(rate):
+            player.accelerate(0, -gravity / rate * base_rate)
+            player.update(1 / rate)
+
+        results.append((player.x - x, player.vel_x))
+
+    for distance, vel_x in results:
+        assert abs(distance - results[1][0]) < 0.02 * results[1][0]
+        assert abs(vel_x - results[1][1]) < 0.02 * results[1][1]
@@ -0,0 +1,176 @@
+import tracemalloc
+import numpy as np
+import pytest
+from game import rect as rect_module, tile
+from game.rect import Rect
+from game.tile import Tile
+
+seed = 0
+player_points = [[-5, -15], [-5, 15], [5, 15], [5, -15]]
+
+
+def reference_contact(rect, other):
+    """side of other hit by rect, testing every pair of sides with Line.contacts like Rect.contacts always did"""
+    for other_side in other.get_sides():
+        for side in rect.get_sides():
+            if side.contacts(other_side):
+                return other_side
+
+    return None
+
+
+def random_layout(random, count = 6, area = 100):
+    """a player rect at a random pose among count tiles of every shape, randomly placed and rotated"""
+    tiles = [Tile((float(x), float(y)), int(rot), 1, int(shape)) for x, y, rot, shape in
+             zip(random.uniform(0, area, count), random.uniform(0, area, count), random.integers(0, 360, count),
+                 random.choice(sorted(tile.shapes), count))]
+    rect = Rect((0, 0), player_points)
+    rect.update(float(random.uniform(0, area)), float(random.uniform(0, area)), float(random.uniform(0, 360)))
+
+    return rect, tiles
+
+
+@pytest.mark.parametrize("layout", range(300))
+def test_contacts_many_matches_line_contacts(layout):
+    random = np.random.default_rng((seed, layout))
+    rect, tiles = random_layout(random)
+    hitboxes = [tile.hitbox for tile in tiles]
+
+    expected = [(other, reference_contact(rect, other)) for other in hitboxes]
+    expected = [(other, side) for other, side in expected if side is not None]
+    result = rect.contacts_many(hitboxes)
+
+    assert [(id(other), id(side)) for other, side in result] == [(id(other), id(side)) for other, side in expected]
+
+    for other in hitboxes:
+        assert rect.contacts(other) is reference_contact(rect, other)
+
+
+def test_layouts_touch_every_shape():
+    """the random layouts above really test contacts against every tile shape"""
+    touched = set()
+
+    for layout in range(300):
+        rect, tiles = random_layout(np.random.default_rng((seed, layout)))
+
+        for placed in tiles:
+            if reference_contact(rect, placed.hitbox) is not None:
+                touched.add(placed.shape)
+
+    assert touched == set(tile.shapes)
+
+
+@pytest.mark.parametrize("shape", sorted(tile.shapes))
+def test_contacts_many_moving_rects(shape):
+    """moving rects of each tile shape's polygon against the player rect"""
+    random = np.random.default_rng((seed, shape))
+    rect = Rect((0, 0), player_points)
+
+    for _ in range(200):
+        others = [Rect((0, 0), tile.get_shape(shape).polygon) for _ in range(3)]
+
+        for other in others:
+            other.update(*random.uniform((0, 0, 0), (60, 60, 360)).tolist())
+
+        rect.update(*random.uniform((0, 0, 0), (60, 60, 360)).tolist())
+        expected = [(other, reference_contact(rect, other)) for other in others]
+        expected = [(other, side) for other, side in expected if side is not None]
+
+        assert [(id(other), id(side)) for other, side in rect.contacts_many(others)] == \
+               [(id(other), id(side)) for other, side in expected]
+
+
+def test_update_and_contacts_dont_allocate():
+    """once warmed up, moving a rect and testing it for contacts allocates nothing in rect.py, not even for a moment"""
+    rect = Rect((0, 0), player_points)
+    other = Tile((120.0, 120.0), 0, 1, 1).hitbox
+    poses = np.random.default_rng(seed).uniform((100, 100, 0), (140, 140, 360), (256, 3)).tolist()
+
+    def run():
+        for x, y, rot in poses:
+            rect.update(x, y, rot)
+            rect.contacts(other)
+
+    run()
+    rect_file = [tracemalloc.Filter(True, rect_module.__file__)]
+    tracemalloc.start()
+
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(rect_file)
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        run()
+        peak = tracemalloc.get_traced_memory()[1] - start
+        after = tracemalloc.take_snapshot().filter_traces(rect_file)
+    finally:
+        tracemalloc.stop()
+
+    assert sum(stat.size_diff for stat in after.compare_to(before, "filename")) == 0
+    assert peak < 1024
+
+
+def test_bake_many_matches_moving_rect():
+    """tiles baked all at once are placed like a Rect of their shape moved to the same pose"""
+    random = np.random.default_rng(seed)
+    shapes = random.choice(sorted(tile.shapes), 50).tolist()
+    poses = random.uniform((-500, -500, 0), (500, 500, 360), (50, 3)).tolist()
+    hitboxes = tile.bake_many(shapes, [x for x, _, _ in poses], [y for _, y, _ in poses], [rot for _, _, rot in poses])
+
+    for shape, (x, y, rot), baked in zip(shapes, poses, hitboxes):
+        rect = Rect((0, 0), tile.get_shape(shape).polygon)
+        rect.update(x, y, rot)
+
+        assert np.allclose(baked.corners, rect._corners)
+        assert np.allclose(baked.side_starts, rect._side_starts)
+        assert np.allclose(baked.normals, rect._normals)
+        assert np.allclose(baked.aabb, [rect.checkbox_sides[name] for name in ("min_x", "min_y", "max_x", "max_y")])
+
+
+@pytest.mark.parametrize("shape", sorted(tile.shapes))
+def test_normals_point_outward(shape):
+    """just outside the middle of each side along its normal is outside the shape, whichever way it is wound"""
+    rect = Tile((0.0, 0.0), 0, 1, shape).hitbox
+    corners = rect._flat_corners
+
+    for (start_x, start_y), (end_x, end_y), (normal_x, normal_y) in zip(rect._side_starts.tolist(),
+                                                                       rect._corners.tolist(), rect.get_normals().tolist()):
+        middle_x = (start_x + end_x) / 2
+        middle_y = (start_y + end_y) / 2
+
+        assert not Rect.__inside__(middle_x + normal_x * 0.5, middle_y + normal_y * 0.5, corners)
+        assert Rect.__inside__(middle_x - normal_x * 0.5, middle_y - normal_y * 0.5, corners)
+
+
+def test_sweep_ignores_sides_being_left():
+    """a rect overlapping a tile can move out of it, but not further in"""
+    floor = Tile((0.0, 0.0), 0, 1, 1).hitbox
+    rect = Rect((0, 0), player_points)
+    rect.update(0, 30, 0)
+
+    assert rect.sweep(0, 10, [floor]) is None
+    assert rect.sweep(5, 0, [floor]) is None
+
+    rect.update(0, 40, 0)
+    time, normal_x, normal_y, hit = rect.sweep(0, -10, [floor])
+
+    assert hit is floor
+    assert time == 0.5
+    assert (normal_x, normal_y) == (0, 1)
+
+
+@pytest.mark.parametrize("layout", range(100))
+def test_separation_moves_out(layout):
+    """moving a rect by its separation from a tile it overlaps leaves them apart"""
+    random = np.random.default_rng((seed, layout))
+    rect, tiles = random_layout(random, count = 1, area = 30)
+    other = tiles[0].hitbox
+    separation = rect.separation(other)
+
+    if separation is None:
+        assert reference_contact(rect, other) is None
+        return
+
+    depth, normal_x, normal_y = separation
+    rect.update(rect.x + normal_x * (depth + 0.01), rect.y + normal_y * (depth + 0.01), rect.rot)
+
+    assert rect.separation(other) is None
@@ -0,0 +1,29 @@
+import pytest
+from benchmarks import replay as workload
+from game import replay
+from game.headless import make_level
+
+
+def test_recorded_replay_ends_where_it_was_recorded():
+    """the course replay in tests/replays plays back to the recorded final player state. if a change to how the
+    player moves is meant to alter it, record it again with python -m benchmarks.replay"""
+    recording = replay.Recording.load(workload.recording_file)
+
+    assert len(recording) == 600
+    assert replay.check(recording, workload.make_replay_level()) == []
+
+
+def test_recording_round_trips():
+    recording = replay.Recording.load(workload.recording_file)
+    copy = replay.Recording.from_bytes(recording.to_bytes())
+
+    assert (copy.level_name, copy.start_state, copy.end_state, list(copy)) == \
+           (recording.level_name, recording.start_state, recording.end_state, list(recording))
+
+
+def test_recorder_needs_a_player():
+    level = make_level()
+    level.load_empty()
+
+    with pytest.raises(ValueError, match="has no player"):
+        replay.InputRecorder(level)